@@ -0,0 +1,38 @@
+"""Extraction job queue
+
+Revision ID: 20261018_0002
+Revises: 20260204_0001
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_0002"
+down_revision = "20260204_0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE extraction_status ADD VALUE IF NOT EXISTS 'processing' AFTER 'pending'")
+
+    op.add_column("receipt_extractions", sa.Column("currency", sa.String(length=3), nullable=True))
+    op.add_column("receipt_extractions", sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("receipt_extractions", sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        "ix_receipt_extractions_status_created_at",
+        "receipt_extractions",
+        ["status", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    # Postgres cannot drop a value from an enum type; park in-flight jobs back
+    # in the queue and leave the unused 'processing' label in place.
+    op.execute("UPDATE receipt_extractions SET status = 'pending' WHERE status = 'processing'")
+    op.drop_index("ix_receipt_extractions_status_created_at", table_name="receipt_extractions")
+    op.drop_column("receipt_extractions", "completed_at")
+    op.drop_column("receipt_extractions", "claimed_at")
+    op.drop_column("receipt_extractions", "currency")
@@ -0,0 +1,22 @@
+"""Record the OCR tier on extractions
+
+Revision ID: 20261018_0004
+Revises: 20261018_0003
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_0004"
+down_revision = "20261018_0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("receipt_extractions", sa.Column("ocr_tier", sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("receipt_extractions", "ocr_tier")
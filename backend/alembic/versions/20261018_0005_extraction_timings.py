@@ -0,0 +1,27 @@
+"""Per-stage timings and LLM token counts on extractions
+
+Revision ID: 20261018_0005
+Revises: 20261018_0004
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261018_0005"
+down_revision = "20261018_0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("receipt_extractions", sa.Column("timings", postgresql.JSONB(), nullable=True))
+    op.add_column("receipt_extractions", sa.Column("prompt_tokens", sa.Integer(), nullable=True))
+    op.add_column("receipt_extractions", sa.Column("completion_tokens", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("receipt_extractions", "completion_tokens")
+    op.drop_column("receipt_extractions", "prompt_tokens")
+    op.drop_column("receipt_extractions", "timings")
@@ -0,0 +1,23 @@
+"""Extraction progress for the events stream
+
+Revision ID: 20261018_0006
+Revises: 20261018_0005
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261018_0006"
+down_revision = "20261018_0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("receipt_extractions", sa.Column("progress", postgresql.JSONB(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("receipt_extractions", "progress")
@@ -0,0 +1,26 @@
+"""Extraction attempts and last error for crash recovery
+
+Revision ID: 20261018_0007
+Revises: 20261018_0006
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_0007"
+down_revision = "20261018_0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "receipt_extractions", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0")
+    )
+    op.add_column("receipt_extractions", sa.Column("last_error", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("receipt_extractions", "last_error")
+    op.drop_column("receipt_extractions", "attempts")
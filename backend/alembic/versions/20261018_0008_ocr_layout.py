@@ -0,0 +1,23 @@
+"""OCR line layout on extractions
+
+Revision ID: 20261018_0008
+Revises: 20261018_0007
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261018_0008"
+down_revision = "20261018_0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("receipt_extractions", sa.Column("ocr_layout", postgresql.JSONB(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("receipt_extractions", "ocr_layout")
@@ -0,0 +1,73 @@
+"""Per-user vendor profiles
+
+Revision ID: 20261018_0009
+Revises: 20261018_0008
+Create Date: 2026-10-18 00:00:00.000000
+"""
+import re
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261018_0009"
+down_revision = "20261018_0008"
+branch_labels = None
+depends_on = None
+
+# Frozen copy of app/services/vendor_profiles.py at this revision, so the
+# backfill does not change when the app code does.
+PROFILE_FIELDS = ("category", "location", "currency", "payment_type", "card_type", "card_last4")
+_STORE_NUMBER_RE = re.compile(r"(?:#|\bno\.?|\bstore)\s*\d+|\b\d+\b", re.IGNORECASE)
+_SUFFIX_RE = re.compile(r"\b(?:inc|ltd|llc|corp|co|limited)\b")
+_PUNCTUATION_RE = re.compile(r"[^\w&]+")
+
+
+def _vendor_key(name: str) -> str:
+    text = _STORE_NUMBER_RE.sub(" ", name.lower())
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return " ".join(_SUFFIX_RE.sub(" ", text).split())
+
+
+def upgrade() -> None:
+    vendor_profiles = op.create_table(
+        "vendor_profiles",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True, nullable=False),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("vendor_key", sa.Text(), nullable=False),
+        sa.Column("vendor_name", sa.Text(), nullable=False),
+        sa.Column("receipt_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("stats", postgresql.JSONB(), server_default="{}", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.UniqueConstraint("user_id", "vendor_key", name="uq_vendor_profiles_user_vendor_key"),
+    )
+
+    # Build profiles from the receipts users have already confirmed.
+    columns = ", ".join(("user_id", "vendor_name", *PROFILE_FIELDS))
+    receipts = op.get_bind().execute(
+        sa.text(f"SELECT {columns} FROM receipts WHERE status = 'confirmed' ORDER BY created_at")
+    )
+    profiles: dict[tuple, dict] = {}
+    for receipt in receipts:
+        key = _vendor_key(receipt.vendor_name) if receipt.vendor_name else ""
+        if not key:
+            continue
+        profile = profiles.setdefault(
+            (receipt.user_id, key),
+            {"id": uuid.uuid4(), "user_id": receipt.user_id, "vendor_key": key, "receipt_count": 0, "stats": {}},
+        )
+        profile["vendor_name"] = receipt.vendor_name
+        profile["receipt_count"] += 1
+        for name in PROFILE_FIELDS:
+            value = getattr(receipt, name)
+            if value is not None and value != "":
+                counts = profile["stats"].setdefault(name, {})
+                counts[str(value)] = counts.get(str(value), 0) + 1
+    if profiles:
+        op.bulk_insert(vendor_profiles, list(profiles.values()))
+
+
+def downgrade() -> None:
+    op.drop_table("vendor_profiles")
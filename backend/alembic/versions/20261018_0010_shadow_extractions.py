@@ -0,0 +1,49 @@
+"""Shadow extractions for evaluating a candidate model or OCR tier
+
+Revision ID: 20261018_0010
+Revises: 20261018_0009
+Create Date: 2026-10-18 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261018_0010"
+down_revision = "20261018_0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "shadow_extractions",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True, nullable=False),
+        sa.Column(
+            "extraction_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("receipt_extractions.id"), nullable=False
+        ),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("candidate_model", sa.Text(), nullable=True),
+        sa.Column("candidate_ocr_tier_mode", sa.String(length=16), nullable=True),
+        sa.Column(
+            "status",
+            postgresql.ENUM(name="extraction_status", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("model_name", sa.Text(), nullable=True),
+        sa.Column("extracted_json", postgresql.JSONB(), nullable=True),
+        sa.Column("agreement", postgresql.JSONB(), nullable=True),
+        sa.Column("timings", postgresql.JSONB(), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=True),
+        sa.Column("completion_tokens", sa.Integer(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.create_index("ix_shadow_extractions_extraction_id", "shadow_extractions", ["extraction_id"])
+    op.create_index("ix_shadow_extractions_created_at", "shadow_extractions", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_shadow_extractions_created_at", table_name="shadow_extractions")
+    op.drop_index("ix_shadow_extractions_extraction_id", table_name="shadow_extractions")
+    op.drop_table("shadow_extractions")
@@ -1,12 +1,16 @@
+from typing import Iterator
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.security import decode_token, is_access_token
 from app.crud.user import get_user_by_id
 from app.db.session import get_db
 from app.models.user import User
+from app.services.admission import AdmissionRejected, get_admission_controller
 
 
 bearer_scheme = HTTPBearer()
@@ -34,3 +38,29 @@ def get_current_user(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
     return user
+
+
+def extraction_slot(
+    _current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Iterator[None]:
+    """Hold an admission slot while a synchronous extraction runs; 429 when none is free.
+
+    Only authenticated requests compete for slots, so anonymous traffic gets
+    401 rather than filling the queue.
+    """
+    if settings.extraction_async:
+        # The request only stores the upload; workers do the heavy lifting.
+        yield
+        return
+    # Hand the connection used for authentication back while waiting for a slot.
+    db.commit()
+    try:
+        with get_admission_controller().admit():
+            yield
+    except AdmissionRejected as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many extractions in progress",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
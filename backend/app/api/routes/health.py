@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.warmup import api_warmup_enabled, get_warmup
 
 
 router = APIRouter()
@@ -7,3 +10,14 @@ router = APIRouter()
 @router.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@router.get("/health/ready")
+def readiness_check():
+    if not api_warmup_enabled():
+        return {"status": "ready", "components": {}}
+    warmup = get_warmup()
+    components = warmup.status()
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "components": components})
+    return {"status": "ready", "components": components}
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy.orm import Session
+
+from app.crud.receipt_extraction import count_extractions_by_status
+from app.db.session import get_db
+from app.models.enums import ExtractionStatus
+from app.services import metrics
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics(db: Session = Depends(get_db)):
+    metrics.set_queue_depth(
+        count_extractions_by_status(db, [ExtractionStatus.pending, ExtractionStatus.processing])
+    )
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -1,124 +1,381 @@
+import asyncio
 import hashlib
 import io
+import json
+import os
+import time
 import uuid
 from datetime import datetime
 from pathlib import Path
+from typing import Any, AsyncIterator
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import extraction_slot, get_current_user
 from app.core.config import settings
 from app.crud.receipt import attach_file_to_receipt, create_receipt, get_receipt_by_id, update_receipt
-from app.crud.receipt_file import get_receipt_file_for_receipt
+from app.crud.receipt_extraction import (
+    copy_extraction_result,
+    find_completed_extraction_by_sha256,
+    get_extraction_for_user,
+    mark_extraction_processing,
+)
+from app.crud.receipt_file import find_receipt_file_by_sha256, get_receipt_file_for_receipt, get_receipt_file_for_user
 from app.crud.receipt_query import query_receipts
 from app.models.enums import ExtractionStatus
 from app.models.receipt_extraction import ReceiptExtraction
 from app.models.receipt_file import ReceiptFile
 from app.models.user import User
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 from app.schemas.receipt import (
     ReceiptCreate,
+    ReceiptExtractionBatchResponse,
     ReceiptExtractionResponse,
     ReceiptFields,
+    ReceiptFileResponse,
     ReceiptListResponse,
     ReceiptRead,
     ReceiptUpdate,
 )
-from app.services.extraction import extract_receipt
+from app.services import metrics
+from app.services.extraction_jobs import run_extraction, run_extractions_batch
+from app.services.ocr_prefetch import prefetch_ocr
 
 
 router = APIRouter(prefix="/receipts")
 
+# ISO 4217 code, as stored in the String(3) currency columns.
+CURRENCY_PATTERN = r"^[A-Z]{3}$"
+
+
+def _hardlink_duplicate(existing_path: Path, file_path: Path) -> None:
+    # Replace the freshly written copy with a hardlink to the stored original.
+    # Falls back to keeping the copy when linking is impossible (original
+    # missing, different filesystem, ...).
+    link_path = file_path.with_name(f"{file_path.name}.link")
+    try:
+        os.link(existing_path, link_path)
+    except OSError:
+        return
+    os.replace(link_path, file_path)
 
-@router.post("/extractions", response_model=ReceiptExtractionResponse, status_code=status.HTTP_201_CREATED)
-def create_extraction(
-    file: UploadFile = File(...),
-    currency: str | None = Form(default=None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    if not file.filename:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File name missing")
 
+def _extraction_response(extraction: ReceiptExtraction) -> ReceiptExtractionResponse:
+    extracted = None
+    if extraction.extracted_json is not None:
+        extracted = ReceiptFields.model_validate(extraction.extracted_json)
+    return ReceiptExtractionResponse(
+        extraction_id=extraction.id,
+        receipt_file_id=extraction.receipt_file_id,
+        status=extraction.status.value,
+        extracted=extracted,
+        confidence=float(extraction.confidence) if extraction.confidence is not None else None,
+        model_name=extraction.model_name,
+        ocr_text=extraction.raw_ocr_text,
+        ocr_tier=extraction.ocr_tier,
+        timings=extraction.timings,
+        prompt_tokens=extraction.prompt_tokens,
+        completion_tokens=extraction.completion_tokens,
+    )
+
+
+def _store_file(db: Session, file: UploadFile, user: User) -> tuple[ReceiptFile, dict[str, float]]:
+    """Save an upload as a receipt file; returns it with the write and hash timings."""
     extension = Path(file.filename).suffix[:10]
     file_id = uuid.uuid4()
-    storage_root = Path(settings.storage_dir) / str(current_user.id)
+    storage_root = Path(settings.storage_dir) / str(user.id)
     storage_root.mkdir(parents=True, exist_ok=True)
     file_name = f"{file_id}{extension}"
     file_path = storage_root / file_name
 
     sha256 = hashlib.sha256()
     size_bytes = 0
+    write_seconds = hash_seconds = 0.0
     try:
         with file_path.open("wb") as handle:
             while True:
+                started = time.perf_counter()
                 chunk = file.file.read(1024 * 1024)
                 if not chunk:
                     break
                 handle.write(chunk)
+                hashed = time.perf_counter()
                 sha256.update(chunk)
+                write_seconds += hashed - started
+                hash_seconds += time.perf_counter() - hashed
                 size_bytes += len(chunk)
     finally:
         file.file.close()
+    timings = {"upload_write_ms": round(write_seconds * 1000, 2), "hash_ms": round(hash_seconds * 1000, 2)}
+    metrics.observe_timings(timings)
+
+    digest = sha256.hexdigest()
+    if settings.dedup_hardlink:
+        original = find_receipt_file_by_sha256(db, user.id, digest)
+        if original is not None:
+            _hardlink_duplicate(Path(original.file_path), file_path)
 
     receipt_file = ReceiptFile(
         id=file_id,
-        user_id=current_user.id,
+        user_id=user.id,
         receipt_id=None,
         file_path=str(file_path),
         file_name=file.filename,
         mime_type=file.content_type or "application/octet-stream",
         size_bytes=size_bytes,
-        sha256=sha256.hexdigest(),
+        sha256=digest,
     )
     db.add(receipt_file)
     db.commit()
     db.refresh(receipt_file)
+    return receipt_file, timings
+
+
+def _create_pending_extraction(
+    db: Session, receipt_file: ReceiptFile, user: User, currency: str | None, timings: dict[str, float]
+) -> tuple[ReceiptExtraction, bool]:
+    """Create a stored file's pending extraction.
+
+    Returns the extraction and whether it was filled from an earlier identical
+    extraction (in which case there is nothing left to run).
+    """
+    previous = None
+    if settings.extraction_dedup:
+        previous = find_completed_extraction_by_sha256(db, user.id, receipt_file.sha256, currency)
 
     extraction = ReceiptExtraction(
-        user_id=current_user.id,
+        user_id=user.id,
         receipt_file_id=receipt_file.id,
         status=ExtractionStatus.pending,
         raw_ocr_text=None,
         extracted_json=None,
         confidence=None,
         model_name=settings.ollama_model,
+        currency=currency,
+        timings=timings,
     )
+    if previous is not None:
+        # Same photo already extracted for this user (e.g. a client retry):
+        # hand back the earlier result instead of paying for OCR + LLM again.
+        copy_extraction_result(previous, extraction)
+        metrics.observe_outcome("reused")
     db.add(extraction)
     db.commit()
     db.refresh(extraction)
+    return extraction, previous is not None
+
+
+def _store_upload(
+    db: Session, file: UploadFile, user: User, currency: str | None
+) -> tuple[ReceiptExtraction, bool]:
+    receipt_file, timings = _store_file(db, file, user)
+    return _create_pending_extraction(db, receipt_file, user, currency, timings)
+
+
+@router.post("/files", response_model=ReceiptFileResponse, status_code=status.HTTP_201_CREATED)
+def upload_receipt_file(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Store a photo and start OCR on it; extract it later with `receipt_file_id`."""
+    if not file.filename:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File name missing")
+
+    receipt_file, _timings = _store_file(db, file, current_user)
+    ocr_started = prefetch_ocr(receipt_file.file_path, receipt_file.sha256)
+    return ReceiptFileResponse(
+        receipt_file_id=receipt_file.id,
+        file_name=receipt_file.file_name,
+        mime_type=receipt_file.mime_type,
+        size_bytes=receipt_file.size_bytes,
+        sha256=receipt_file.sha256,
+        ocr_started=ocr_started,
+    )
+
+
+@router.post(
+    "/extractions",
+    response_model=ReceiptExtractionResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"model": ReceiptExtractionResponse}},
+)
+def create_extraction(
+    file: UploadFile | None = File(default=None),
+    receipt_file_id: uuid.UUID | None = Form(default=None),
+    currency: str | None = Form(default=None, pattern=CURRENCY_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    _slot: None = Depends(extraction_slot),
+):
+    """Extract a new upload (`file`) or a stored one (`receipt_file_id`, e.g. from `POST /files`)."""
+    if (file is None) == (receipt_file_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Send either a file or a receipt_file_id"
+        )
+    if file is not None:
+        if not file.filename:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File name missing")
+        extraction, reused = _store_upload(db, file, current_user, currency)
+    else:
+        receipt_file = get_receipt_file_for_user(db, receipt_file_id, current_user.id)
+        if not receipt_file:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receipt file not found")
+        extraction, reused = _create_pending_extraction(db, receipt_file, current_user, currency, {})
+    if reused:
+        return _extraction_response(extraction)
+
+    if settings.extraction_async:
+        # Left pending for `python -m app.worker`; clients poll GET /extractions/{id}.
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(_extraction_response(extraction)),
+        )
 
+    mark_extraction_processing(db, extraction)
     try:
-        result = extract_receipt(str(file_path), currency)
+        run_extraction(db, extraction)
     except Exception:
-        extraction.status = ExtractionStatus.failed
-        db.add(extraction)
-        db.commit()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Extraction failed")
 
-    extracted_fields = ReceiptFields.model_validate(result.extracted)
-    if currency and not extracted_fields.currency:
-        extracted_fields.currency = currency
+    return _extraction_response(extraction)
 
-    extraction.status = ExtractionStatus.completed
-    extraction.raw_ocr_text = result.ocr_text
-    extraction.extracted_json = extracted_fields.model_dump()
-    extraction.confidence = result.confidence
-    extraction.model_name = result.model_name
-    db.add(extraction)
-    db.commit()
-    db.refresh(extraction)
 
-    return ReceiptExtractionResponse(
-        extraction_id=extraction.id,
-        receipt_file_id=receipt_file.id,
-        status=extraction.status.value,
-        extracted=extracted_fields,
-        confidence=float(extraction.confidence) if extraction.confidence is not None else None,
-        model_name=extraction.model_name,
-        ocr_text=extraction.raw_ocr_text,
+@router.post(
+    "/extractions/batch",
+    response_model=ReceiptExtractionBatchResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"model": ReceiptExtractionBatchResponse}},
+)
+def create_extraction_batch(
+    files: list[UploadFile] = File(...),
+    currency: str | None = Form(default=None, pattern=CURRENCY_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    _slot: None = Depends(extraction_slot),
+):
+    if len(files) > settings.extraction_batch_max_files:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.extraction_batch_max_files} files per batch",
+        )
+    if any(not file.filename for file in files):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File name missing")
+
+    stored = [_store_upload(db, file, current_user, currency) for file in files]
+    extractions = [extraction for extraction, _reused in stored]
+    pending = [extraction for extraction, reused in stored if not reused]
+
+    if settings.extraction_async and pending:
+        # Same contract as the single-file endpoint: poll each id.
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(
+                ReceiptExtractionBatchResponse(items=[_extraction_response(item) for item in extractions])
+            ),
+        )
+
+    for extraction in pending:
+        mark_extraction_processing(db, extraction)
+    # Per-file failures come back as status "failed" rather than failing the request.
+    run_extractions_batch(db, pending)
+
+    return ReceiptExtractionBatchResponse(items=[_extraction_response(item) for item in extractions])
+
+
+@router.get("/extractions/{extraction_id}", response_model=ReceiptExtractionResponse)
+def get_extraction(
+    extraction_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    extraction = get_extraction_for_user(db, extraction_id=extraction_id, user_id=current_user.id)
+    if not extraction:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Extraction not found")
+    return _extraction_response(extraction)
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def _new_events(extraction_id: uuid.UUID, user_id: uuid.UUID, sent: dict[str, Any]) -> tuple[list[str], bool]:
+    """Reload the extraction and return the events not sent yet, plus whether it has finished.
+
+    Each poll uses its own short-lived session: the request's session is
+    closed by the time the response body is streamed.
+    """
+    db = SessionLocal()
+    try:
+        extraction = get_extraction_for_user(db, extraction_id=extraction_id, user_id=user_id)
+        if extraction is None:
+            return [_sse("failed", {"extraction_id": extraction_id})], True
+        return _events_for(extraction, sent)
+    finally:
+        db.close()
+
+
+def _events_for(extraction: ReceiptExtraction, sent: dict[str, Any]) -> tuple[list[str], bool]:
+    progress = extraction.progress or {}
+    events = []
+    if "stored" not in sent:
+        events.append(_sse("stored", {"extraction_id": extraction.id, "status": extraction.status.value}))
+        sent["stored"] = True
+    if extraction.raw_ocr_text is not None and "ocr_done" not in sent:
+        events.append(_sse("ocr_done", {"ocr_text": extraction.raw_ocr_text, "ocr_tier": extraction.ocr_tier}))
+        sent["ocr_done"] = True
+    if "requested" in progress and "llm_started" not in sent:
+        events.append(_sse("llm_started", {"fields": progress["requested"]}))
+        sent["llm_started"] = True
+    finished = extraction.status in (ExtractionStatus.completed, ExtractionStatus.failed)
+    fields = progress.get("fields")
+    if fields and fields != sent.get("partial") and not finished:
+        events.append(_sse("partial", {"fields": fields}))
+        sent["partial"] = fields
+    if extraction.status == ExtractionStatus.completed:
+        response = _extraction_response(extraction)
+        events.append(_sse("fields_parsed", {"fields": response.extracted}))
+        events.append(_sse("completed", response))
+    elif extraction.status == ExtractionStatus.failed:
+        events.append(_sse("failed", {"extraction_id": extraction.id}))
+    return events, finished
+
+
+async def _extraction_events(extraction_id: uuid.UUID, user_id: uuid.UUID) -> AsyncIterator[str]:
+    deadline = time.monotonic() + settings.extraction_events_timeout_seconds
+    sent: dict[str, Any] = {}
+    while True:
+        # DB work stays off the event loop; the wait between polls holds no thread or connection.
+        events, finished = await run_in_threadpool(_new_events, extraction_id, user_id, sent)
+        for event in events:
+            yield event
+        if finished:
+            return
+        if time.monotonic() >= deadline:
+            yield _sse("timeout", {"extraction_id": extraction_id})
+            return
+        await asyncio.sleep(settings.extraction_events_poll_seconds)
+
+
+@router.get("/extractions/{extraction_id}/events")
+def stream_extraction_events(
+    extraction_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Server-Sent Events: stored, ocr_done, llm_started, partial (fields so far), fields_parsed, then completed or failed."""
+    extraction = get_extraction_for_user(db, extraction_id=extraction_id, user_id=current_user.id)
+    if not extraction:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Extraction not found")
+    # Only ids go to the stream: `db` is closed before the body is sent.
+    return StreamingResponse(
+        _extraction_events(extraction.id, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -128,11 +385,7 @@ def create_receipt_record(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    receipt_file = (
-        db.query(ReceiptFile)
-        .filter(ReceiptFile.id == payload.receipt_file_id, ReceiptFile.user_id == current_user.id)
-        .first()
-    )
+    receipt_file = get_receipt_file_for_user(db, payload.receipt_file_id, current_user.id)
     if not receipt_file:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receipt file not found")
 
@@ -0,0 +1,74 @@
+"""Maintenance commands: `python -m app.cli <command>`.
+
+- `reextract`: run every stored receipt file through OCR + LLM again, e.g.
+  after upgrading the model or PaddleOCR (see app/services/reextract.py).
+- `shadow-report`: compare shadow runs of a candidate model or OCR tier with
+  the live results (see app/services/shadow.py).
+"""
+import argparse
+import logging
+import signal
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from app.db.session import SessionLocal
+from app.services.reextract import reextract_files
+from app.services.shadow import format_report, shadow_report
+
+
+def _reextract(args: argparse.Namespace, stop_event: threading.Event) -> int:
+    stats = reextract_files(
+        Path(args.checkpoint),
+        parallelism=args.parallelism,
+        rate=args.rate,
+        batch_size=args.batch_size,
+        user_id=args.user_id,
+        limit=args.limit,
+        stop_event=stop_event,
+    )
+    return 1 if stats.failed else 0
+
+
+def _shadow_report(args: argparse.Namespace, _stop_event: threading.Event) -> int:
+    db = SessionLocal()
+    try:
+        print("\n".join(format_report(shadow_report(db, since=args.since))))
+    finally:
+        db.close()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Receipt Keeper maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reextract = commands.add_parser("reextract", help="Extract stored receipt files again with the current settings.")
+    reextract.add_argument(
+        "--checkpoint",
+        default="reextract-checkpoint.json",
+        help="Progress file; an interrupted run resumes from it. Delete it to start over.",
+    )
+    reextract.add_argument("--parallelism", type=int, default=None, help="Files extracted at once.")
+    reextract.add_argument("--rate", type=float, default=None, help="Files started per second (0: no limit).")
+    reextract.add_argument("--batch-size", type=int, default=100, help="Rows fetched from the database at a time.")
+    reextract.add_argument("--user-id", type=uuid.UUID, default=None, help="Only this user's files.")
+    reextract.add_argument("--limit", type=int, default=None, help="Stop after starting this many files.")
+    reextract.set_defaults(run=_reextract)
+    report = commands.add_parser("shadow-report", help="Compare shadow runs of the candidate with the live results.")
+    report.add_argument(
+        "--since", type=datetime.fromisoformat, default=None, help="Only runs from this date/time (ISO 8601) on."
+    )
+    report.set_defaults(run=_shadow_report)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    stop_event = threading.Event()
+    # Finish and checkpoint the files in hand on SIGTERM/SIGINT; the next run picks up from there.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stop_event.set())
+    return args.run(args, stop_event)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -11,9 +11,84 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     storage_dir: str = "storage"
     ollama_url: str = "http://ollama:11434"
+    ollama_urls: str = ""
+    ollama_unhealthy_after_failures: int = 3
+    ollama_unhealthy_seconds: float = 30.0
+    ollama_hedge_after_seconds: float = 0.0
     ollama_model: str = "llama3.1"
     ollama_timeout_seconds: int = 120
+    ollama_keep_alive: str = "30m"
+    ollama_num_ctx: int | None = None
+    ollama_num_predict: int | None = None
+    ollama_stream: bool = True
+    ollama_pool_size: int = 10
+    ollama_structured_output: bool = True
+    rules_enabled: bool = True
+    rules_min_confidence: float = 0.9
+    rules_required_fields: str = "purchased_at,total"
+    rules_skip_llm: bool = False
+    llm_repair_rounds: int = 1
+    llm_cache_backend: str = "memory"
+    llm_cache_max_entries: int = 1024
+    llm_cache_ttl_seconds: int = 7 * 24 * 3600
+    llm_cache_db_max_entries: int = 100000
+    llm_cache_db_evict_interval_seconds: int = 60
     ocr_lang: str = "en"
+    ocr_workers: int = 0
+    ocr_worker_threads: int = 1
+    ocr_pin_cpus: bool = False
+    ocr_angle_cls: bool = True
+    ocr_preprocess: bool = True
+    ocr_crop_receipt: bool = True
+    ocr_max_dimension: int = 1600
+    ocr_rec_batch_num: int = 6
+    ocr_tier_mode: str = "fast"
+    ocr_tier_min_score: float = 0.85
+    ocr_tier_max_low_fraction: float = 0.3
+    ocr_model_dir: str | None = None
+    ocr_fast_det_model_dir: str | None = None
+    ocr_fast_rec_model_dir: str | None = None
+    ocr_accurate_det_model_dir: str | None = None
+    ocr_accurate_rec_model_dir: str | None = None
+    ocr_accurate_det_limit_side_len: int = 1600
+    ocr_compact: bool = True
+    ocr_compact_min_score: float = 0.5
+    ocr_cache_enabled: bool = True
+    ocr_cache_dir: str | None = None
+    ocr_cache_max_bytes: int = 256 * 1024 * 1024
+    ocr_prefetch: bool = True
+    ocr_prefetch_workers: int = 1
+    ocr_prefetch_max_pending: int = 16
+    warmup_enabled: bool = True
+    warmup_retry_seconds: float = 10.0
+    extraction_async: bool = False
+    worker_poll_interval_seconds: float = 2.0
+    extraction_dedup: bool = True
+    vendor_profiles_enabled: bool = True
+    vendor_profile_min_receipts: int = 2
+    vendor_profile_min_share: float = 0.8
+    vendor_profile_header_lines: int = 5
+    dedup_hardlink: bool = False
+    extraction_batch_max_files: int = 50
+    extraction_batch_llm_concurrency: int = 2
+    extraction_max_concurrent: int = 4
+    extraction_max_waiting: int = 8
+    extraction_wait_timeout_seconds: float = 30.0
+    extraction_events_poll_seconds: float = 0.5
+    extraction_events_timeout_seconds: float = 600.0
+    recovery_enabled: bool = True
+    recovery_interval_seconds: float = 300.0
+    recovery_parallelism: int = 2
+    recovery_batch_size: int = 20
+    reextract_parallelism: int = 2
+    reextract_rate: float = 0.0
+    shadow_model: str | None = None
+    shadow_ocr_tier_mode: str | None = None
+    shadow_sample_rate: float = 0.0
+    shadow_workers: int = 1
+    shadow_max_pending: int = 16
+    extraction_lease_seconds: int = 900
+    extraction_max_attempts: int = 3
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
@@ -2,8 +2,10 @@ import uuid
 
 from sqlalchemy.orm import Session
 
+from app.crud.vendor_profile import record_receipt_change
 from app.models.receipt import Receipt
 from app.models.receipt_file import ReceiptFile
+from app.services.vendor_profiles import receipt_snapshot
 
 
 def create_receipt(
@@ -13,14 +15,20 @@ def create_receipt(
 ) -> Receipt:
     receipt = Receipt(user_id=user_id, **data)
     db.add(receipt)
+    db.flush()
+    # Load server defaults (status) before deciding what the receipt tells us about its vendor.
+    db.refresh(receipt)
+    record_receipt_change(db, user_id, None, receipt_snapshot(receipt))
     db.commit()
     db.refresh(receipt)
     return receipt
 
 
 def update_receipt(db: Session, receipt: Receipt, data: dict) -> Receipt:
+    before = receipt_snapshot(receipt)
     for key, value in data.items():
         setattr(receipt, key, value)
+    record_receipt_change(db, receipt.user_id, before, receipt_snapshot(receipt))
     db.add(receipt)
     db.commit()
     db.refresh(receipt)
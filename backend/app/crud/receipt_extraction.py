@@ -0,0 +1,120 @@
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+
+
+def get_extraction_for_user(db: Session, extraction_id: uuid.UUID, user_id: uuid.UUID) -> ReceiptExtraction | None:
+    return (
+        db.query(ReceiptExtraction)
+        .filter(ReceiptExtraction.id == extraction_id, ReceiptExtraction.user_id == user_id)
+        .first()
+    )
+
+
+def find_completed_extraction_by_sha256(
+    db: Session,
+    user_id: uuid.UUID,
+    sha256: str,
+    currency: str | None,
+    exclude_id: uuid.UUID | None = None,
+) -> ReceiptExtraction | None:
+    # The currency hint changes the result, so re-extracting with another one is a new run.
+    stmt = (
+        select(ReceiptExtraction)
+        .join(ReceiptFile, ReceiptFile.id == ReceiptExtraction.receipt_file_id)
+        .where(
+            ReceiptFile.user_id == user_id,
+            ReceiptFile.sha256 == sha256,
+            ReceiptExtraction.currency.is_not_distinct_from(currency),
+            ReceiptExtraction.status == ExtractionStatus.completed,
+        )
+        .order_by(ReceiptExtraction.completed_at.desc().nullslast())
+        .limit(1)
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(ReceiptExtraction.id != exclude_id)
+    return db.execute(stmt).scalars().first()
+
+
+def copy_extraction_result(source: ReceiptExtraction, target: ReceiptExtraction) -> None:
+    target.status = ExtractionStatus.completed
+    target.raw_ocr_text = source.raw_ocr_text
+    target.extracted_json = source.extracted_json
+    target.confidence = source.confidence
+    target.model_name = source.model_name
+    target.ocr_tier = source.ocr_tier
+    target.ocr_layout = source.ocr_layout
+    target.completed_at = datetime.now(timezone.utc)
+
+
+def count_extractions_by_status(db: Session, statuses: list[ExtractionStatus]) -> dict[str, int]:
+    rows = db.execute(
+        select(ReceiptExtraction.status, func.count())
+        .where(ReceiptExtraction.status.in_(statuses))
+        .group_by(ReceiptExtraction.status)
+    ).all()
+    counts = dict.fromkeys((status.value for status in statuses), 0)
+    counts.update({status.value: count for status, count in rows})
+    return counts
+
+
+def mark_extraction_processing(db: Session, extraction: ReceiptExtraction) -> ReceiptExtraction:
+    extraction.status = ExtractionStatus.processing
+    extraction.claimed_at = datetime.now(timezone.utc)
+    extraction.attempts = ReceiptExtraction.attempts + 1
+    db.add(extraction)
+    db.commit()
+    db.refresh(extraction)
+    return extraction
+
+
+def claim_next_extraction(db: Session) -> ReceiptExtraction | None:
+    # SKIP LOCKED lets any number of workers poll the same table without
+    # blocking on, or double-claiming, a row another worker is taking.
+    stmt = (
+        select(ReceiptExtraction)
+        .where(ReceiptExtraction.status == ExtractionStatus.pending)
+        .order_by(ReceiptExtraction.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    extraction = db.execute(stmt).scalars().first()
+    if extraction is None:
+        return None
+    return mark_extraction_processing(db, extraction)
+
+
+def lock_stale_extractions(
+    db: Session, lease_expired_before: datetime, include_pending: bool, limit: int
+) -> list[ReceiptExtraction]:
+    """Lock extractions whose run was abandoned: claimed before the lease cutoff and never finished.
+
+    With `include_pending`, rows pending since before the cutoff count too;
+    that is for deployments where no worker drains the pending queue.
+    """
+    stale = and_(
+        ReceiptExtraction.status == ExtractionStatus.processing,
+        ReceiptExtraction.claimed_at < lease_expired_before,
+    )
+    if include_pending:
+        stale = or_(
+            stale,
+            and_(
+                ReceiptExtraction.status == ExtractionStatus.pending,
+                ReceiptExtraction.created_at < lease_expired_before,
+            ),
+        )
+    stmt = (
+        select(ReceiptExtraction)
+        .where(stale)
+        .order_by(ReceiptExtraction.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return list(db.execute(stmt).scalars())
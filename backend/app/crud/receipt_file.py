@@ -1,8 +1,27 @@
+import uuid
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import Row, select, tuple_
 from sqlalchemy.orm import Session
 
+from app.models.receipt_extraction import ReceiptExtraction
 from app.models.receipt_file import ReceiptFile
 
 
+def get_receipt_file_for_user(db: Session, receipt_file_id: uuid.UUID, user_id: uuid.UUID) -> ReceiptFile | None:
+    return db.query(ReceiptFile).filter(ReceiptFile.id == receipt_file_id, ReceiptFile.user_id == user_id).first()
+
+
+def find_receipt_file_by_sha256(db: Session, user_id: uuid.UUID, sha256: str) -> ReceiptFile | None:
+    return (
+        db.query(ReceiptFile)
+        .filter(ReceiptFile.user_id == user_id, ReceiptFile.sha256 == sha256)
+        .order_by(ReceiptFile.created_at)
+        .first()
+    )
+
+
 def get_receipt_file_for_receipt(db: Session, receipt_id, user_id) -> ReceiptFile | None:
     return (
         db.query(ReceiptFile)
@@ -10,3 +29,32 @@ def get_receipt_file_for_receipt(db: Session, receipt_id, user_id) -> ReceiptFil
         .order_by(ReceiptFile.created_at.desc())
         .first()
     )
+
+
+def stream_receipt_files(
+    db: Session,
+    after: tuple[datetime, uuid.UUID] | None = None,
+    user_id: uuid.UUID | None = None,
+    batch_size: int = 100,
+) -> Iterator[Row]:
+    """Yield `(id, user_id, created_at, currency)` for every stored file, oldest first, past `after`.
+
+    Rows come from a server-side cursor `batch_size` at a time, so the whole
+    table is never held in memory. `currency` is the hint given with the
+    file's latest extraction.
+    """
+    currency = (
+        select(ReceiptExtraction.currency)
+        .where(ReceiptExtraction.receipt_file_id == ReceiptFile.id)
+        .order_by(ReceiptExtraction.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    stmt = select(ReceiptFile.id, ReceiptFile.user_id, ReceiptFile.created_at, currency.label("currency")).order_by(
+        ReceiptFile.created_at, ReceiptFile.id
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(ReceiptFile.created_at, ReceiptFile.id) > tuple_(*after))
+    if user_id is not None:
+        stmt = stmt.where(ReceiptFile.user_id == user_id)
+    return iter(db.execute(stmt, execution_options={"stream_results": True, "yield_per": batch_size}))
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import Row, and_, select
+from sqlalchemy.orm import Session
+
+from app.models.enums import ReceiptStatus
+from app.models.receipt import Receipt
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.shadow_extraction import ShadowExtraction
+
+
+def stream_shadow_comparisons(db: Session, since: datetime | None = None, batch_size: int = 500) -> Iterator[Row]:
+    """Yield `(shadow, primary extraction, confirmed receipt or None)` for every shadow run since `since`."""
+    stmt = (
+        select(ShadowExtraction, ReceiptExtraction, Receipt)
+        .join(ReceiptExtraction, ReceiptExtraction.id == ShadowExtraction.extraction_id)
+        .outerjoin(
+            Receipt,
+            and_(Receipt.source_extraction_id == ReceiptExtraction.id, Receipt.status == ReceiptStatus.confirmed),
+        )
+        .order_by(ShadowExtraction.created_at)
+    )
+    if since is not None:
+        stmt = stmt.where(ShadowExtraction.created_at >= since)
+    return iter(db.execute(stmt, execution_options={"stream_results": True, "yield_per": batch_size}))
@@ -0,0 +1,72 @@
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.vendor_profile import VendorProfile
+from app.services.vendor_profiles import (
+    ReceiptSnapshot,
+    VendorMatch,
+    VendorProfiles,
+    add_counts,
+    usual_fields,
+)
+
+
+def _locked_profile(db: Session, user_id: uuid.UUID, snapshot: ReceiptSnapshot) -> VendorProfile:
+    # Upsert then lock, so concurrent receipts for a new vendor neither collide nor lose counts.
+    db.execute(
+        insert(VendorProfile)
+        .values(id=uuid.uuid4(), user_id=user_id, vendor_key=snapshot.vendor_key, vendor_name=snapshot.vendor_name)
+        .on_conflict_do_nothing(index_elements=["user_id", "vendor_key"])
+    )
+    stmt = (
+        select(VendorProfile)
+        .where(VendorProfile.user_id == user_id, VendorProfile.vendor_key == snapshot.vendor_key)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return db.execute(stmt).scalar_one()
+
+
+def record_receipt_change(
+    db: Session, user_id: uuid.UUID, before: ReceiptSnapshot | None, after: ReceiptSnapshot | None
+) -> None:
+    """Move a receipt's contribution from `before` to `after` (either may be None); the caller commits."""
+    if before == after:
+        return
+    if before is not None:
+        profile = _locked_profile(db, user_id, before)
+        profile.receipt_count -= 1
+        profile.stats = add_counts(profile.stats, before.values, -1)
+        if profile.receipt_count <= 0:
+            db.delete(profile)
+        # Written before `after` re-reads the row, which may be this same profile.
+        db.flush()
+    if after is not None:
+        profile = _locked_profile(db, user_id, after)
+        profile.receipt_count += 1
+        profile.stats = add_counts(profile.stats, after.values, 1)
+        profile.vendor_name = after.vendor_name
+    db.flush()
+
+
+def load_vendor_profiles(db: Session, user_id: uuid.UUID) -> VendorProfiles:
+    """The user's vendors confirmed often enough to be trusted, ready for matching OCR text."""
+    rows = db.execute(
+        select(VendorProfile).where(
+            VendorProfile.user_id == user_id,
+            VendorProfile.receipt_count >= settings.vendor_profile_min_receipts,
+        )
+    ).scalars()
+    return VendorProfiles(
+        {
+            row.vendor_key: VendorMatch(
+                vendor_name=row.vendor_name,
+                fields=usual_fields(row.stats, row.receipt_count, settings.vendor_profile_min_share),
+            )
+            for row in rows
+        }
+    )
@@ -1,12 +1,40 @@
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from app.api.router import api_router
+from app.api.routes import metrics
 from app.core.config import settings
+from app.services.ocr_pool import shutdown_ocr_pool
+from app.services.ocr_prefetch import shutdown_ocr_prefetch
+from app.services.recovery import start_recovery
+from app.services.shadow import shutdown_shadow
+from app.services.warmup import api_warmup_enabled, get_warmup
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if api_warmup_enabled():
+        # In the background so the API starts serving (and /health answers) at once.
+        get_warmup().start()
+    stop_event = threading.Event()
+    if settings.recovery_enabled:
+        # Picks up extractions a previous (crashed) process left unfinished.
+        start_recovery(stop_event)
+    yield
+    stop_event.set()
+    shutdown_ocr_prefetch()
+    # Before the OCR pool: a shadow run of a candidate OCR tier may be using it.
+    shutdown_shadow()
+    shutdown_ocr_pool()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(title=settings.app_name, lifespan=lifespan)
     app.include_router(api_router, prefix="/api/v1")
+    # Unversioned, where Prometheus scrapes by default.
+    app.include_router(metrics.router)
     return app
 
 
@@ -1,19 +1,25 @@
 """SQLAlchemy models."""
 
 from app.models.enums import CardType, ExtractionStatus, PaymentType, ReceiptCategory, ReceiptStatus
+from app.models.llm_cache_entry import LlmCacheEntry
 from app.models.receipt import Receipt
 from app.models.receipt_extraction import ReceiptExtraction
 from app.models.receipt_file import ReceiptFile
+from app.models.shadow_extraction import ShadowExtraction
 from app.models.user import User
+from app.models.vendor_profile import VendorProfile
 
 __all__ = [
     "CardType",
     "ExtractionStatus",
+    "LlmCacheEntry",
     "PaymentType",
     "ReceiptCategory",
     "ReceiptStatus",
     "Receipt",
     "ReceiptExtraction",
     "ReceiptFile",
+    "ShadowExtraction",
     "User",
+    "VendorProfile",
 ]
@@ -38,5 +38,6 @@ class ReceiptStatus(str, enum.Enum):
 
 class ExtractionStatus(str, enum.Enum):
     pending = "pending"
+    processing = "processing"
     completed = "completed"
     failed = "failed"
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, Enum, ForeignKey, Index, Numeric, Text, func
+from sqlalchemy import DateTime, Enum, ForeignKey, Index, Integer, Numeric, String, Text, func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -14,6 +14,7 @@ class ReceiptExtraction(Base):
     __table_args__ = (
         Index("ix_receipt_extractions_user_created_at", "user_id", "created_at"),
         Index("ix_receipt_extractions_receipt_file_id", "receipt_file_id"),
+        Index("ix_receipt_extractions_status_created_at", "status", "created_at"),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -28,6 +29,21 @@ class ReceiptExtraction(Base):
     extracted_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     confidence: Mapped[float | None] = mapped_column(Numeric(5, 2), nullable=True)
     model_name: Mapped[str] = mapped_column(Text, nullable=False)
+    currency: Mapped[str | None] = mapped_column(String(3), nullable=True)
+    ocr_tier: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    # OCR lines as [text, score, x0, y0, x1, y1], plus raw/compacted token estimates.
+    ocr_layout: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # Stage durations in milliseconds (upload_write_ms, hash_ms, ocr_ms, llm_ms, parse_ms, ...).
+    timings: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    prompt_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    completion_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Latest stage and partial fields while processing, for GET /extractions/{id}/events.
+    progress: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # Runs started (API or worker); crash recovery gives up after EXTRACTION_MAX_ATTEMPTS.
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="receipt_extractions")
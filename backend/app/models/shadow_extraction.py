@@ -0,0 +1,40 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Enum, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.enums import ExtractionStatus
+
+
+class ShadowExtraction(Base):
+    """A candidate model or OCR tier run on a live extraction, for comparison only."""
+
+    __tablename__ = "shadow_extractions"
+    __table_args__ = (
+        Index("ix_shadow_extractions_extraction_id", "extraction_id"),
+        Index("ix_shadow_extractions_created_at", "created_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    extraction_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("receipt_extractions.id"), nullable=False
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    # The candidate: SHADOW_MODEL and SHADOW_OCR_TIER_MODE at the time (None: same as the primary).
+    candidate_model: Mapped[str | None] = mapped_column(Text, nullable=True)
+    candidate_ocr_tier_mode: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    status: Mapped[ExtractionStatus] = mapped_column(
+        Enum(ExtractionStatus, name="extraction_status"), nullable=False
+    )
+    model_name: Mapped[str | None] = mapped_column(Text, nullable=True)
+    extracted_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # {field: bool} against the primary extraction, for fields either side filled in.
+    agreement: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    timings: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    prompt_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    completion_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,26 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, Text, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class VendorProfile(Base):
+    __tablename__ = "vendor_profiles"
+    __table_args__ = (UniqueConstraint("user_id", "vendor_key", name="uq_vendor_profiles_user_vendor_key"),)
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    # Normalised vendor name (lower case, no store numbers or legal suffixes).
+    vendor_key: Mapped[str] = mapped_column(Text, nullable=False)
+    # Spelling from the most recently confirmed receipt.
+    vendor_name: Mapped[str] = mapped_column(Text, nullable=False)
+    receipt_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    # {field: {value: receipts}} for category, location, currency, payment_type, card_type, card_last4.
+    stats: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default="{}")
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
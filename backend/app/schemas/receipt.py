@@ -43,14 +43,31 @@ class ReceiptRead(ReceiptFields):
         from_attributes = True
 
 
+class ReceiptFileResponse(BaseModel):
+    receipt_file_id: uuid.UUID
+    file_name: str
+    mime_type: str
+    size_bytes: int
+    sha256: str
+    ocr_started: bool
+
+
 class ReceiptExtractionResponse(BaseModel):
     extraction_id: uuid.UUID
     receipt_file_id: uuid.UUID
     status: str
-    extracted: ReceiptFields
+    extracted: Optional[ReceiptFields] = None
     confidence: Optional[float] = None
     model_name: str
     ocr_text: Optional[str] = None
+    ocr_tier: Optional[str] = None
+    timings: Optional[dict[str, float]] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class ReceiptExtractionBatchResponse(BaseModel):
+    items: list[ReceiptExtractionResponse]
 
 
 class ReceiptListResponse(BaseModel):
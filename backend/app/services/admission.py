@@ -0,0 +1,109 @@
+"""Admission control for synchronous extractions.
+
+At most EXTRACTION_MAX_CONCURRENT extractions run OCR + LLM in the API at
+once, and at most EXTRACTION_MAX_WAITING more wait for a slot (for up to
+EXTRACTION_WAIT_TIMEOUT_SECONDS). Anything beyond that is rejected straight
+away with a `Retry-After` estimated from how long recent extractions took, so
+a burst of uploads cannot tie up every threadpool thread and DB connection
+and leaves room for the plain CRUD endpoints.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.core.config import settings
+
+
+# Used for Retry-After until an extraction has finished in this process.
+DEFAULT_DURATION_SECONDS = 10.0
+MAX_RETRY_AFTER_SECONDS = 600
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Extraction capacity exhausted; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_waiting: int, wait_timeout: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._durations: deque[float] = deque(maxlen=50)
+        self._condition = threading.Condition()
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queued work divided over the slots, at the median recent duration."""
+        with self._condition:
+            durations = sorted(self._durations)
+            queued = self.waiting + 1
+        typical = durations[len(durations) // 2] if durations else DEFAULT_DURATION_SECONDS
+        estimate = math.ceil(typical * queued / max(1, self.max_concurrent))
+        return min(MAX_RETRY_AFTER_SECONDS, max(1, estimate))
+
+    def _reject(self) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(self.retry_after())
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Hold a slot for the duration of the block; raise AdmissionRejected when none is available in time."""
+        with self._condition:
+            if self.running >= self.max_concurrent:
+                if self.waiting >= self.max_waiting:
+                    raise self._reject()
+                self.waiting += 1
+                deadline = time.monotonic() + self.wait_timeout
+                try:
+                    while self.running >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                if self.running >= self.max_concurrent:
+                    raise self._reject()
+            self.running += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.running -= 1
+                self._durations.append(time.monotonic() - started)
+                self._condition.notify()
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {"running": self.running, "waiting": self.waiting, "rejected": self.rejected}
+
+
+_controller: AdmissionController | None = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide controller, rebuilt if the limits change."""
+    global _controller
+    with _controller_lock:
+        limits = (
+            settings.extraction_max_concurrent,
+            settings.extraction_max_waiting,
+            settings.extraction_wait_timeout_seconds,
+        )
+        if _controller is None or (
+            _controller.max_concurrent,
+            _controller.max_waiting,
+            _controller.wait_timeout,
+        ) != limits:
+            _controller = AdmissionController(*limits)
+        return _controller
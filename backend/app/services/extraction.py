@@ -1,12 +1,45 @@
+from __future__ import annotations
+
+import hashlib
 import json
 import re
-from dataclasses import dataclass
-from typing import Any
-
-import requests
-from paddleocr import PaddleOCR
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Sequence
 
 from app.core.config import settings
+from app.models.enums import CardType, PaymentType, ReceiptCategory
+from app.schemas.receipt import ReceiptFields
+from app.services import metrics, ocr_layout, repair, rules
+from app.services.llm_cache import get_llm_cache, llm_cache_key
+from app.services.ollama import get_ollama_client, parse_partial_object
+from app.services.ocr_cache import get_ocr_cache, ocr_cache_key
+from app.services.ocr_pool import get_ocr_pool
+from app.services.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    import numpy as np
+    from paddleocr import PaddleOCR
+
+    from app.services.vendor_profiles import VendorProfiles
+
+
+# model_name recorded when rules alone produced the result.
+RULES_MODEL_NAME = "rules"
+# model_name recorded when rules skipped the LLM and a vendor profile filled what they left empty.
+PROFILE_MODEL_NAME = "rules+profile"
+
+
+@dataclass
+class OcrLine:
+    text: str
+    score: float
+    box: list[list[float]]
 
 
 @dataclass
@@ -15,45 +48,491 @@ class ExtractionResult:
     extracted: dict[str, Any]
     model_name: str
     confidence: float | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+    ocr_tier: str | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    ocr_layout: dict[str, Any] | None = None
+
+
+# Called with (event, data) as an extraction moves through its stages:
+# ocr_done, partial (rule or LLM fields so far), llm_started, fields_parsed.
+ProgressCallback = Callable[[str, dict[str, Any]], None]
+
+
+def _no_progress(_event: str, _data: dict[str, Any]) -> None:
+    pass
+
+
+_ocr_instances: dict[str, PaddleOCR] = {}
+_ocr_lock = threading.Lock()
+# An upload's background OCR and its extraction may ask for the same image at once.
+_ocr_inflight = SingleFlight()
+
+# Contour search runs on a copy no larger than this; the warp uses full resolution.
+_DETECT_DIMENSION = 800
+# A 4-sided contour must cover at least this fraction of the photo to count as the receipt.
+_MIN_RECEIPT_AREA = 0.2
+
+OCR_TIERS = ("fast", "accurate")
+
+
+def _bundle_dir(name: str) -> str:
+    path = Path(settings.ocr_model_dir) / name
+    if not (path / "inference.pdmodel").is_file():
+        # PaddleOCR would silently download into a missing directory.
+        raise RuntimeError(f"OCR model bundle has no {name} model at {path}")
+    return str(path)
+
+
+def _tier_model_dirs(tier: str) -> tuple[str | None, str | None]:
+    """The configured (det, rec) model directories of a tier; None means PaddleOCR's default."""
+    if tier == "fast":
+        return settings.ocr_fast_det_model_dir, settings.ocr_fast_rec_model_dir
+    if tier == "accurate":
+        return settings.ocr_accurate_det_model_dir, settings.ocr_accurate_rec_model_dir
+    raise ValueError(f"Unknown OCR tier: {tier}")
+
+
+def _tier_kwargs(tier: str) -> dict[str, Any]:
+    det_dir, rec_dir = _tier_model_dirs(tier)
+    kwargs: dict[str, Any] = {}
+    if tier == "accurate":
+        # Without server model dirs the accurate tier still detects at a higher resolution.
+        kwargs["det_limit_side_len"] = settings.ocr_accurate_det_limit_side_len
+    if settings.ocr_model_dir:
+        # Offline bundle: every model comes from disk, nothing is downloaded.
+        det_dir = det_dir or _bundle_dir("det")
+        rec_dir = rec_dir or _bundle_dir("rec")
+        kwargs["cls_model_dir"] = _bundle_dir("cls")
+    if det_dir:
+        kwargs["det_model_dir"] = det_dir
+    if rec_dir:
+        kwargs["rec_model_dir"] = rec_dir
+    return kwargs
+
+
+def _paddleocr_class() -> type[PaddleOCR]:
+    # paddle, cv2 and numpy cost seconds and hundreds of MB at import, so they
+    # are only loaded by the process that actually runs OCR.
+    from paddleocr import PaddleOCR
+
+    return PaddleOCR
+
+
+def _build_ocr(cpu_threads: int | None = None, tier: str = "fast") -> PaddleOCR:
+    kwargs: dict[str, Any] = {
+        "use_angle_cls": settings.ocr_angle_cls,
+        "lang": settings.ocr_lang,
+        "rec_batch_num": settings.ocr_rec_batch_num,
+        **_tier_kwargs(tier),
+    }
+    if cpu_threads is not None:
+        kwargs["cpu_threads"] = cpu_threads
+    return _paddleocr_class()(**kwargs)
+
+
+def _get_ocr(tier: str = "fast") -> PaddleOCR:
+    if tier not in _ocr_instances:
+        _ocr_instances[tier] = _build_ocr(tier=tier)
+    return _ocr_instances[tier]
+
+
+def first_ocr_tier() -> str:
+    """The tier every image goes through first under OCR_TIER_MODE."""
+    return "accurate" if settings.ocr_tier_mode == "accurate" else "fast"
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _order_corners(points: np.ndarray) -> np.ndarray:
+    import numpy as np
+
+    # top-left, top-right, bottom-right, bottom-left
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array(
+        [points[np.argmin(sums)], points[np.argmin(diffs)], points[np.argmax(sums)], points[np.argmax(diffs)]],
+        dtype=np.float32,
+    )
+
+
+def _find_receipt_quad(gray: np.ndarray) -> np.ndarray | None:
+    """Locate the receipt as the largest 4-sided contour covering enough of the photo."""
+    import cv2
+    import numpy as np
+
+    height, width = gray.shape[:2]
+    scale = min(1.0, _DETECT_DIMENSION / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _hierarchy = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = _MIN_RECEIPT_AREA * small.shape[0] * small.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.contourArea(approx) >= min_area:
+            return _order_corners(approx.reshape(4, 2).astype(np.float32) / scale)
+    return None
+
+
+def _warp_to_quad(gray: np.ndarray, quad: np.ndarray) -> np.ndarray:
+    import cv2
+    import numpy as np
+
+    top_left, top_right, bottom_right, bottom_left = quad
+    width = int(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))
+    height = int(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(quad, target)
+    return cv2.warpPerspective(gray, matrix, (width, height))
+
+
+def preprocess_image(image_path: str, timings: dict[str, float] | None = None) -> np.ndarray:
+    """Decode, upright, crop, grayscale and downscale a photo for OCR.
+
+    cv2.imread applies the EXIF orientation tag, so the image comes out
+    upright and PaddleOCR's angle classifier can be skipped. Stage durations
+    (milliseconds) are written into `timings`.
+    """
+    import cv2
+
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Unreadable image: {image_path}")
+    timings["decode_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    timings["grayscale_ms"] = _elapsed_ms(started)
+
+    if settings.ocr_crop_receipt:
+        started = time.perf_counter()
+        quad = _find_receipt_quad(gray)
+        if quad is not None:
+            gray = _warp_to_quad(gray, quad)
+        timings["crop_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    height, width = gray.shape[:2]
+    longest = max(height, width)
+    if settings.ocr_max_dimension and longest > settings.ocr_max_dimension:
+        scale = settings.ocr_max_dimension / longest
+        gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    timings["resize_ms"] = _elapsed_ms(started)
+    return gray
+
+
+def _ocr_input(image_path: str, timings: dict[str, float]) -> tuple[Any, bool]:
+    """Return what to hand PaddleOCR and whether to run the angle classifier."""
+    if not settings.ocr_preprocess:
+        return image_path, settings.ocr_angle_cls
+    return preprocess_image(image_path, timings), False
+
+
+def _ocr_config_tag(tier_mode: str | None = None) -> str:
+    mode = tier_mode or settings.ocr_tier_mode
+    tag = "raw" if not settings.ocr_preprocess else (
+        f"pre:{settings.ocr_max_dimension}:{'crop' if settings.ocr_crop_receipt else 'full'}"
+    )
+    if mode == "tiered":
+        tag += f":tiered:{settings.ocr_tier_min_score}:{settings.ocr_tier_max_low_fraction}"
+    elif mode != "fast":
+        tag += f":{mode}"
+    # Swapping model directories changes what OCR reads without changing the PaddleOCR version.
+    tiers = OCR_TIERS if mode == "tiered" else (mode,)
+    models = [settings.ocr_model_dir or ""]
+    models += [directory or "" for tier in tiers for directory in _tier_model_dirs(tier)]
+    if mode != "fast":
+        models.append(str(settings.ocr_accurate_det_limit_side_len))
+    return f"{tag}:models:{','.join(models)}"
+
+
+def _timed_ocr(ocr: PaddleOCR, source: Any, cls: bool, timings: dict[str, float], key: str = "ocr_ms") -> Any:
+    started = time.perf_counter()
+    result = ocr.ocr(source, cls=cls)
+    timings[key] = _elapsed_ms(started)
+    return result
+
+
+def _rerun_low_confidence(
+    get_ocr: Callable[[str], PaddleOCR], source: Any, entries: list, low: list[int], timings: dict[str, float]
+) -> list:
+    """Re-recognise the low-scoring lines with the accurate model; keep whichever read scores higher."""
+    import cv2
+    import numpy as np
+
+    started = time.perf_counter()
+    image = source if isinstance(source, np.ndarray) else cv2.imread(source, cv2.IMREAD_COLOR)
+    crops = [_warp_to_quad(image, np.array(entries[index][0], dtype=np.float32)) for index in low]
+    # Preprocessed images are grayscale; with det=False PaddleOCR hands crops to
+    # the recogniser as-is, and it only takes 3-channel images.
+    crops = [cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR) if crop.ndim == 2 else crop for crop in crops]
+    recognised = get_ocr("accurate").ocr([crops], det=False, cls=False)[0]
+    merged = list(entries)
+    for index, (text, score) in zip(low, recognised):
+        if score > entries[index][1][1]:
+            merged[index] = [entries[index][0], (text, score)]
+    timings["ocr_accurate_ms"] = _elapsed_ms(started)
+    return merged
+
 
+def _tiered_ocr(
+    get_ocr: Callable[[str], PaddleOCR],
+    source: Any,
+    cls: bool,
+    timings: dict[str, float],
+    tier_mode: str | None = None,
+) -> tuple[Any, str]:
+    """Run OCR per `tier_mode` (OCR_TIER_MODE by default) and return (raw PaddleOCR result, tier used).
 
-_ocr_instance: PaddleOCR | None = None
+    In "tiered" mode the fast model reads the image first. Lines scoring below
+    OCR_TIER_MIN_SCORE are re-recognised by the accurate model ("mixed"); if
+    nothing was found or too many lines are weak, the whole image is re-read
+    by the accurate model ("accurate").
+    """
+    mode = tier_mode or settings.ocr_tier_mode
+    if mode != "tiered":
+        return _timed_ocr(get_ocr(mode), source, cls, timings), mode
 
+    result = _timed_ocr(get_ocr("fast"), source, cls, timings)
+    entries = [entry for block in result for entry in block or []]
+    low = [index for index, entry in enumerate(entries) if entry[1][1] < settings.ocr_tier_min_score]
+    if not entries or len(low) / len(entries) > settings.ocr_tier_max_low_fraction:
+        return _timed_ocr(get_ocr("accurate"), source, cls, timings, key="ocr_accurate_ms"), "accurate"
+    # Lines without a box (not produced by detection) cannot be cropped again.
+    low = [index for index in low if entries[index][0] is not None]
+    if not low:
+        return result, "fast"
+    return [_rerun_low_confidence(get_ocr, source, entries, low, timings)], "mixed"
 
-def _get_ocr() -> PaddleOCR:
-    global _ocr_instance
-    if _ocr_instance is None:
-        _ocr_instance = PaddleOCR(use_angle_cls=True, lang=settings.ocr_lang)
-    return _ocr_instance
 
+def ocr_in_process(
+    get_ocr: Callable[[str], PaddleOCR], image_path: str, tier_mode: str | None = None
+) -> tuple[Any, dict[str, float], str]:
+    timings: dict[str, float] = {}
+    source, cls = _ocr_input(image_path, timings)
+    result, tier = _tiered_ocr(get_ocr, source, cls, timings, tier_mode)
+    return result, timings, tier
 
-def run_ocr(image_path: str) -> str:
-    ocr = _get_ocr()
-    result = ocr.ocr(image_path, cls=True)
-    lines: list[str] = []
+
+def _ocr_raw(image_path: str, timings: dict[str, float], tier_mode: str | None = None) -> tuple[Any, str]:
+    pool = get_ocr_pool()
+    if pool is not None:
+        result, worker_timings, tier = pool.ocr(image_path, tier_mode)
+        timings.update(worker_timings)
+        return result, tier
+    source, cls = _ocr_input(image_path, timings)
+    # A single PaddleOCR instance is not safe to share across threads.
+    with _ocr_lock:
+        return _tiered_ocr(_get_ocr, source, cls, timings, tier_mode)
+
+
+def _parse_ocr_result(result: Any) -> list[OcrLine]:
+    lines: list[OcrLine] = []
     for block in result:
-        for entry in block:
-            text = entry[1][0]
+        # PaddleOCR yields None for an image with no detected text.
+        for entry in block or []:
+            text, score = entry[1][0], entry[1][1]
             if text:
-                lines.append(text)
-    return "\n".join(lines)
+                box = [[float(x), float(y)] for x, y in entry[0]] if entry[0] is not None else []
+                lines.append(OcrLine(text=text, score=float(score), box=box))
+    return lines
 
 
-def _build_prompt(ocr_text: str, currency: str | None) -> str:
-    return (
-        "You are extracting structured receipt data from OCR text. "
-        "Return ONLY valid JSON with these fields: "
-        "vendor_name, location, purchased_at, category, subtotal, tax, total, currency, "
-        "payment_type, card_type, card_last4, ref_number, invoice_number, auth_number, notes. "
-        "If a field is unknown, use null. "
-        "Use ISO 8601 for purchased_at when possible. "
-        "Category must be one of: gas, food, office, travel, lodging, entertainment, medical, personal, other. "
-        "payment_type must be one of: credit_card, debit_card, cash, transfer, mobile_pay, other. "
-        "card_type must be one of: visa, mastercard, amex, discover, other, unknown. "
-        f"Default currency is {currency or 'CAD'} if not present. "
-        "OCR text:\n"
-        f"{ocr_text}"
-    )
+@lru_cache(maxsize=1)
+def _paddleocr_version() -> str:
+    try:
+        return metadata.version("paddleocr")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _file_sha256(image_path: str) -> str | None:
+    digest = hashlib.sha256()
+    try:
+        with open(image_path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def run_ocr_lines(
+    image_path: str,
+    sha256: str | None = None,
+    timings: dict[str, float] | None = None,
+    details: dict[str, Any] | None = None,
+    tier_mode: str | None = None,
+) -> list[OcrLine]:
+    """OCR an image into lines with scores and boxes, via the OCR cache when enabled.
+
+    Per-stage durations (milliseconds) are added to `timings` when given, and
+    `details["ocr_tier"]` records which OCR tier produced the lines.
+    `tier_mode` overrides OCR_TIER_MODE for this image (shadow runs).
+    """
+    timings = timings if timings is not None else {}
+    details = details if details is not None else {}
+    cache = get_ocr_cache()
+    key = None
+    if cache is not None:
+        digest = sha256 or _file_sha256(image_path)
+        if digest is not None:
+            angle_cls = settings.ocr_angle_cls and not settings.ocr_preprocess
+            key = ocr_cache_key(
+                digest, settings.ocr_lang, _paddleocr_version(), angle_cls, extra=_ocr_config_tag(tier_mode)
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                details["ocr_tier"] = cached.get("ocr_tier")
+                return [OcrLine(**line) for line in cached["lines"]]
+
+    def ocr() -> tuple[list[OcrLine], str]:
+        raw, tier = _ocr_raw(image_path, timings, tier_mode)
+        lines = _parse_ocr_result(raw)
+        if key is not None:
+            cache.put(key, {"lines": [asdict(line) for line in lines], "ocr_tier": tier})
+        return lines, tier
+
+    if key is None:
+        lines, tier = ocr()
+    else:
+        (lines, tier), _shared = _ocr_inflight.do(key, ocr)
+    details["ocr_tier"] = tier
+    return lines
+
+
+def run_ocr(
+    image_path: str,
+    sha256: str | None = None,
+    timings: dict[str, float] | None = None,
+    details: dict[str, Any] | None = None,
+    tier_mode: str | None = None,
+) -> str:
+    """OCR an image into plain text, one detected line per line, in OCR order.
+
+    This is the text kept as `raw_ocr_text`; `details["ocr_layout"]` gets the
+    line layout, which `_compact` turns into the text rules and the LLM read.
+    """
+    timings = timings if timings is not None else {}
+    details = details if details is not None else {}
+    lines = run_ocr_lines(image_path, sha256=sha256, timings=timings, details=details, tier_mode=tier_mode)
+    details["ocr_layout"] = ocr_layout.encode_layout(lines)
+    return "\n".join(line.text for line in lines)
+
+
+def _layout_lines(layout: dict[str, Any]) -> list[OcrLine]:
+    """The lines of an `encode_layout` dict, each box rebuilt from its bounds."""
+    lines = []
+    for text, score, *bounds in layout["lines"]:
+        box = []
+        if bounds:
+            x0, y0, x1, y1 = bounds
+            box = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+        lines.append(OcrLine(text=text, score=score, box=box))
+    return lines
+
+
+def _compact(
+    ocr_text: str, layout: dict[str, Any] | None, timings: dict[str, float]
+) -> tuple[str, dict[str, Any] | None]:
+    """The OCR text given to rules and the LLM, and the layout with its raw and compacted sizes.
+
+    With OCR_COMPACT and a layout the lines are merged into rows and filtered
+    (see `ocr_layout`); otherwise the plain OCR text is used as is.
+    """
+    if not settings.ocr_compact or not layout:
+        return ocr_text, layout
+    started = time.perf_counter()
+    text = ocr_layout.compact_text(_layout_lines(layout), settings.ocr_compact_min_score)
+    timings["compact_ms"] = _elapsed_ms(started)
+    layout = {
+        **layout,
+        "raw_tokens": ocr_layout.estimate_tokens(ocr_text),
+        "compact_tokens": ocr_layout.estimate_tokens(text),
+    }
+    metrics.observe_compaction(layout["raw_tokens"], layout["compact_tokens"])
+    return text, layout
+
+
+PROMPT_FIELDS = (
+    "vendor_name",
+    "location",
+    "purchased_at",
+    "category",
+    "subtotal",
+    "tax",
+    "total",
+    "currency",
+    "payment_type",
+    "card_type",
+    "card_last4",
+    "ref_number",
+    "invoice_number",
+    "auth_number",
+    "notes",
+)
+
+
+# Identical on every call and sent as the system prompt, so Ollama can reuse
+# its KV cache for this prefix and only evaluate the per-receipt part.
+SYSTEM_PROMPT = (
+    "You extract structured receipt data from OCR text. "
+    f"Reply with a single JSON object with these keys: {', '.join(PROMPT_FIELDS)}, "
+    "or only the keys you are asked for. No other text. "
+    "If a field is unknown, use null. "
+    "Use ISO 8601 for purchased_at. "
+    "Amounts are plain numbers without currency symbols. "
+    f"category must be one of: {', '.join(item.value for item in ReceiptCategory)}. "
+    f"payment_type must be one of: {', '.join(item.value for item in PaymentType)}. "
+    f"card_type must be one of: {', '.join(item.value for item in CardType)}. "
+    "currency is a 3-letter ISO 4217 code; use the default currency given if none is printed."
+)
+
+
+@lru_cache(maxsize=64)
+def _response_schema(fields: tuple[str, ...]) -> dict[str, Any]:
+    """JSON schema of ReceiptFields limited to `fields`, for Ollama's structured `format`."""
+    properties = ReceiptFields.model_json_schema()["properties"]
+    schema_properties: dict[str, Any] = {}
+    for name in fields:
+        if name in repair.FIELD_ENUMS:
+            values = [item.value for item in repair.FIELD_ENUMS[name]]
+            schema_properties[name] = {"anyOf": [{"type": "string", "enum": values}, {"type": "null"}]}
+        else:
+            schema_properties[name] = {
+                key: value for key, value in properties[name].items() if key not in ("title", "default")
+            }
+    return {"type": "object", "properties": schema_properties, "required": list(fields)}
+
+
+def _build_prompt(
+    ocr_text: str,
+    currency: str | None,
+    fields: Sequence[str] | None = None,
+    problems: dict[str, str] | None = None,
+    hints: dict[str, Any] | None = None,
+) -> str:
+    """The per-receipt part of the prompt; the fixed instructions are SYSTEM_PROMPT."""
+    lines = [f"Default currency: {currency or 'CAD'}"]
+    if fields:
+        lines.append(f"Return only: {', '.join(fields)}")
+    if hints:
+        usual = ", ".join(f"{name}={value}" for name, value in hints.items())
+        lines.append(f"Usual for this vendor, unless the receipt says otherwise: {usual}")
+    if problems:
+        grouped: dict[str, list[str]] = {}
+        for name, why in problems.items():
+            grouped.setdefault(why, []).append(name)
+        lines.append("Fix your earlier answer: " + "; ".join(f"{', '.join(names)}: {why}" for why, names in grouped.items()))
+    lines.append("OCR text:")
+    lines.append(ocr_text)
+    return "\n".join(lines)
 
 
 def _parse_json(text: str) -> dict[str, Any]:
@@ -66,30 +545,309 @@ def _parse_json(text: str) -> dict[str, Any]:
         return json.loads(match.group(0))
 
 
-def run_llm(ocr_text: str, currency: str | None) -> tuple[dict[str, Any], str]:
-    payload = {
-        "model": settings.ollama_model,
-        "prompt": _build_prompt(ocr_text, currency),
-        "stream": False,
-    }
-    response = requests.post(
-        f"{settings.ollama_url}/api/generate",
-        json=payload,
-        timeout=settings.ollama_timeout_seconds,
+def _generation_options() -> dict[str, Any]:
+    options: dict[str, Any] = {}
+    if settings.ollama_num_ctx is not None:
+        options["num_ctx"] = settings.ollama_num_ctx
+    if settings.ollama_num_predict is not None:
+        options["num_predict"] = settings.ollama_num_predict
+    return options
+
+
+def _timed_parse(parse: Callable[[str], dict[str, Any]], text: str, timings: dict[str, float]) -> dict[str, Any]:
+    started = time.perf_counter()
+    extracted = parse(text)
+    timings["parse_ms"] = _elapsed_ms(started)
+    return extracted
+
+
+def run_llm(
+    ocr_text: str,
+    currency: str | None,
+    fields: Sequence[str] | None = None,
+    timings: dict[str, float] | None = None,
+    details: dict[str, Any] | None = None,
+    on_partial: Callable[[dict[str, Any]], None] | None = None,
+    problems: dict[str, str] | None = None,
+    model: str | None = None,
+    hints: dict[str, Any] | None = None,
+) -> tuple[dict[str, Any], str]:
+    """Ask the LLM for `fields` (all receipt fields by default) and parse its JSON.
+
+    The time spent parsing the reply is written to `timings["parse_ms"]` and
+    Ollama's token counts to `details` (left out for cached replies). When
+    streaming, `on_partial` gets the fields completed so far each time one
+    more field has arrived. `problems` (field -> what was wrong) turns the
+    call into a follow-up on an earlier answer. `model` overrides
+    OLLAMA_MODEL (shadow runs). `hints` are a known vendor's usual values.
+    """
+    timings = timings if timings is not None else {}
+    details = details if details is not None else {}
+    model = model or settings.ollama_model
+    prompt = _build_prompt(ocr_text, currency, fields, problems, hints)
+    options = _generation_options()
+    extra: dict[str, Any] = {"system": SYSTEM_PROMPT}
+    if settings.ollama_structured_output:
+        # Constrained decoding: the reply is always a bare JSON object.
+        extra["format"] = _response_schema(tuple(fields or PROMPT_FIELDS))
+        parse: Callable[[str], dict[str, Any]] = json.loads
+    else:
+        parse = _parse_json
+    cache = get_llm_cache()
+    key = llm_cache_key(model, prompt, options, **extra)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return _timed_parse(parse, cached, timings), model
+
+    on_text = None
+    if on_partial is not None and settings.ollama_stream:
+        seen = 0
+
+        def on_text(text: str) -> None:
+            nonlocal seen
+            partial = parse_partial_object(text)
+            if len(partial) > seen:
+                seen = len(partial)
+                on_partial(partial)
+
+    response = get_ollama_client().generate(
+        model,
+        prompt,
+        options=options,
+        keep_alive=settings.ollama_keep_alive,
+        stream=settings.ollama_stream,
+        on_text=on_text,
+        **extra,
     )
-    response.raise_for_status()
-    data = response.json()
-    return _parse_json(data.get("response", "{}")), settings.ollama_model
+    details["prompt_tokens"] = response.prompt_tokens
+    details["completion_tokens"] = response.completion_tokens
+    extracted = _timed_parse(parse, response.text or "{}", timings)
+    # Only responses that parsed are worth replaying.
+    if cache is not None:
+        cache.put(key, model, response.text)
+    return extracted, model
+
+
+def _finish_extraction(
+    ocr_text: str,
+    currency: str | None,
+    timings: dict[str, float],
+    ocr_tier: str | None = None,
+    progress: ProgressCallback = _no_progress,
+    layout: dict[str, Any] | None = None,
+    vendor_profiles: VendorProfiles | None = None,
+    model: str | None = None,
+) -> ExtractionResult:
+    # `ocr_text` is stored as is; rules and the LLM read the compacted text.
+    text, layout = _compact(ocr_text, layout, timings)
+    found = None
+    confident: dict[str, Any] = {}
+    if settings.rules_enabled:
+        started = time.perf_counter()
+        found = rules.extract_fields(text)
+        confident = found.confident(settings.rules_min_confidence)
+        timings["rules_ms"] = _elapsed_ms(started)
+        if confident:
+            progress("partial", {"source": "rules", "fields": dict(confident)})
 
+    # A vendor's usual values are hints and fallbacks only: they never stand in for what
+    # this receipt says, so they neither beat the LLM nor count towards skipping it.
+    profiled = _profile_fields(text, currency, vendor_profiles, timings)
+
+    remaining = [name for name in PROMPT_FIELDS if name not in confident]
+    usage: dict[str, Any] = {}
+    if found is not None and settings.rules_skip_llm and all(name in confident for name in rules.required_fields()):
+        extracted, model_name = {**profiled, **confident}, PROFILE_MODEL_NAME if profiled else RULES_MODEL_NAME
+        rules.rules_stats.record("skipped")
+    else:
+        started = time.perf_counter()
+        requested = remaining if confident else None
+        progress("llm_started", {"fields": list(requested or PROMPT_FIELDS)})
+        # Only ask for what the rules could not settle; their values win.
+        extracted, model_name = run_llm(
+            text,
+            currency,
+            fields=requested,
+            timings=timings,
+            details=usage,
+            on_partial=lambda fields: progress("partial", {"source": "llm", "fields": {**fields, **confident}}),
+            model=model,
+            hints=profiled,
+        )
+        timings["llm_ms"] = _elapsed_ms(started)
+        extracted = _repair_fields(text, currency, extracted, confident, timings, usage, model)
+        extracted.update(confident)
+        extracted.update({name: value for name, value in profiled.items() if not extracted.get(name)})
+        if found is not None:
+            rules.rules_stats.record("partial" if confident else "full")
 
-def extract_receipt(image_path: str, currency: str | None) -> ExtractionResult:
-    ocr_text = run_ocr(image_path)
-    extracted, model_name = run_llm(ocr_text, currency)
     if currency and not extracted.get("currency"):
         extracted["currency"] = currency
+    progress("fields_parsed", {"fields": extracted})
     return ExtractionResult(
         ocr_text=ocr_text,
         extracted=extracted,
         model_name=model_name,
-        confidence=None,
+        confidence=rules.score_fields(extracted, found) if found is not None else None,
+        timings=timings,
+        ocr_tier=ocr_tier,
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        ocr_layout=layout,
     )
+
+
+def _repair_fields(
+    ocr_text: str,
+    currency: str | None,
+    extracted: dict[str, Any],
+    confident: dict[str, Any],
+    timings: dict[str, float],
+    usage: dict[str, Any],
+    model: str | None = None,
+) -> dict[str, Any]:
+    """Re-ask the LLM, with a short prompt, for the fields it got wrong; drop what stays invalid.
+
+    Each round asks only for fields that are invalid, fail the amount
+    cross-check or are required but missing (the latter only when the OCR has
+    a line that looks like it holds them), and shows only the OCR lines that
+    bear on them. Rule fields are never re-asked.
+    """
+    required = rules.required_fields()
+    printed = rules.printed_fields(ocr_text)
+    asked: set[str] = set()
+    started = time.perf_counter()
+    for _round in range(settings.llm_repair_rounds):
+        problems = {
+            name: why
+            for name, why in repair.find_problems({**extracted, **confident}, required).items()
+            if name not in confident and (why != repair.MISSING or name in printed)
+        }
+        if not problems:
+            break
+        details: dict[str, Any] = {}
+        fixed, _model = run_llm(
+            rules.lines_for_fields(ocr_text, problems),
+            currency,
+            fields=list(problems),
+            timings={},
+            details=details,
+            problems=problems,
+            model=model,
+        )
+        for key in ("prompt_tokens", "completion_tokens"):
+            if details.get(key) is not None:
+                usage[key] = (usage.get(key) or 0) + details[key]
+        asked.update(problems)
+        answers = {name: fixed.get(name) for name in problems}
+        if all(extracted.get(name) == value for name, value in answers.items()):
+            # Same answer again; another round would not change it.
+            break
+        extracted = {**extracted, **answers}
+    if asked:
+        timings["repair_ms"] = _elapsed_ms(started)
+        remaining = repair.find_problems({**extracted, **confident}, required)
+        for name in asked:
+            metrics.observe_repair(name, name not in remaining)
+    return repair.drop_invalid(extracted)
+
+
+def _profile_fields(
+    ocr_text: str, currency: str | None, vendor_profiles: VendorProfiles | None, timings: dict[str, float]
+) -> dict[str, Any]:
+    """Vendor name plus the vendor's usual field values when the OCR header names a known vendor."""
+    if not settings.vendor_profiles_enabled or not vendor_profiles:
+        return {}
+    started = time.perf_counter()
+    match = vendor_profiles.match(ocr_text, settings.vendor_profile_header_lines)
+    timings["profile_ms"] = _elapsed_ms(started)
+    metrics.observe_vendor_profile(match is not None)
+    if match is None:
+        return {}
+    fields: dict[str, Any] = {"vendor_name": match.vendor_name, **match.fields}
+    if currency:
+        # A currency given with the upload is more specific than the vendor's history.
+        fields.pop("currency", None)
+    return fields
+
+
+def extract_receipt(
+    image_path: str,
+    currency: str | None,
+    progress: ProgressCallback = _no_progress,
+    vendor_profiles: VendorProfiles | None = None,
+    model: str | None = None,
+    ocr_tier_mode: str | None = None,
+) -> ExtractionResult:
+    """OCR + rules + LLM for one image; `model` and `ocr_tier_mode` override the configured ones."""
+    timings: dict[str, float] = {}
+    details: dict[str, Any] = {}
+    ocr_text = run_ocr(image_path, timings=timings, details=details, tier_mode=ocr_tier_mode)
+    tier, layout = details.get("ocr_tier"), details.get("ocr_layout")
+    progress("ocr_done", {"ocr_text": ocr_text, "ocr_tier": tier, "ocr_layout": layout})
+    return _finish_extraction(
+        ocr_text, currency, timings, tier, progress, layout=layout, vendor_profiles=vendor_profiles, model=model
+    )
+
+
+def extract_from_ocr_text(
+    ocr_text: str,
+    currency: str | None,
+    ocr_tier: str | None = None,
+    progress: ProgressCallback = _no_progress,
+    vendor_profiles: VendorProfiles | None = None,
+    model: str | None = None,
+    layout: dict[str, Any] | None = None,
+) -> ExtractionResult:
+    """Finish an extraction whose OCR already ran, e.g. one an earlier, crashed attempt got through.
+
+    `layout` is the saved OCR layout, which compaction needs; without it rules
+    and the LLM read `ocr_text` as is.
+    """
+    return _finish_extraction(
+        ocr_text, currency, {}, ocr_tier, progress, layout=layout, vendor_profiles=vendor_profiles, model=model
+    )
+
+
+def extract_receipts_batch(
+    items: list[tuple[str, str | None]], vendor_profiles: VendorProfiles | None = None
+) -> list[ExtractionResult | Exception]:
+    """Extract many `(image_path, currency)` items, pipelining LLM calls behind OCR.
+
+    OCR fans out across the OCR pool (in-process OCR stays serial behind its
+    lock) and each image's LLM call is queued the moment its OCR finishes, so
+    Ollama works on one receipt while the next is still being read. Results
+    are in input order; a failed item yields its exception instead of raising.
+    `vendor_profiles`, when given, applies to every item (one user's batch).
+    """
+    results: list[ExtractionResult | Exception] = []
+    with ThreadPoolExecutor(
+        max_workers=max(1, settings.extraction_batch_llm_concurrency), thread_name_prefix="batch-llm"
+    ) as llm_executor:
+
+        def ocr_stage(image_path: str, currency: str | None) -> Future:
+            timings: dict[str, float] = {}
+            details: dict[str, Any] = {}
+            ocr_text = run_ocr(image_path, timings=timings, details=details)
+            return llm_executor.submit(
+                _finish_extraction,
+                ocr_text,
+                currency,
+                timings,
+                details.get("ocr_tier"),
+                layout=details.get("ocr_layout"),
+                vendor_profiles=vendor_profiles,
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, settings.ocr_workers), thread_name_prefix="batch-ocr"
+        ) as ocr_executor:
+            ocr_futures = [ocr_executor.submit(ocr_stage, path, currency) for path, currency in items]
+
+        for future in ocr_futures:
+            try:
+                results.append(future.result().result())
+            except Exception as exc:
+                results.append(exc)
+    return results
@@ -0,0 +1,195 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.receipt_extraction import copy_extraction_result, find_completed_extraction_by_sha256
+from app.crud.vendor_profile import load_vendor_profiles
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.schemas.receipt import ReceiptFields
+from app.services import extraction as extraction_service
+from app.services import metrics, shadow
+from app.services.singleflight import SingleFlight
+from app.services.vendor_profiles import VendorProfiles
+
+
+logger = logging.getLogger(__name__)
+
+# Identical uploads racing through this process share one OCR + LLM run.
+_inflight = SingleFlight()
+
+# Partial LLM fields arrive per token; write them at most this often.
+PARTIAL_WRITE_INTERVAL_SECONDS = 0.25
+
+MAX_ERROR_LENGTH = 2000
+
+
+def run_extraction(db: Session, extraction: ReceiptExtraction, reuse_previous: bool = True) -> ReceiptExtraction:
+    """Run OCR + LLM for a claimed extraction and persist the outcome.
+
+    The row is marked failed and the error re-raised when any step fails, so
+    callers decide whether to surface it (API) or log and move on (worker).
+    `reuse_previous=False` skips copying an earlier result for the same photo,
+    for re-extractions that exist to replace it.
+    """
+    receipt_file = extraction.receipt_file
+    currency = extraction.currency
+
+    if settings.extraction_dedup and reuse_previous:
+        # A duplicate may have finished while this job sat in the queue.
+        previous = find_completed_extraction_by_sha256(
+            db, extraction.user_id, receipt_file.sha256, currency, exclude_id=extraction.id
+        )
+        if previous is not None:
+            copy_extraction_result(previous, extraction)
+            db.add(extraction)
+            db.commit()
+            db.refresh(extraction)
+            metrics.observe_outcome("reused")
+            return extraction
+
+    key = (extraction.user_id, receipt_file.sha256, currency)
+    file_path = receipt_file.file_path
+    ocr_text, ocr_tier, layout = extraction.raw_ocr_text, extraction.ocr_tier, extraction.ocr_layout
+    progress = _progress_recorder(db, extraction)
+    vendor_profiles = _vendor_profiles(db, extraction.user_id)
+
+    def extract() -> extraction_service.ExtractionResult:
+        if ocr_text is not None:
+            # An earlier attempt got through OCR before it died; only the LLM step is redone.
+            return extraction_service.extract_from_ocr_text(
+                ocr_text, currency, ocr_tier, progress=progress, vendor_profiles=vendor_profiles, layout=layout
+            )
+        return extraction_service.extract_receipt(file_path, currency, progress=progress, vendor_profiles=vendor_profiles)
+
+    # Hand the connection back to the pool while OCR + LLM run (seconds to
+    # minutes); _apply_result checks one out again to save the result.
+    db.commit()
+    metrics.IN_FLIGHT.inc()
+    try:
+        result, _shared = _inflight.do(key, extract)
+        return _apply_result(db, extraction, result)
+    except Exception as exc:
+        _mark_failed(db, extraction, describe_error(exc))
+        raise
+    finally:
+        metrics.IN_FLIGHT.dec()
+
+
+def _vendor_profiles(db: Session, user_id: Any) -> VendorProfiles | None:
+    if not settings.vendor_profiles_enabled:
+        return None
+    return load_vendor_profiles(db, user_id)
+
+
+def _progress_recorder(db: Session, extraction: ReceiptExtraction) -> Callable[[str, dict[str, Any]], None]:
+    """Persist extraction progress so the events stream (possibly in another process) can relay it."""
+    last_write = 0.0
+
+    def record(event: str, data: dict[str, Any]) -> None:
+        nonlocal last_write
+        now = time.monotonic()
+        if event == "partial" and data["source"] == "llm" and now - last_write < PARTIAL_WRITE_INTERVAL_SECONDS:
+            return
+        progress = dict(extraction.progress or {})
+        progress["stage"] = event
+        if event == "ocr_done":
+            extraction.raw_ocr_text = data["ocr_text"]
+            extraction.ocr_tier = data["ocr_tier"]
+            extraction.ocr_layout = data["ocr_layout"]
+        elif event == "llm_started":
+            progress["requested"] = data["fields"]
+        else:
+            progress["fields"] = data["fields"]
+        extraction.progress = progress
+        db.add(extraction)
+        db.commit()
+        last_write = now
+
+    return record
+
+
+def run_extractions_batch(db: Session, extractions: list[ReceiptExtraction]) -> list[ReceiptExtraction]:
+    """Run OCR + LLM for several claimed extractions together and persist each outcome.
+
+    Identical files within the batch are extracted once. A failure marks only
+    the affected rows failed and is logged rather than raised, so one bad photo
+    does not sink the rest of the batch.
+    """
+    groups: dict[tuple, list[ReceiptExtraction]] = {}
+    for extraction in extractions:
+        groups.setdefault((extraction.receipt_file.sha256, extraction.currency), []).append(extraction)
+
+    items = [(group[0].receipt_file.file_path, group[0].currency) for group in groups.values()]
+    # Profiles are per user; a batch mixing users goes without them.
+    user_ids = {extraction.user_id for extraction in extractions}
+    vendor_profiles = _vendor_profiles(db, user_ids.pop()) if len(user_ids) == 1 else None
+    db.commit()
+    metrics.IN_FLIGHT.inc(len(items))
+    try:
+        results = extraction_service.extract_receipts_batch(items, vendor_profiles=vendor_profiles)
+    finally:
+        metrics.IN_FLIGHT.dec(len(items))
+
+    for group, result in zip(groups.values(), results):
+        for extraction in group:
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                _apply_result(db, extraction, result)
+            except Exception as exc:
+                logger.warning("Extraction %s failed", extraction.id, exc_info=True)
+                _mark_failed(db, extraction, describe_error(exc))
+    return extractions
+
+
+def _apply_result(
+    db: Session, extraction: ReceiptExtraction, result: extraction_service.ExtractionResult
+) -> ReceiptExtraction:
+    started = time.perf_counter()
+    extracted_fields = ReceiptFields.model_validate(result.extracted)
+    if extraction.currency and not extracted_fields.currency:
+        extracted_fields.currency = extraction.currency
+    timings = {**result.timings, "validate_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    extraction.status = ExtractionStatus.completed
+    extraction.raw_ocr_text = result.ocr_text
+    extraction.extracted_json = extracted_fields.model_dump(mode="json")
+    extraction.confidence = result.confidence
+    extraction.model_name = result.model_name
+    extraction.ocr_tier = result.ocr_tier
+    if result.ocr_layout is not None:
+        # Left alone when only the LLM step was re-run from saved OCR text without a layout.
+        extraction.ocr_layout = result.ocr_layout
+    # Keep the upload stages recorded when the file was stored.
+    extraction.timings = {**(extraction.timings or {}), **timings}
+    extraction.prompt_tokens = result.prompt_tokens
+    extraction.completion_tokens = result.completion_tokens
+    extraction.completed_at = datetime.now(timezone.utc)
+    db.add(extraction)
+    db.commit()
+    db.refresh(extraction)
+    metrics.observe_timings(timings)
+    metrics.observe_tokens(result.prompt_tokens, result.completion_tokens)
+    metrics.observe_outcome("completed")
+    # Off the request path; the caller never waits for the candidate.
+    shadow.maybe_shadow(extraction)
+    return extraction
+
+
+def describe_error(exc: BaseException) -> str:
+    return f"{type(exc).__name__}: {exc}"[:MAX_ERROR_LENGTH]
+
+
+def _mark_failed(db: Session, extraction: ReceiptExtraction, error: str) -> None:
+    # raw_ocr_text is kept: a later re-run can start from it.
+    extraction.status = ExtractionStatus.failed
+    extraction.last_error = error
+    extraction.completed_at = datetime.now(timezone.utc)
+    db.add(extraction)
+    db.commit()
+    metrics.observe_outcome("failed")
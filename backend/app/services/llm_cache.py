@@ -0,0 +1,257 @@
+"""Cache of raw LLM responses.
+
+Keys cover the model, the prompt (whitespace-normalised) and the generation
+options, so retries, duplicate OCR text and backfills that produce the same
+prompt skip Ollama entirely. LLM_CACHE_BACKEND selects the store:
+
+- "none": no caching
+- "memory": per-process LRU with TTL
+- "db": the in-memory LRU in front of the shared `llm_cache_entries` table
+
+Hits and misses of each tier are exported as receipt_llm_cache_lookups_total.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.llm_cache_entry import LlmCacheEntry
+from app.services import metrics
+
+
+_WHITESPACE_RE = re.compile(r"[ \t]+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    lines = (_WHITESPACE_RE.sub(" ", line).strip() for line in prompt.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def llm_cache_key(model: str, prompt: str, options: dict[str, Any] | None = None, **extra: Any) -> str:
+    """Hash everything that shapes the reply; `extra` covers request fields such as system and format."""
+    payload = {"model": model, "prompt": normalize_prompt(prompt), "options": options or {}, **extra}
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LlmCache(ABC):
+    # Label of this store's lookups in the receipt_llm_cache_lookups_total metric.
+    tier = ""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @abstractmethod
+    def _lookup(self, key: str) -> str | None:
+        """Return the cached response, or None on a miss."""
+
+    @abstractmethod
+    def _store(self, key: str, model: str, response: str) -> None:
+        """Save a response under `key`."""
+
+    def get(self, key: str) -> str | None:
+        value = self._lookup(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.observe_llm_cache(self.tier, value is not None)
+        return value
+
+    def put(self, key: str, model: str, response: str) -> None:
+        self._store(key, model, response)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class MemoryLlmCache(LlmCache):
+    tier = "memory"
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def _store(self, key: str, model: str, response: str) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DbLlmCache(LlmCache):
+    """Postgres-backed tier shared by every API process and worker.
+
+    An in-memory LRU sits in front so hot keys do not hit the database.
+    Expired and overflowing rows are deleted by a put at most once every
+    `evict_interval_seconds`, since that delete scans the table.
+    """
+
+    tier = "db"
+
+    def __init__(
+        self,
+        memory: MemoryLlmCache,
+        max_entries: int,
+        ttl_seconds: float,
+        session_factory: Callable[[], Session] = SessionLocal,
+        evict_interval_seconds: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__()
+        self.memory = memory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval_seconds = evict_interval_seconds
+        self._session_factory = session_factory
+        self._clock = clock
+        self._evict_lock = threading.Lock()
+        self._next_evict = clock()
+
+    def _lookup(self, key: str) -> str | None:
+        response = self.memory.get(key)
+        if response is not None:
+            return response
+        now = datetime.now(timezone.utc)
+        db = self._session_factory()
+        try:
+            entry = db.execute(
+                select(LlmCacheEntry).where(LlmCacheEntry.key == key, LlmCacheEntry.expires_at > now)
+            ).scalars().first()
+            if entry is None:
+                return None
+            db.execute(
+                update(LlmCacheEntry)
+                .where(LlmCacheEntry.key == key)
+                .values(hit_count=LlmCacheEntry.hit_count + 1, last_used_at=now)
+            )
+            db.commit()
+            response, model = entry.response, entry.model_name
+        finally:
+            db.close()
+        self.memory.put(key, model, response)
+        return response
+
+    def _store(self, key: str, model: str, response: str) -> None:
+        self.memory.put(key, model, response)
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        db = self._session_factory()
+        try:
+            stmt = insert(LlmCacheEntry).values(
+                key=key,
+                model_name=model,
+                response=response,
+                last_used_at=now,
+                expires_at=expires_at,
+            )
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[LlmCacheEntry.key],
+                    set_={"response": response, "last_used_at": now, "expires_at": expires_at},
+                )
+            )
+            if self._evict_due():
+                self._evict(db, now)
+            db.commit()
+        finally:
+            db.close()
+
+    def _evict_due(self) -> bool:
+        with self._evict_lock:
+            now = self._clock()
+            if now < self._next_evict:
+                return False
+            self._next_evict = now + self.evict_interval_seconds
+            return True
+
+    def _evict(self, db: Session, now: datetime) -> None:
+        db.execute(delete(LlmCacheEntry).where(LlmCacheEntry.expires_at <= now))
+        overflow = (
+            select(LlmCacheEntry.key)
+            .order_by(LlmCacheEntry.last_used_at.desc())
+            .offset(self.max_entries)
+            .scalar_subquery()
+        )
+        db.execute(delete(LlmCacheEntry).where(LlmCacheEntry.key.in_(overflow)))
+
+    def stats(self) -> dict[str, Any]:
+        stats = super().stats()
+        stats["memory"] = self.memory.stats()
+        return stats
+
+
+_cache: LlmCache | None = None
+_cache_config: tuple | None = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LlmCache | None:
+    """Return the process-wide cache configured by LLM_CACHE_*, or None when disabled."""
+    global _cache, _cache_config
+    backend = settings.llm_cache_backend
+    if backend == "none":
+        return None
+    config = (
+        backend,
+        settings.llm_cache_max_entries,
+        settings.llm_cache_ttl_seconds,
+        settings.llm_cache_db_max_entries,
+        settings.llm_cache_db_evict_interval_seconds,
+    )
+    with _cache_lock:
+        if _cache is None or _cache_config != config:
+            memory = MemoryLlmCache(settings.llm_cache_max_entries, settings.llm_cache_ttl_seconds)
+            if backend == "db":
+                _cache = DbLlmCache(
+                    memory,
+                    settings.llm_cache_db_max_entries,
+                    settings.llm_cache_ttl_seconds,
+                    evict_interval_seconds=settings.llm_cache_db_evict_interval_seconds,
+                )
+            elif backend == "memory":
+                _cache = memory
+            else:
+                raise ValueError(f"Unknown LLM_CACHE_BACKEND: {backend}")
+            _cache_config = config
+        return _cache
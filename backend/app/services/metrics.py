@@ -0,0 +1,147 @@
+"""Prometheus metrics for the extraction pipeline.
+
+Each `*_ms` timing of an extraction is observed into one histogram labelled
+by stage, in seconds. The other metrics cover token counts, outcomes, queue
+depth, Ollama backends, OCR compaction, caches, rules and shadow runs; see
+the constants below.
+
+Metrics are per process: the API serves them on `/metrics`, and a worker
+started with `--metrics-port` serves its own.
+"""
+from typing import Any
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+# Stages span sub-millisecond hashing to minute-long CPU OCR runs.
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "receipt_extraction_stage_seconds",
+    "Time spent in each extraction stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter("receipt_extraction_llm_tokens_total", "Tokens reported by Ollama.", ["kind"])
+EXTRACTIONS = Counter("receipt_extractions_total", "Finished extractions by outcome.", ["status"])
+IN_FLIGHT = Gauge("receipt_extractions_in_flight", "Extractions running OCR + LLM in this process.")
+RECOVERED = Counter(
+    "receipt_extractions_recovered_total", "Abandoned extractions found by the recovery sweep.", ["action"]
+)
+OLLAMA_SECONDS = Histogram(
+    "receipt_ollama_request_seconds",
+    "Ollama generate calls by backend and outcome.",
+    ["backend", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+OLLAMA_OUTSTANDING = Gauge("receipt_ollama_outstanding_requests", "Ollama calls in flight, by backend.", ["backend"])
+OLLAMA_HEALTHY = Gauge("receipt_ollama_backend_healthy", "1 while a backend is in rotation.", ["backend"])
+OLLAMA_HEDGES = Counter("receipt_ollama_hedged_requests_total", "Slow Ollama calls also sent to a second backend.")
+OCR_COMPACTION_RATIO = Histogram(
+    "receipt_ocr_compaction_ratio",
+    "Estimated prompt tokens of compacted OCR text relative to the raw text.",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+OCR_TOKENS_SAVED = Counter(
+    "receipt_ocr_prompt_tokens_saved_total", "Estimated prompt tokens removed by OCR compaction."
+)
+VENDOR_PROFILE_LOOKUPS = Counter(
+    "receipt_vendor_profile_lookups_total", "OCR headers checked against the user's vendor profiles.", ["outcome"]
+)
+OCR_PREFETCH = Counter(
+    "receipt_ocr_prefetch_total", "Background OCR of uploaded files, by outcome.", ["outcome"]
+)
+LLM_REPAIRS = Counter(
+    "receipt_llm_repairs_total",
+    "Fields re-asked of the LLM after failing validation, by outcome.",
+    ["field", "outcome"],
+)
+SHADOW_RUNS = Counter(
+    "receipt_shadow_extractions_total",
+    "Extractions sampled for a shadow run of the candidate, by outcome.",
+    ["outcome"],
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "receipt_llm_cache_lookups_total", "LLM response cache lookups, by tier and outcome.", ["tier", "outcome"]
+)
+RULES_EXTRACTIONS = Counter(
+    "receipt_rules_extractions_total",
+    "Extractions by how much of the LLM call the rules pass avoided (skipped, partial, full).",
+    ["llm"],
+)
+QUEUE_DEPTH = Gauge("receipt_extraction_queue_depth", "Extractions waiting or claimed, by status.", ["status"])
+
+
+def observe_timings(timings: dict[str, Any]) -> None:
+    for key, value in timings.items():
+        if key.endswith("_ms") and isinstance(value, (int, float)):
+            STAGE_SECONDS.labels(stage=key[: -len("_ms")]).observe(value / 1000)
+
+
+def observe_tokens(prompt_tokens: int | None, completion_tokens: int | None) -> None:
+    if prompt_tokens:
+        LLM_TOKENS.labels(kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(kind="completion").inc(completion_tokens)
+
+
+def observe_outcome(status: str) -> None:
+    EXTRACTIONS.labels(status=status).inc()
+
+
+def observe_recovery(action: str, count: int = 1) -> None:
+    RECOVERED.labels(action=action).inc(count)
+
+
+def observe_ollama_request(backend: str, seconds: float, outcome: str) -> None:
+    OLLAMA_SECONDS.labels(backend=backend, outcome=outcome).observe(seconds)
+
+
+def set_ollama_backend(backend: str, outstanding: int, healthy: bool | None = None) -> None:
+    OLLAMA_OUTSTANDING.labels(backend=backend).set(outstanding)
+    if healthy is not None:
+        OLLAMA_HEALTHY.labels(backend=backend).set(1 if healthy else 0)
+
+
+def observe_ollama_hedge() -> None:
+    OLLAMA_HEDGES.inc()
+
+
+def observe_compaction(raw_tokens: int, compact_tokens: int) -> None:
+    if raw_tokens:
+        OCR_COMPACTION_RATIO.observe(compact_tokens / raw_tokens)
+        OCR_TOKENS_SAVED.inc(raw_tokens - compact_tokens)
+
+
+def observe_vendor_profile(hit: bool) -> None:
+    VENDOR_PROFILE_LOOKUPS.labels(outcome="hit" if hit else "miss").inc()
+
+
+def observe_ocr_prefetch(outcome: str) -> None:
+    OCR_PREFETCH.labels(outcome=outcome).inc()
+
+
+def observe_repair(field: str, fixed: bool) -> None:
+    LLM_REPAIRS.labels(field=field, outcome="fixed" if fixed else "unresolved").inc()
+
+
+def observe_shadow(outcome: str) -> None:
+    SHADOW_RUNS.labels(outcome=outcome).inc()
+
+
+def observe_llm_cache(tier: str, hit: bool) -> None:
+    LLM_CACHE_LOOKUPS.labels(tier=tier, outcome="hit" if hit else "miss").inc()
+
+
+def observe_rules(outcome: str) -> None:
+    RULES_EXTRACTIONS.labels(llm=outcome).inc()
+
+
+def set_queue_depth(counts: dict[str, int]) -> None:
+    for status, count in counts.items():
+        QUEUE_DEPTH.labels(status=status).set(count)
+
+
+def render() -> tuple[bytes, str]:
+    """Return the exposition body and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,123 @@
+"""On-disk cache of OCR output.
+
+Entries are keyed by the image hash plus everything that changes what OCR
+returns (language, PaddleOCR version, angle classification, preprocessing
+options, model directories), so re-extracting a stored file only pays for
+the LLM step. The directory is bounded in size and evicts least-recently-used
+entries down to a low-water mark; hits refresh an entry's mtime.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+
+
+# Eviction trims the directory to this share of OCR_CACHE_MAX_BYTES.
+EVICT_TO_FRACTION = 0.9
+
+
+def ocr_cache_key(sha256: str, lang: str, model_version: str, angle_cls: bool, extra: str = "") -> str:
+    raw = "|".join([sha256, lang, model_version, "cls" if angle_cls else "nocls", extra])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class OcrCache:
+    def __init__(self, directory: str | Path, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size: int | None = None
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as handle:
+                payload = json.load(handle)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return payload
+
+    def put(self, key: str, payload: dict[str, Any]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        # Write-then-rename so concurrent readers (other API processes or
+        # workers sharing the directory) never see a partial entry.
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_name, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _mtime, size, _path in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Rescan rather than trust the running total: other processes may
+        # have written to or evicted from the same directory. Trimming below
+        # the budget means the next rescan is many puts away.
+        entries = sorted(self._entries())
+        size = sum(entry_size for _mtime, entry_size, _path in entries)
+        target = int(self.max_bytes * EVICT_TO_FRACTION)
+        for _mtime, entry_size, path in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            self.evictions += 1
+        self._size = size
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache: OcrCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OcrCache | None:
+    """Return the process-wide cache, or None when OCR_CACHE_ENABLED is false."""
+    global _cache
+    if not settings.ocr_cache_enabled:
+        return None
+    directory = Path(settings.ocr_cache_dir or Path(settings.storage_dir) / "_ocr_cache")
+    with _cache_lock:
+        if _cache is None or _cache.directory != directory or _cache.max_bytes != settings.ocr_cache_max_bytes:
+            _cache = OcrCache(directory, settings.ocr_cache_max_bytes)
+        return _cache
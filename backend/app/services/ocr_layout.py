@@ -0,0 +1,109 @@
+"""Layout-aware compaction of OCR lines into the text sent to the LLM.
+
+PaddleOCR returns one entry per detected text box, roughly top to bottom, so a
+printed row like `TOTAL ........ 12.34` arrives as two lines and the model has
+to pair labels with values itself. Compaction uses the box geometry to put
+boxes whose vertical centres fall on the same row back together (left to
+right), and drops what never carries a receipt field: low-confidence reads,
+lines without a letter or digit, barcode digit runs, slogans, and repeats of
+rows without an amount (a store name printed in the header and again in the
+footer). Rows with an amount are kept however often they appear: two
+identical item rows are two purchases. Fewer, denser lines mean fewer prompt
+tokens.
+
+The layout itself (text, score and axis-aligned box per line) is kept in a
+compact JSON form so it can be re-used without running OCR again.
+"""
+from __future__ import annotations
+
+import math
+import re
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from app.services.extraction import OcrLine
+
+
+LAYOUT_VERSION = 1
+
+# Rough characters per token for the English receipts Ollama models see.
+CHARS_PER_TOKEN = 4
+
+_BOILERPLATE_RE = re.compile(
+    r"thank\s*you|come\s+again|visit\s+us|see\s+you\s+soon|have\s+a\s+(?:nice|great|good)\s+day|"
+    r"survey|feedback|(?:keep|retain)\s+(?:this|your)\s+receipt|return\s+policy|"
+    r"returns?\s+(?:accepted|within)|follow\s+us|like\s+us\s+on",
+    re.IGNORECASE,
+)
+_BARCODE_RE = re.compile(r"^[\d\s*|#-]{14,}$")
+_ALNUM_RE = re.compile(r"[a-z0-9]", re.IGNORECASE)
+_AMOUNT_RE = re.compile(r"\d[.,]\d{2}(?!\d)")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _is_noise(text: str) -> bool:
+    if not _ALNUM_RE.search(text):
+        return True
+    if _BARCODE_RE.match(text) and sum(char.isdigit() for char in text) >= 12:
+        return True
+    return bool(_BOILERPLATE_RE.search(text))
+
+
+def _bounds(box: list[list[float]]) -> tuple[float, float, float, float]:
+    xs = [point[0] for point in box]
+    ys = [point[1] for point in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _rows(lines: list[OcrLine]) -> list[str]:
+    """Group boxed lines into printed rows, each read left to right."""
+    bounded = sorted(((_bounds(line.box), line.text) for line in lines), key=lambda item: item[0][1] + item[0][3])
+    rows: list[list[tuple[tuple[float, float, float, float], str]]] = []
+    for bounds, text in bounded:
+        center = (bounds[1] + bounds[3]) / 2
+        if rows:
+            # Compare against the row's first box so a slanted row cannot creep downwards.
+            _x0, top, _x1, bottom = rows[-1][0][0]
+            if top <= center <= bottom:
+                rows[-1].append((bounds, text))
+                continue
+        rows.append([(bounds, text)])
+    return [" ".join(text for _bounds, text in sorted(row, key=lambda item: item[0][0])) for row in rows]
+
+
+def compact_text(lines: list[OcrLine], min_score: float) -> str:
+    """The OCR text for the prompt: confident, non-boilerplate lines merged into rows.
+
+    A row without an amount is kept only the first time it appears.
+    """
+    kept = [line for line in lines if line.score >= min_score and not _is_noise(line.text)]
+    if all(line.box for line in kept):
+        texts = _rows(kept)
+    else:
+        # Without geometry for every line there is no reliable row order; keep OCR order.
+        texts = [line.text for line in kept]
+    seen: set[str] = set()
+    compacted = []
+    for text in texts:
+        if _AMOUNT_RE.search(text):
+            compacted.append(text)
+            continue
+        key = " ".join(text.lower().split())
+        if key not in seen:
+            seen.add(key)
+            compacted.append(text)
+    return "\n".join(compacted)
+
+
+def encode_layout(lines: list[OcrLine]) -> dict[str, Any]:
+    """Store lines as `[text, score, x0, y0, x1, y1]` (or `[text, score]` without a box)."""
+    encoded = []
+    for line in lines:
+        entry: list[Any] = [line.text, round(line.score, 3)]
+        if line.box:
+            entry.extend(round(value) for value in _bounds(line.box))
+        encoded.append(entry)
+    return {"v": LAYOUT_VERSION, "lines": encoded}
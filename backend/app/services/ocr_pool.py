@@ -0,0 +1,115 @@
+"""Process pool for PaddleOCR.
+
+OCR is CPU-bound and holds the GIL, so threads do not scale it. Each worker
+process here owns a warm PaddleOCR instance, optionally pinned to one CPU and
+limited to a fixed number of math-library threads, so N workers give roughly
+N times the OCR throughput of a single in-process instance.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any
+
+from app.core.config import settings
+
+
+# Read by OpenMP/MKL/OpenBLAS when paddle loads, so they must be set in the
+# worker before its first paddle import.
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# One PaddleOCR per tier, built on first use; the first tier is warmed at start-up.
+_worker_ocrs: dict[str, Any] = {}
+_worker_threads = 1
+
+
+def _build_worker_ocr(threads: int, tier: str) -> Any:
+    from app.services.extraction import _build_ocr
+
+    return _build_ocr(cpu_threads=threads, tier=tier)
+
+
+def _worker_get_ocr(tier: str) -> Any:
+    if tier not in _worker_ocrs:
+        _worker_ocrs[tier] = _build_worker_ocr(_worker_threads, tier)
+    return _worker_ocrs[tier]
+
+
+def _init_worker(counter: Any, threads: int, pin_cpus: bool) -> None:
+    global _worker_threads
+    from app.services.extraction import first_ocr_tier
+
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    if pin_cpus:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+    _worker_threads = threads
+    _worker_ocrs.clear()
+    _worker_get_ocr(first_ocr_tier())
+
+
+def _run_in_worker(image_path: str, tier_mode: str | None = None) -> tuple[Any, dict[str, float], str]:
+    from app.services.extraction import ocr_in_process
+
+    # Preprocessing runs here too, so decode/crop/resize is spread across workers.
+    return ocr_in_process(_worker_get_ocr, image_path, tier_mode)
+
+
+class OcrPool:
+    def __init__(
+        self,
+        workers: int,
+        threads_per_worker: int = 1,
+        pin_cpus: bool = False,
+        start_method: str = "spawn",
+    ) -> None:
+        # spawn by default: paddle is not fork-safe once imported in the parent.
+        context = multiprocessing.get_context(start_method)
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(context.Value("i", 0), threads_per_worker, pin_cpus),
+        )
+
+    def submit(self, image_path: str, tier_mode: str | None = None) -> Future:
+        """Queue an image for OCR; the Future resolves to (raw PaddleOCR result, stage timings, tier)."""
+        return self._executor.submit(_run_in_worker, image_path, tier_mode)
+
+    def ocr(self, image_path: str, tier_mode: str | None = None) -> tuple[Any, dict[str, float], str]:
+        return self.submit(image_path, tier_mode).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool: OcrPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool() -> OcrPool | None:
+    """Return the shared pool, or None when OCR_WORKERS is 0 (in-process OCR)."""
+    global _pool
+    if settings.ocr_workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = OcrPool(
+                workers=settings.ocr_workers,
+                threads_per_worker=settings.ocr_worker_threads,
+                pin_cpus=settings.ocr_pin_cpus,
+            )
+        return _pool
+
+
+def shutdown_ocr_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,73 @@
+"""Background OCR of uploaded receipt files.
+
+`POST /receipts/files` stores a photo and returns at once; OCR starts here
+while the user is still filling in the rest of the form. The lines land in
+the OCR cache, so the extraction that follows (and any re-extraction of the
+same file) finds them there, or waits on the run still in progress, and only
+pays for the LLM step.
+
+Prefetch needs the OCR cache and runs only where the API does its own OCR
+(not with EXTRACTION_ASYNC, where workers own OCR). At most
+OCR_PREFETCH_MAX_PENDING files wait for a thread; beyond that an upload
+simply gets OCR'd when it is extracted.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.core.config import settings
+from app.services import metrics
+from app.services.ocr_cache import get_ocr_cache
+
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+_pending = 0
+
+
+def _run(file_path: str, sha256: str) -> None:
+    from app.services.extraction import run_ocr_lines
+
+    try:
+        run_ocr_lines(file_path, sha256=sha256)
+        metrics.observe_ocr_prefetch("done")
+    except Exception:
+        logger.warning("Background OCR of %s failed", file_path, exc_info=True)
+        metrics.observe_ocr_prefetch("failed")
+
+
+def _finished(_future: Future) -> None:
+    # Also called for files cancelled at shutdown, which never reach _run.
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def prefetch_ocr(file_path: str, sha256: str) -> bool:
+    """Start OCR of a stored file in the background; False when it is left to the extraction."""
+    global _executor, _pending
+    if not settings.ocr_prefetch or settings.extraction_async or get_ocr_cache() is None:
+        return False
+    with _lock:
+        if _pending >= settings.ocr_prefetch_max_pending:
+            metrics.observe_ocr_prefetch("skipped")
+            return False
+        _pending += 1
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.ocr_prefetch_workers), thread_name_prefix="ocr-prefetch"
+            )
+        executor = _executor
+    executor.submit(_run, file_path, sha256).add_done_callback(_finished)
+    return True
+
+
+def shutdown_ocr_prefetch() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        # Queued files are dropped; their extractions run OCR themselves.
+        executor.shutdown(wait=True, cancel_futures=True)
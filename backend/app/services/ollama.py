@@ -0,0 +1,409 @@
+"""Ollama HTTP client.
+
+Keeps a pooled `requests.Session` so consecutive receipts reuse TCP
+connections, passes `keep_alive` so the model stays resident between calls,
+and in streaming mode hangs up as soon as the model generates anything past
+one complete JSON object. Closing the connection makes Ollama stop generating,
+so we do not wait for (or pay GPU time on) trailing tokens; when the model
+stops right after the object, the final chunk and its token counts are read.
+
+With several instances in OLLAMA_URLS, `OllamaRouter` spreads requests over
+them: each call goes to the healthy backend with the fewest outstanding
+requests per unit of weight, a backend that fails repeatedly is skipped for a
+cool-down period, a failed call is retried on another backend, and (with
+OLLAMA_HEDGE_AFTER_SECONDS) a call that is still running after that long is
+also sent to a second backend and the first answer wins.
+"""
+import json
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.services import metrics
+
+
+@dataclass
+class OllamaResponse:
+    text: str
+    model: str
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    # True when the stream was cut off after the first complete JSON object.
+    stopped_early: bool = False
+
+
+class JsonObjectTracker:
+    """Incrementally finds the end of the first top-level JSON object in a stream."""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.consumed = 0
+
+    def feed(self, piece: str) -> int | None:
+        """Consume `piece`; return the offset just past the closing brace once the object completes."""
+        for index, char in enumerate(piece):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.started:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+                self.started = True
+            elif char == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.consumed += index + 1
+                    return index + 1
+        self.consumed += len(piece)
+        return None
+
+
+def parse_partial_object(text: str) -> dict[str, Any]:
+    """Parse the members of a (possibly unfinished) JSON object that are already complete.
+
+    `{"a": 1, "b": "x", "c": "unfin` gives `{"a": 1, "b": "x"}`, which lets
+    callers show fields while the model is still generating the rest.
+    """
+    start = text.find("{")
+    if start < 0:
+        return {}
+    depth = 0
+    in_string = escaped = False
+    last_boundary = None
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                last_boundary = index
+                break
+        elif char == "," and depth == 1:
+            last_boundary = index
+    if last_boundary is None:
+        return {}
+    try:
+        return json.loads(text[start:last_boundary] + "}")
+    except ValueError:
+        return {}
+
+
+class OllamaClient:
+    def __init__(self, base_url: str, timeout: float, pool_size: int = 10) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        *,
+        options: dict[str, Any] | None = None,
+        keep_alive: str | None = None,
+        stream: bool = True,
+        stop_after_json: bool = True,
+        on_text: Callable[[str], None] | None = None,
+        cancel: threading.Event | None = None,
+        **extra: Any,
+    ) -> OllamaResponse:
+        payload: dict[str, Any] = {"model": model, "prompt": prompt, "stream": stream, **extra}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        url = f"{self.base_url}/api/generate"
+
+        if not stream:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            return OllamaResponse(
+                text=data.get("response", ""),
+                model=model,
+                prompt_tokens=data.get("prompt_eval_count"),
+                completion_tokens=data.get("eval_count"),
+            )
+
+        tracker = JsonObjectTracker() if stop_after_json else None
+        complete = False
+        parts: list[str] = []
+        result = OllamaResponse(text="", model=model)
+        with self.session.post(url, json=payload, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    # Another backend answered first; hanging up stops this one generating.
+                    break
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise requests.HTTPError(chunk["error"], response=response)
+                done = chunk.get("done", False)
+                piece = chunk.get("response", "")
+                if complete and piece and not done:
+                    # The model went on past the object: hang up. Ollama only reports
+                    # token counts in the final chunk, so they stay unknown.
+                    result.stopped_early = True
+                    break
+                if tracker is not None and piece and not complete:
+                    end = tracker.feed(piece)
+                    if end is not None:
+                        complete = True
+                        if piece[end:] and not done:
+                            parts.append(piece[:end])
+                            result.stopped_early = True
+                            break
+                        piece = piece[:end]
+                parts.append(piece)
+                if on_text is not None and piece and not complete:
+                    # Streaming only: the text received so far, for progress reporting.
+                    on_text("".join(parts))
+                if done:
+                    result.prompt_tokens = chunk.get("prompt_eval_count")
+                    result.completion_tokens = chunk.get("eval_count")
+                    break
+        result.text = "".join(parts)
+        return result
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def is_backend_failure(exc: Exception) -> bool:
+    """Whether `exc` says something about the backend (down, slow, 5xx) rather than about the request."""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is None or exc.response.status_code >= 500
+    return isinstance(exc, (requests.RequestException, ValueError))
+
+
+class OllamaBackend:
+    def __init__(self, url: str, weight: float, timeout: float, pool_size: int) -> None:
+        self.client = OllamaClient(url, timeout=timeout, pool_size=pool_size)
+        self.url = self.client.base_url
+        self.weight = weight
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+
+class OllamaRouter:
+    """Routes generate calls over several Ollama backends; see the module docstring."""
+
+    def __init__(
+        self,
+        backends: list[OllamaBackend],
+        unhealthy_after: int = 3,
+        unhealthy_seconds: float = 30.0,
+        hedge_after: float | None = None,
+    ) -> None:
+        self.backends = backends
+        self.unhealthy_after = unhealthy_after
+        self.unhealthy_seconds = unhealthy_seconds
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._hedge_executor: ThreadPoolExecutor | None = None
+        for backend in backends:
+            metrics.set_ollama_backend(backend.url, outstanding=0, healthy=True)
+
+    def _acquire(self, exclude: set[OllamaBackend]) -> OllamaBackend | None:
+        """Reserve the least loaded backend not in `exclude`, or None when all are excluded."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [backend for backend in self.backends if backend not in exclude]
+            if not candidates:
+                return None
+            # When every backend is cooling down, still try the one that recovers first.
+            healthy = [backend for backend in candidates if backend.healthy(now)] or [
+                min(candidates, key=lambda backend: backend.unhealthy_until)
+            ]
+            backend = min(
+                healthy,
+                # Idle backends share sequential traffic by weight.
+                key=lambda backend: (backend.outstanding / backend.weight, backend.served / backend.weight),
+            )
+            backend.outstanding += 1
+            backend.served += 1
+            exclude.add(backend)
+            metrics.set_ollama_backend(backend.url, outstanding=backend.outstanding)
+            return backend
+
+    def _release(self, backend: OllamaBackend, seconds: float, error: Exception | None) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.failures = 0
+                backend.unhealthy_until = 0.0
+            elif is_backend_failure(error):
+                backend.failures += 1
+                if backend.failures >= self.unhealthy_after:
+                    backend.unhealthy_until = time.monotonic() + self.unhealthy_seconds
+            healthy = backend.healthy(time.monotonic())
+            metrics.set_ollama_backend(backend.url, outstanding=backend.outstanding, healthy=healthy)
+        metrics.observe_ollama_request(backend.url, seconds, "ok" if error is None else "error")
+
+    def _call(
+        self, model: str, prompt: str, tried: set[OllamaBackend], first: OllamaBackend | None = None, **kwargs: Any
+    ) -> OllamaResponse:
+        """Run the call on `first` (or the best backend), moving on to the next one while backends fail."""
+        backend = first or self._acquire(tried)
+        while True:
+            started = time.monotonic()
+            try:
+                response = backend.client.generate(model, prompt, **kwargs)
+            except Exception as exc:
+                self._release(backend, time.monotonic() - started, exc)
+                if not is_backend_failure(exc):
+                    raise
+                backend = self._acquire(tried)
+                if backend is None:
+                    raise
+                continue
+            self._release(backend, time.monotonic() - started, None)
+            return response
+
+    def generate(self, model: str, prompt: str, **kwargs: Any) -> OllamaResponse:
+        tried: set[OllamaBackend] = set()
+        if not self.hedge_after or len(self.backends) < 2:
+            return self._call(model, prompt, tried, **kwargs)
+
+        executor = self._executor()
+        primary_cancel = threading.Event()
+        primary = executor.submit(self._call, model, prompt, tried, cancel=primary_cancel, **kwargs)
+        calls: dict[Future, threading.Event] = {primary: primary_cancel}
+        done, _pending = wait([primary], timeout=self.hedge_after)
+        if not done:
+            backend = self._acquire(tried)
+            if backend is not None:
+                metrics.observe_ollama_hedge()
+                hedge_cancel = threading.Event()
+                # Progress callbacks stay with the primary so partial text is not interleaved.
+                hedge_kwargs = {**kwargs, "on_text": None, "cancel": hedge_cancel}
+                calls[executor.submit(self._call, model, prompt, tried, backend, **hedge_kwargs)] = hedge_cancel
+
+        pending = set(calls)
+        error: BaseException | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        calls[other].set()
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * settings.ollama_pool_size * len(self.backends), thread_name_prefix="ollama-hedge"
+                )
+            return self._hedge_executor
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                backend.url: {
+                    "weight": backend.weight,
+                    "outstanding": backend.outstanding,
+                    "served": backend.served,
+                    "failures": backend.failures,
+                    "healthy": backend.healthy(now),
+                }
+                for backend in self.backends
+            }
+
+    def close(self) -> None:
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.client.close()
+
+
+def parse_backends(value: str) -> list[tuple[str, float]]:
+    """Parse OLLAMA_URLS: comma-separated `url` or `url=weight` entries."""
+    backends = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, sep, weight = entry.rpartition("=")
+        if not sep:
+            url, weight = entry, "1"
+        try:
+            parsed = float(weight)
+        except ValueError:
+            parsed = math.nan
+        # Routing divides outstanding requests by the weight.
+        if not math.isfinite(parsed) or parsed <= 0:
+            raise ValueError(f"OLLAMA_URLS weight must be a positive number, got {entry!r}")
+        backends.append((url.rstrip("/"), parsed))
+    return backends
+
+
+def _router_config() -> tuple:
+    return (
+        tuple(parse_backends(settings.ollama_urls or settings.ollama_url)),
+        settings.ollama_timeout_seconds,
+        settings.ollama_pool_size,
+        settings.ollama_unhealthy_after_failures,
+        settings.ollama_unhealthy_seconds,
+        settings.ollama_hedge_after_seconds,
+    )
+
+
+_client: OllamaRouter | None = None
+_client_config: tuple | None = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client() -> OllamaRouter:
+    """Return the process-wide router, rebuilt if the Ollama settings change."""
+    global _client, _client_config
+    with _client_lock:
+        config = _router_config()
+        if _client is None or _client_config != config:
+            backends, timeout, pool_size, unhealthy_after, unhealthy_seconds, hedge_after = config
+            _client = OllamaRouter(
+                [OllamaBackend(url, weight, timeout, pool_size) for url, weight in backends],
+                unhealthy_after=unhealthy_after,
+                unhealthy_seconds=unhealthy_seconds,
+                hedge_after=hedge_after or None,
+            )
+            _client_config = config
+        return _client
@@ -0,0 +1,116 @@
+"""Crash recovery for extractions.
+
+A process that dies mid-extraction leaves its row `processing` (or, when it
+dies between storing the upload and starting OCR, `pending`) for good. The
+sweep finds rows whose lease (EXTRACTION_LEASE_SECONDS since they were
+claimed) has run out and drives them again:
+
+- with EXTRACTION_ASYNC they go back to `pending` for the workers;
+- otherwise nothing drains the queue, so the sweeping process runs them
+  itself, at most RECOVERY_PARALLELISM at a time.
+
+OCR text saved by the dead attempt is reused, so only the LLM step is
+repeated. Rows that have already had EXTRACTION_MAX_ATTEMPTS runs are marked
+failed instead. The API and every worker sweep at start-up and then every
+RECOVERY_INTERVAL_SECONDS; `SKIP LOCKED` keeps them from re-driving the same
+row twice.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.receipt_extraction import lock_stale_extractions
+from app.db.session import SessionLocal
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.services import metrics
+from app.services.extraction_jobs import run_extraction
+
+
+logger = logging.getLogger(__name__)
+
+
+def _abandon(extraction: ReceiptExtraction) -> None:
+    extraction.status = ExtractionStatus.failed
+    extraction.last_error = f"Lease expired after {extraction.attempts} attempt(s); giving up"
+    extraction.completed_at = datetime.now(timezone.utc)
+
+
+def _retry(extraction: ReceiptExtraction, requeue: bool) -> None:
+    if extraction.attempts:
+        extraction.last_error = f"Lease expired during attempt {extraction.attempts}"
+    if requeue:
+        extraction.status = ExtractionStatus.pending
+        extraction.claimed_at = None
+    else:
+        # Claimed for this process with a fresh lease, so no other sweep picks it up meanwhile.
+        extraction.status = ExtractionStatus.processing
+        extraction.claimed_at = datetime.now(timezone.utc)
+        extraction.attempts += 1
+
+
+def _rerun(session_factory: Callable[[], Session], extraction_id: uuid.UUID) -> None:
+    db = session_factory()
+    try:
+        run_extraction(db, db.get(ReceiptExtraction, extraction_id))
+    except Exception:
+        logger.warning("Recovered extraction %s failed again", extraction_id, exc_info=True)
+    finally:
+        db.close()
+
+
+def recover_stale_extractions(session_factory: Callable[[], Session] = SessionLocal) -> int:
+    """Re-drive one batch of abandoned extractions. Returns how many were requeued or re-run."""
+    requeue = settings.extraction_async
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.extraction_lease_seconds)
+    db = session_factory()
+    try:
+        stale = lock_stale_extractions(
+            db, cutoff, include_pending=not requeue, limit=settings.recovery_batch_size
+        )
+        retry = []
+        for extraction in stale:
+            if extraction.attempts >= settings.extraction_max_attempts:
+                _abandon(extraction)
+            else:
+                _retry(extraction, requeue)
+                retry.append(extraction.id)
+        # One commit for the whole batch, so the row locks hold until every row is handed off.
+        db.commit()
+    finally:
+        db.close()
+
+    if stale:
+        logger.warning("Recovery: %d abandoned extraction(s), %d to retry", len(stale), len(retry))
+        metrics.observe_recovery("abandoned", len(stale) - len(retry))
+        metrics.observe_recovery("requeued" if requeue else "rerun", len(retry))
+    if retry and not requeue:
+        with ThreadPoolExecutor(
+            max_workers=max(1, settings.recovery_parallelism), thread_name_prefix="recovery"
+        ) as executor:
+            list(executor.map(lambda extraction_id: _rerun(session_factory, extraction_id), retry))
+    return len(retry)
+
+
+def run_recovery(
+    stop_event: threading.Event, session_factory: Callable[[], Session] = SessionLocal
+) -> None:
+    """Sweep now and then every RECOVERY_INTERVAL_SECONDS until `stop_event` is set."""
+    while not stop_event.is_set():
+        try:
+            recover_stale_extractions(session_factory)
+        except Exception:
+            logger.exception("Recovery sweep failed")
+        stop_event.wait(settings.recovery_interval_seconds)
+
+
+def start_recovery(stop_event: threading.Event) -> threading.Thread:
+    thread = threading.Thread(target=run_recovery, args=(stop_event,), name="recovery", daemon=True)
+    thread.start()
+    return thread
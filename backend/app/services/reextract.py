@@ -0,0 +1,192 @@
+"""Re-extraction of stored receipt files, e.g. after upgrading the Ollama model or PaddleOCR.
+
+`python -m app.cli reextract` walks `receipt_files` oldest first through a
+server-side cursor and gives every file a new extraction row, run with the
+current settings. Confirmed receipts are never touched; the new rows sit next
+to the old ones for review.
+
+Files are processed `parallelism` at a time and started at most `rate` per
+second. OCR and LLM results still come from their caches when the settings
+that key them (PaddleOCR version, model, prompt) did not change, so only the
+upgraded stage is paid for. Progress is checkpointed to a JSON file after
+every finished file: the position up to which everything is done, so a run
+that is interrupted (Ctrl-C, crash, deploy) resumes where it stopped.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.receipt_extraction import mark_extraction_processing
+from app.crud.receipt_file import stream_receipt_files
+from app.db.session import SessionLocal
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.services.extraction_jobs import run_extraction
+
+
+logger = logging.getLogger(__name__)
+
+FilePosition = tuple[datetime, uuid.UUID]
+
+
+class Checkpoint:
+    """How far a re-extraction run got, saved as JSON after every finished file.
+
+    Files finish out of order when several run at once, so the saved position
+    is the last file before which every file has finished; on resume a few
+    files past it may run a second time, none is skipped.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.after: FilePosition | None = None
+        self.done = 0
+        self.failed = 0
+        self._started: OrderedDict[FilePosition, bool] = OrderedDict()
+        self._lock = threading.Lock()
+        if path.exists():
+            saved = json.loads(path.read_text(encoding="utf-8"))
+            if saved.get("after"):
+                self.after = (datetime.fromisoformat(saved["after"][0]), uuid.UUID(saved["after"][1]))
+            self.done, self.failed = saved.get("done", 0), saved.get("failed", 0)
+
+    def start(self, position: FilePosition) -> None:
+        with self._lock:
+            self._started[position] = False
+
+    def finish(self, position: FilePosition, ok: bool) -> None:
+        with self._lock:
+            self._started[position] = True
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            while self._started and next(iter(self._started.values())):
+                self.after, _finished = self._started.popitem(last=False)
+            self._save()
+
+    def _save(self) -> None:
+        payload = {
+            "after": [self.after[0].isoformat(), str(self.after[1])] if self.after else None,
+            "done": self.done,
+            "failed": self.failed,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename, so an interrupted run never leaves half a checkpoint.
+        handle, temp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(handle, "w", encoding="utf-8") as temp:
+            json.dump(payload, temp)
+        os.replace(temp_path, self.path)
+
+
+class RateLimiter:
+    """Spaces out calls to `wait()` so at most `rate` return per second (0: no limit)."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self, stop_event: threading.Event) -> None:
+        now = time.monotonic()
+        if self._next > now:
+            stop_event.wait(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+@dataclass
+class ReextractStats:
+    done: int = 0
+    failed: int = 0
+
+
+def _reextract_file(
+    session_factory: Callable[[], Session], file_id: uuid.UUID, user_id: uuid.UUID, currency: str | None
+) -> bool:
+    db = session_factory()
+    try:
+        extraction = ReceiptExtraction(
+            user_id=user_id,
+            receipt_file_id=file_id,
+            status=ExtractionStatus.pending,
+            model_name=settings.ollama_model,
+            currency=currency,
+        )
+        db.add(extraction)
+        db.commit()
+        mark_extraction_processing(db, extraction)
+        run_extraction(db, extraction, reuse_previous=False)
+        return True
+    except Exception:
+        logger.warning("Re-extraction of file %s failed", file_id, exc_info=True)
+        return False
+    finally:
+        db.close()
+
+
+def reextract_files(
+    checkpoint_path: Path,
+    session_factory: Callable[[], Session] = SessionLocal,
+    parallelism: int | None = None,
+    rate: float | None = None,
+    batch_size: int = 100,
+    user_id: uuid.UUID | None = None,
+    limit: int | None = None,
+    stop_event: threading.Event | None = None,
+) -> ReextractStats:
+    """Give every stored file past the checkpoint a new extraction.
+
+    Stops starting files once `limit` have been started or `stop_event` is
+    set; files in hand are finished and checkpointed either way. Returns the
+    counts for this run only.
+    """
+    workers = max(1, settings.reextract_parallelism if parallelism is None else parallelism)
+    stop = stop_event or threading.Event()
+    checkpoint = Checkpoint(checkpoint_path)
+    done_before, failed_before = checkpoint.done, checkpoint.failed
+    limiter = RateLimiter(settings.reextract_rate if rate is None else rate)
+    in_flight: set[Future] = set()
+    started = 0
+
+    db = session_factory()
+    try:
+        rows = stream_receipt_files(db, after=checkpoint.after, user_id=user_id, batch_size=batch_size)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reextract") as executor:
+            for row in rows:
+                if limit is not None and started >= limit:
+                    break
+                # Keep a couple of files queued per thread instead of draining the cursor into memory.
+                while len(in_flight) >= 2 * workers:
+                    _finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                limiter.wait(stop)
+                if stop.is_set():
+                    break
+                position = (row.created_at, row.id)
+                checkpoint.start(position)
+                future = executor.submit(_reextract_file, session_factory, row.id, row.user_id, row.currency)
+                future.add_done_callback(lambda done, position=position: checkpoint.finish(position, done.result()))
+                in_flight.add(future)
+                started += 1
+    finally:
+        db.close()
+    stats = ReextractStats(done=checkpoint.done - done_before, failed=checkpoint.failed - failed_before)
+    logger.info(
+        "Re-extracted %d file(s), %d failed (%d and %d since the checkpoint was created)",
+        stats.done,
+        stats.failed,
+        checkpoint.done,
+        checkpoint.failed,
+    )
+    return stats
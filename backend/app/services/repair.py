@@ -0,0 +1,70 @@
+"""Checks on the fields an LLM returned, and what to ask it again.
+
+`ReceiptFields` accepts any string for enum-like fields and rejects a whole
+extraction over one unparseable date. Instead, each field is checked on its
+own (type, enum values, currency and card digit formats), amounts are
+cross-checked (`subtotal + tax == total`) and required fields must be
+present. `extract_receipt` re-asks the LLM for just the fields found wanting,
+with only the OCR lines that bear on them; whatever is still invalid after
+that is dropped rather than failing the extraction.
+"""
+import re
+from typing import Any, Sequence
+
+from pydantic import ValidationError
+
+from app.models.enums import CardType, PaymentType, ReceiptCategory
+from app.schemas.receipt import ReceiptFields
+
+
+FIELD_ENUMS = {"category": ReceiptCategory, "payment_type": PaymentType, "card_type": CardType}
+
+AMOUNT_FIELDS = ("subtotal", "tax", "total")
+# Receipts print amounts to the cent; allow for float noise only.
+AMOUNT_TOLERANCE = 0.011
+
+MISSING = "missing"
+
+_KINDS = {"purchased_at": "an ISO 8601 date", **dict.fromkeys(AMOUNT_FIELDS, "a number")}
+_CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+_CARD_LAST4_RE = re.compile(r"^\d{4}$")
+
+
+def invalid_fields(extracted: dict[str, Any]) -> dict[str, str]:
+    """Fields whose value cannot be stored as is, with the reason."""
+    invalid: dict[str, str] = {}
+    for name, value in extracted.items():
+        if value is None or name not in ReceiptFields.model_fields:
+            continue
+        try:
+            ReceiptFields.model_validate({name: value})
+        except ValidationError:
+            invalid[name] = f"{value!r} is not {_KINDS.get(name, 'text')}"
+            continue
+        if name in FIELD_ENUMS and value not in {item.value for item in FIELD_ENUMS[name]}:
+            invalid[name] = f"{value!r} is not one of: {', '.join(item.value for item in FIELD_ENUMS[name])}"
+        elif name == "currency" and not _CURRENCY_RE.match(str(value)):
+            invalid[name] = f"{value!r} is not a 3-letter ISO 4217 code"
+        elif name == "card_last4" and not _CARD_LAST4_RE.match(str(value)):
+            invalid[name] = f"{value!r} is not 4 digits"
+    return invalid
+
+
+def find_problems(extracted: dict[str, Any], required: Sequence[str]) -> dict[str, str]:
+    """Fields to ask the LLM for again: invalid, inconsistent or missing, each with the reason."""
+    problems = invalid_fields(extracted)
+    amounts = [extracted.get(name) for name in AMOUNT_FIELDS]
+    if None not in amounts and not problems.keys() & set(AMOUNT_FIELDS):
+        subtotal, tax, total = (float(value) for value in amounts)
+        if abs(subtotal + tax - total) > AMOUNT_TOLERANCE:
+            reason = f"subtotal {subtotal:.2f} + tax {tax:.2f} does not equal total {total:.2f}"
+            problems.update(dict.fromkeys(AMOUNT_FIELDS, reason))
+    for name in required:
+        if extracted.get(name) in (None, ""):
+            problems.setdefault(name, MISSING)
+    return problems
+
+
+def drop_invalid(extracted: dict[str, Any]) -> dict[str, Any]:
+    """`extracted` with values that cannot be stored set to None."""
+    return {**extracted, **dict.fromkeys(invalid_fields(extracted))}
@@ -0,0 +1,311 @@
+"""Rule-based receipt field extraction.
+
+Totals, tax, dates, card digits and reference numbers are printed in a small
+number of formats, so compiled patterns over the OCR text recover them without
+an LLM call. Every field gets a confidence; amounts that pass the
+`subtotal + tax == total` cross-check are trusted most. `extract_receipt` uses
+confident fields to skip the LLM, or to ask it only for what is left.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterable
+
+from app.core.config import settings
+from app.services import metrics
+
+
+# Confidence of a field only the LLM produced (nothing to cross-check it with).
+LLM_FIELD_CONFIDENCE = 0.7
+
+_AMOUNT_RE = re.compile(r"(?<![\d.])\$?\s?(\d{1,3}(?:,\d{3})+\.\d{2}|\d+\.\d{2})(?![\d%]|\s*%)")
+_SUBTOTAL_RE = re.compile(r"\bsub[\s-]?total\b", re.IGNORECASE)
+_TAX_TOTAL_RE = re.compile(r"\b(?:total\s+tax|tax\s+total)\b", re.IGNORECASE)
+_TAX_RE = re.compile(r"\b(?:h\.?s\.?t|g\.?s\.?t|p\.?s\.?t|q\.?s\.?t|tax|vat)\b", re.IGNORECASE)
+_TOTAL_RE = re.compile(r"\b(?:grand\s+)?total\b|\b(?:amount|balance)\s+due\b", re.IGNORECASE)
+_NOT_TOTAL_RE = re.compile(r"\b(?:savings?|saved|discount|items?|qty|tip)\b", re.IGNORECASE)
+_LETTER_RE = re.compile(r"[a-z]", re.IGNORECASE)
+
+_MONTHS = {
+    name: index
+    for index, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+    )
+}
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_DATE_YMD_RE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_DATE_NUMERIC_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})\b")
+_DATE_DAY_MONTH_RE = re.compile(rf"\b(\d{{1,2}})[\s-]+{_MONTH}[\s,-]+(\d{{4}})\b", re.IGNORECASE)
+_DATE_MONTH_DAY_RE = re.compile(rf"\b{_MONTH}\s+(\d{{1,2}}),?\s+(\d{{4}})\b", re.IGNORECASE)
+_TIME_RE = re.compile(r"\b(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([ap]\.?m\.?)?", re.IGNORECASE)
+
+_CARD_LAST4_RE = re.compile(r"(?:[*xX#•]{2,}[\s*xX#•-]*)(\d{4})\b")
+_ID = r"\s*(?:no\.?|num(?:ber)?|code|#)?\s*[:#.]?\s*(?=[A-Z0-9-]*\d)([A-Z0-9][A-Z0-9-]{2,19})\b"
+_AUTH_RE = re.compile(r"\b(?:auth(?:ori[sz]ation)?|appr(?:oval)?)(?![a-z])" + _ID, re.IGNORECASE)
+_REF_RE = re.compile(r"\bref(?:erence)?(?![a-z])" + _ID, re.IGNORECASE)
+_INVOICE_RE = re.compile(r"\b(?:invoice|inv)(?![a-z])" + _ID, re.IGNORECASE)
+_PAYMENT_RE = re.compile(
+    r"\b(?:visa|master\s*card|mc|amex|american\s+express|discover|debit|credit|interac|card|cash|"
+    r"tend(?:er)?|apple\s*pay|google\s*pay)\b",
+    re.IGNORECASE,
+)
+
+# OCR lines worth showing the LLM again when it got a field wrong.
+_FIELD_LINE_PATTERNS: dict[str, tuple[re.Pattern, ...]] = {
+    "subtotal": (_SUBTOTAL_RE,),
+    "tax": (_TAX_RE, _TAX_TOTAL_RE),
+    "total": (_TOTAL_RE,),
+    "purchased_at": (_DATE_YMD_RE, _DATE_NUMERIC_RE, _DATE_DAY_MONTH_RE, _DATE_MONTH_DAY_RE),
+    "card_last4": (_CARD_LAST4_RE, _PAYMENT_RE),
+    "card_type": (_PAYMENT_RE,),
+    "payment_type": (_PAYMENT_RE,),
+    "auth_number": (_AUTH_RE,),
+    "ref_number": (_REF_RE,),
+    "invoice_number": (_INVOICE_RE,),
+}
+# Name, address and kind of store are printed at the top.
+_HEADER_FIELDS = ("vendor_name", "location", "category")
+HEADER_LINES = 5
+
+
+@dataclass
+class RuleExtraction:
+    fields: dict[str, Any] = field(default_factory=dict)
+    confidence: dict[str, float] = field(default_factory=dict)
+
+    def set(self, name: str, value: Any, confidence: float) -> None:
+        self.fields[name] = value
+        self.confidence[name] = confidence
+
+    def confident(self, threshold: float) -> dict[str, Any]:
+        return {name: value for name, value in self.fields.items() if self.confidence[name] >= threshold}
+
+
+def _last_amount(line: str) -> float | None:
+    matches = _AMOUNT_RE.findall(line)
+    if not matches:
+        return None
+    return float(matches[-1].replace(",", ""))
+
+
+def _labelled_amounts(lines: list[str]) -> dict[str, list[float]]:
+    found: dict[str, list[float]] = {"subtotal": [], "tax_total": [], "tax": [], "total": []}
+    for index, line in enumerate(lines):
+        if _SUBTOTAL_RE.search(line):
+            label = "subtotal"
+        elif _TAX_TOTAL_RE.search(line):
+            label = "tax_total"
+        elif _TAX_RE.search(line) and not _TOTAL_RE.search(line):
+            label = "tax"
+        elif _TOTAL_RE.search(line) and not _NOT_TOTAL_RE.search(line):
+            label = "total"
+        else:
+            continue
+        amount = _last_amount(line)
+        if amount is None and index + 1 < len(lines) and not _LETTER_RE.search(lines[index + 1]):
+            # OCR often splits "TOTAL" and its amount into separate lines.
+            amount = _last_amount(lines[index + 1])
+        if amount is not None:
+            found[label].append(amount)
+    return found
+
+
+def _extract_amounts(lines: list[str], result: RuleExtraction) -> None:
+    found = _labelled_amounts(lines)
+    subtotal = found["subtotal"][0] if found["subtotal"] else None
+    if found["tax_total"]:
+        tax = found["tax_total"][0]
+    elif found["tax"]:
+        # GST + PST (or similar) printed on separate lines.
+        tax = round(sum(found["tax"]), 2)
+    else:
+        tax = None
+    totals = found["total"]
+
+    total = None
+    if totals:
+        total = max(totals)
+        if subtotal is not None and tax is not None:
+            expected = round(subtotal + tax, 2)
+            total = next((value for value in totals if abs(value - expected) < 0.005), total)
+
+    if total is None:
+        base = 0.6
+    elif subtotal is not None and tax is not None:
+        base = 0.99 if abs(subtotal + tax - total) < 0.005 else 0.5
+    elif subtotal is not None:
+        # No tax line: a tax-free purchase shows subtotal == total.
+        base = 0.95 if abs(subtotal - total) < 0.005 else 0.6
+    else:
+        base = 0.8 if len(set(totals)) == 1 else 0.6
+
+    for name, value in (("total", total), ("subtotal", subtotal), ("tax", tax)):
+        if value is not None:
+            result.set(name, value, base)
+
+
+def _year(value: str) -> int:
+    year = int(value)
+    return year + 2000 if year < 100 else year
+
+
+def _parse_date(line: str) -> tuple[datetime, float] | None:
+    candidates: list[tuple[int, int, int, float]] = []
+    for match in _DATE_YMD_RE.finditer(line):
+        candidates.append((int(match[1]), int(match[2]), int(match[3]), 0.95))
+    for match in _DATE_DAY_MONTH_RE.finditer(line):
+        candidates.append((int(match[3]), _MONTHS[match[2].lower()[:3]], int(match[1]), 0.95))
+    for match in _DATE_MONTH_DAY_RE.finditer(line):
+        candidates.append((int(match[3]), _MONTHS[match[1].lower()[:3]], int(match[2]), 0.95))
+    for match in _DATE_NUMERIC_RE.finditer(line):
+        first, second, year = int(match[1]), int(match[2]), _year(match[3])
+        if first > 12:
+            candidates.append((year, second, first, 0.9))
+        elif second > 12:
+            candidates.append((year, first, second, 0.9))
+        else:
+            # 03/04/2024 could be either; POS terminals mostly print MM/DD.
+            candidates.append((year, first, second, 0.6))
+
+    for year, month, day, confidence in candidates:
+        try:
+            parsed = datetime(year, month, day)
+        except ValueError:
+            continue
+        time_match = _TIME_RE.search(line)
+        if time_match:
+            hour, minute, second = int(time_match[1]), int(time_match[2]), int(time_match[3] or 0)
+            meridiem = (time_match[4] or "").lower().replace(".", "")
+            if meridiem == "pm" and hour < 12:
+                hour += 12
+            elif meridiem == "am" and hour == 12:
+                hour = 0
+            if hour < 24 and minute < 60 and second < 60:
+                parsed = parsed.replace(hour=hour, minute=minute, second=second)
+        return parsed, confidence
+    return None
+
+
+def _first_match(pattern: re.Pattern, lines: list[str]) -> str | None:
+    for line in lines:
+        match = pattern.search(line)
+        if match:
+            return match.group(1).upper()
+    return None
+
+
+def extract_fields(ocr_text: str) -> RuleExtraction:
+    """Pull the fields that have a fixed printed format out of OCR text."""
+    lines = [line.strip() for line in ocr_text.splitlines() if line.strip()]
+    result = RuleExtraction()
+    _extract_amounts(lines, result)
+
+    for line in lines:
+        parsed = _parse_date(line)
+        if parsed is not None:
+            result.set("purchased_at", parsed[0].isoformat(), parsed[1])
+            break
+
+    last4 = _first_match(_CARD_LAST4_RE, lines)
+    if last4 is not None:
+        result.set("card_last4", last4, 0.95)
+    for name, pattern in (("auth_number", _AUTH_RE), ("ref_number", _REF_RE), ("invoice_number", _INVOICE_RE)):
+        value = _first_match(pattern, lines)
+        if value is not None:
+            result.set(name, value, 0.9)
+    return result
+
+
+def printed_fields(ocr_text: str) -> set[str]:
+    """Fields with a line in the OCR text that looks like it holds them (labels, dates, card digits...)."""
+    return {
+        name
+        for name, patterns in _FIELD_LINE_PATTERNS.items()
+        if any(pattern.search(line) for pattern in patterns for line in ocr_text.splitlines())
+    }
+
+
+def lines_for_fields(ocr_text: str, fields: Iterable[str]) -> str:
+    """The OCR lines that bear on `fields`, in receipt order; all of them when none do."""
+    lines = [line.strip() for line in ocr_text.splitlines() if line.strip()]
+    keep: set[int] = set()
+    for name in fields:
+        if name in _HEADER_FIELDS:
+            keep.update(range(min(HEADER_LINES, len(lines))))
+        for pattern in _FIELD_LINE_PATTERNS.get(name, ()):
+            for index, line in enumerate(lines):
+                if pattern.search(line):
+                    keep.add(index)
+                    if index + 1 < len(lines) and not _LETTER_RE.search(lines[index + 1]):
+                        # The amount of a label is often OCR'd onto the next line.
+                        keep.add(index + 1)
+    if not keep:
+        return "\n".join(lines)
+    return "\n".join(lines[index] for index in sorted(keep))
+
+
+def required_fields() -> list[str]:
+    return [name.strip() for name in settings.rules_required_fields.split(",") if name.strip()]
+
+
+def _same_value(name: str, left: Any, right: Any) -> bool:
+    if name == "purchased_at":
+        return str(left)[:10] == str(right)[:10]
+    if isinstance(right, float):
+        try:
+            return abs(float(left) - right) < 0.005
+        except (TypeError, ValueError):
+            return False
+    return str(left).strip().upper() == str(right).upper()
+
+
+def score_fields(extracted: dict[str, Any], rules: RuleExtraction) -> float:
+    """Overall confidence: the mean per-field confidence of the extracted values.
+
+    Fields the rules found keep the rule confidence; an LLM value that agrees
+    with a (less confident) rule match is trusted more, one that disagrees less.
+    """
+    scores = []
+    for name, value in extracted.items():
+        if value is None or value == "" or name == "currency":
+            continue
+        if name not in rules.fields:
+            scores.append(LLM_FIELD_CONFIDENCE)
+        elif _same_value(name, value, rules.fields[name]):
+            scores.append(max(rules.confidence[name], 0.9))
+        else:
+            scores.append(0.5)
+    return round(sum(scores) / len(scores), 2) if scores else 0.0
+
+
+class RulesStats:
+    """Counts how often rules let an extraction skip or shrink the LLM call.
+
+    Outcomes are also exported as receipt_rules_extractions_total.
+    """
+
+    OUTCOMES = ("skipped", "partial", "full")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.OUTCOMES, 0)
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+        metrics.observe_rules(outcome)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = sum(self._counts.values())
+            stats: dict[str, Any] = {"extractions": total}
+            stats.update({f"llm_{outcome}": count for outcome, count in self._counts.items()})
+            stats["llm_avoided_rate"] = self._counts["skipped"] / total if total else 0.0
+            # Share of extractions where rules settled at least some fields for the LLM.
+            reduced = self._counts["skipped"] + self._counts["partial"]
+            stats["llm_reduced_rate"] = reduced / total if total else 0.0
+            return stats
+
+
+rules_stats = RulesStats()
@@ -0,0 +1,307 @@
+"""Shadow evaluation of a candidate model or OCR tier on live extractions.
+
+Before switching OLLAMA_MODEL (or OCR_TIER_MODE), set SHADOW_MODEL (and/or
+SHADOW_OCR_TIER_MODE) and SHADOW_SAMPLE_RATE. That fraction of completed
+extractions is run again with the candidate on a background thread, after
+the primary result has been saved, so callers never wait for it. When only
+the model differs, the candidate gets the primary's OCR text, so both models
+read the same input. Results go to `shadow_extractions` with per-field
+agreement against the primary; the user's confirmed receipt, which may come
+much later, is joined in when `python -m app.cli shadow-report` compares
+p50/p95 stage latency, tokens and per-field accuracy.
+
+At most SHADOW_MAX_PENDING runs wait for one of SHADOW_WORKERS threads;
+beyond that samples are dropped (and counted) rather than queued.
+"""
+import logging
+import random
+import threading
+import uuid
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.shadow_extraction import stream_shadow_comparisons
+from app.crud.vendor_profile import load_vendor_profiles
+from app.db.session import SessionLocal
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.shadow_extraction import ShadowExtraction
+from app.schemas.receipt import ReceiptFields
+from app.services import extraction as extraction_service
+from app.services import metrics
+from app.services.repair import AMOUNT_FIELDS
+
+
+logger = logging.getLogger(__name__)
+
+# Free-text notes are not expected to match word for word.
+COMPARED_FIELDS = tuple(name for name in extraction_service.PROMPT_FIELDS if name != "notes")
+
+# Stages the candidate can change; a side that skipped one (cache hit, reused OCR text) has no sample.
+OCR_STAGES = ("decode_ms", "grayscale_ms", "crop_ms", "resize_ms", "ocr_ms", "ocr_accurate_ms", "compact_ms")
+LLM_STAGES = ("llm_ms", "repair_ms")
+PERCENTILES = (50, 95)
+
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+_pending = 0
+
+
+def shadow_enabled() -> bool:
+    return settings.shadow_sample_rate > 0 and bool(settings.shadow_model or settings.shadow_ocr_tier_mode)
+
+
+def _normalize(name: str, value: Any) -> Any:
+    value = getattr(value, "value", value)
+    if value is None or value == "":
+        return None
+    if name in AMOUNT_FIELDS:
+        return round(float(value), 2)
+    if name == "purchased_at":
+        # Receipts are compared by day; the time is often missing or guessed.
+        return value.date().isoformat() if isinstance(value, datetime) else str(value)[:10]
+    return " ".join(str(value).split()).casefold()
+
+
+def field_agreement(expected: dict[str, Any], actual: dict[str, Any]) -> dict[str, bool]:
+    """Whether each compared field matches, ignoring case, spacing and time of day.
+
+    Fields empty on both sides are left out.
+    """
+    agreement = {}
+    for name in COMPARED_FIELDS:
+        left, right = _normalize(name, expected.get(name)), _normalize(name, actual.get(name))
+        if left is not None or right is not None:
+            agreement[name] = left == right
+    return agreement
+
+
+def _run_candidate(
+    db: Session, extraction: ReceiptExtraction, model: str | None, ocr_tier_mode: str | None
+) -> extraction_service.ExtractionResult:
+    vendor_profiles = load_vendor_profiles(db, extraction.user_id) if settings.vendor_profiles_enabled else None
+    ocr_text, ocr_tier, currency = extraction.raw_ocr_text, extraction.ocr_tier, extraction.currency
+    layout = extraction.ocr_layout
+    file_path = extraction.receipt_file.file_path
+    # Hand the connection back while the candidate runs.
+    db.commit()
+    if ocr_tier_mode is None and ocr_text is not None:
+        return extraction_service.extract_from_ocr_text(
+            ocr_text, currency, ocr_tier, vendor_profiles=vendor_profiles, model=model, layout=layout
+        )
+    return extraction_service.extract_receipt(
+        file_path, currency, vendor_profiles=vendor_profiles, model=model, ocr_tier_mode=ocr_tier_mode
+    )
+
+
+def run_shadow(extraction_id: uuid.UUID, session_factory: Callable[[], Session] = SessionLocal) -> None:
+    """Run the candidate on a completed extraction and store the outcome in `shadow_extractions`."""
+    from app.services.extraction_jobs import describe_error
+
+    model, ocr_tier_mode = settings.shadow_model, settings.shadow_ocr_tier_mode
+    db = session_factory()
+    try:
+        extraction = db.get(ReceiptExtraction, extraction_id)
+        primary = extraction.extracted_json or {}
+        shadow = ShadowExtraction(
+            extraction_id=extraction.id,
+            user_id=extraction.user_id,
+            candidate_model=model,
+            candidate_ocr_tier_mode=ocr_tier_mode,
+        )
+        try:
+            result = _run_candidate(db, extraction, model, ocr_tier_mode)
+            extracted = ReceiptFields.model_validate(result.extracted).model_dump(mode="json")
+        except Exception as exc:
+            logger.warning("Shadow run of extraction %s failed", extraction_id, exc_info=True)
+            shadow.status = ExtractionStatus.failed
+            shadow.last_error = describe_error(exc)
+            metrics.observe_shadow("failed")
+        else:
+            shadow.status = ExtractionStatus.completed
+            shadow.model_name = result.model_name
+            shadow.extracted_json = extracted
+            shadow.agreement = field_agreement(primary, extracted)
+            shadow.timings = result.timings
+            shadow.prompt_tokens = result.prompt_tokens
+            shadow.completion_tokens = result.completion_tokens
+            metrics.observe_shadow("done")
+        db.add(shadow)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run(extraction_id: uuid.UUID) -> None:
+    try:
+        run_shadow(extraction_id)
+    except Exception:
+        logger.exception("Shadow run of extraction %s could not be stored", extraction_id)
+
+
+def _finished(_future: Future) -> None:
+    # Also called for runs cancelled at shutdown.
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def maybe_shadow(extraction: ReceiptExtraction) -> bool:
+    """Sample a completed extraction for a background run of the candidate; True when one was queued."""
+    global _executor, _pending
+    if not shadow_enabled() or random.random() >= settings.shadow_sample_rate:
+        return False
+    with _lock:
+        if _pending >= settings.shadow_max_pending:
+            metrics.observe_shadow("skipped")
+            return False
+        _pending += 1
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, settings.shadow_workers), thread_name_prefix="shadow")
+        executor = _executor
+    executor.submit(_run, extraction.id).add_done_callback(_finished)
+    return True
+
+
+def shutdown_shadow() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        # Queued samples are dropped; the one running is finished and stored.
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linearly interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _stage_ms(timings: dict[str, Any] | None, stages: tuple[str, ...]) -> float | None:
+    present = [timings[key] for key in stages if key in (timings or {})]
+    return sum(present) if present else None
+
+
+@dataclass
+class SideStats:
+    """Latency, tokens and accuracy of one side (primary or shadow) over the compared extractions."""
+
+    ocr_ms: list[float] = field(default_factory=list)
+    llm_ms: list[float] = field(default_factory=list)
+    prompt_tokens: list[int] = field(default_factory=list)
+    completion_tokens: list[int] = field(default_factory=list)
+    # {field: [matches the confirmed receipt, ...]}
+    correct: dict[str, list[bool]] = field(default_factory=dict)
+
+    def add(self, timings: dict | None, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+        for samples, stages in ((self.ocr_ms, OCR_STAGES), (self.llm_ms, LLM_STAGES)):
+            value = _stage_ms(timings, stages)
+            if value is not None:
+                samples.append(value)
+        if prompt_tokens is not None:
+            self.prompt_tokens.append(prompt_tokens)
+        if completion_tokens is not None:
+            self.completion_tokens.append(completion_tokens)
+
+
+@dataclass
+class CandidateReport:
+    candidate_model: str | None
+    candidate_ocr_tier_mode: str | None
+    runs: int = 0
+    failed: int = 0
+    confirmed: int = 0
+    primary: SideStats = field(default_factory=SideStats)
+    shadow: SideStats = field(default_factory=SideStats)
+    # {field: [shadow matches the primary, ...]}
+    agreement: dict[str, list[bool]] = field(default_factory=dict)
+
+
+def _extend(target: dict[str, list[bool]], matches: dict[str, bool]) -> None:
+    for name, match in matches.items():
+        target.setdefault(name, []).append(match)
+
+
+def build_report(rows: Iterable) -> list[CandidateReport]:
+    """Aggregate `(shadow, primary, confirmed receipt or None)` rows per candidate."""
+    reports: dict[tuple, CandidateReport] = {}
+    for shadow, primary, receipt in rows:
+        key = (shadow.candidate_model, shadow.candidate_ocr_tier_mode)
+        report = reports.setdefault(key, CandidateReport(*key))
+        report.runs += 1
+        if shadow.status != ExtractionStatus.completed:
+            report.failed += 1
+            continue
+        report.primary.add(primary.timings, primary.prompt_tokens, primary.completion_tokens)
+        report.shadow.add(shadow.timings, shadow.prompt_tokens, shadow.completion_tokens)
+        _extend(report.agreement, shadow.agreement or {})
+        if receipt is not None:
+            report.confirmed += 1
+            confirmed = {name: getattr(receipt, name) for name in COMPARED_FIELDS}
+            _extend(report.primary.correct, field_agreement(confirmed, primary.extracted_json or {}))
+            _extend(report.shadow.correct, field_agreement(confirmed, shadow.extracted_json or {}))
+    return list(reports.values())
+
+
+def shadow_report(db: Session, since: datetime | None = None) -> list[CandidateReport]:
+    return build_report(stream_shadow_comparisons(db, since))
+
+
+def _share(matches: Iterable[bool]) -> str:
+    matches = list(matches)
+    return f"{sum(matches) / len(matches) * 100:.1f}%" if matches else "n/a"
+
+
+def _all(by_field: dict[str, list[bool]]) -> list[bool]:
+    return [match for matches in by_field.values() for match in matches]
+
+
+def _latency(primary: list[float], shadow: list[float]) -> str:
+    def value(samples: list[float], q: float) -> str:
+        return f"{percentile(samples, q):.1f}ms" if samples else "n/a"
+
+    return " ".join(f"p{q} {value(primary, q)}->{value(shadow, q)}" for q in PERCENTILES)
+
+
+def _mean(values: list[int]) -> str:
+    return f"{sum(values) / len(values):.1f}" if values else "n/a"
+
+
+def format_report(reports: list[CandidateReport]) -> list[str]:
+    """Readable lines, primary -> shadow, one block per candidate."""
+    if not reports:
+        return ["No shadow runs yet; set SHADOW_MODEL or SHADOW_OCR_TIER_MODE and SHADOW_SAMPLE_RATE."]
+    lines = []
+    for report in reports:
+        primary, shadow = report.primary, report.shadow
+        lines.append(
+            f"candidate model={report.candidate_model or '-'} ocr={report.candidate_ocr_tier_mode or '-'}: "
+            f"{report.runs} run(s), {report.failed} failed, {report.confirmed} with a confirmed receipt"
+        )
+        lines.append(f"  ocr        {_latency(primary.ocr_ms, shadow.ocr_ms)}")
+        lines.append(f"  llm        {_latency(primary.llm_ms, shadow.llm_ms)}")
+        lines.append(
+            f"  tokens     prompt {_mean(primary.prompt_tokens)}->{_mean(shadow.prompt_tokens)} "
+            f"completion {_mean(primary.completion_tokens)}->{_mean(shadow.completion_tokens)} (mean)"
+        )
+        lines.append(
+            f"  fields     {_share(_all(report.agreement))} agree with the primary, "
+            f"{_share(_all(primary.correct))}->{_share(_all(shadow.correct))} match the confirmed receipt"
+        )
+        for name in COMPARED_FIELDS:
+            if name in report.agreement or name in primary.correct:
+                lines.append(
+                    f"    {name:<15} agree {_share(report.agreement.get(name, []))} "
+                    f"correct {_share(primary.correct.get(name, []))}->{_share(shadow.correct.get(name, []))}"
+                )
+    return lines
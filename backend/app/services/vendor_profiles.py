@@ -0,0 +1,110 @@
+"""Per-user vendor profiles built from confirmed receipts.
+
+People go back to the same gas stations and coffee shops, and every receipt
+from one of them has the same category, location, currency and usually the
+same card. A profile counts, per normalised vendor name, how often each value
+of those fields appeared on the user's confirmed receipts. When a line near
+the top of the OCR text names a vendor the user has confirmed at least
+VENDOR_PROFILE_MIN_RECEIPTS times, the values held by at least
+VENDOR_PROFILE_MIN_SHARE of those receipts are filled in before the LLM runs,
+so it is asked only for what varies (or skipped, as with rule fields).
+
+Counts rather than a single value let a profile be updated incrementally:
+editing a receipt takes its old values out and puts the new ones in.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+
+PROFILE_FIELDS = ("category", "location", "currency", "payment_type", "card_type", "card_last4")
+
+# Store numbers and legal suffixes differ between branches of the same vendor.
+_STORE_NUMBER_RE = re.compile(r"(?:#|\bno\.?|\bstore)\s*\d+|\b\d+\b", re.IGNORECASE)
+_SUFFIX_RE = re.compile(r"\b(?:inc|ltd|llc|corp|co|limited)\b")
+_PUNCTUATION_RE = re.compile(r"[^\w&]+")
+
+# Longest vendor name, in words, tried against a header line.
+MAX_NAME_WORDS = 6
+
+
+def normalize_vendor(name: str) -> str:
+    text = _STORE_NUMBER_RE.sub(" ", name.lower())
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return " ".join(_SUFFIX_RE.sub(" ", text).split())
+
+
+@dataclass
+class ReceiptSnapshot:
+    """What a confirmed receipt contributes to its vendor's profile."""
+
+    vendor_key: str
+    vendor_name: str
+    values: dict[str, str] = field(default_factory=dict)
+
+
+def receipt_snapshot(receipt: Any) -> ReceiptSnapshot | None:
+    """The profile contribution of `receipt`; None for drafts and receipts without a usable vendor."""
+    if getattr(receipt.status, "value", receipt.status) != "confirmed" or not receipt.vendor_name:
+        return None
+    key = normalize_vendor(receipt.vendor_name)
+    if not key:
+        return None
+    values = {}
+    for name in PROFILE_FIELDS:
+        value = getattr(receipt, name)
+        if value is not None and value != "":
+            values[name] = str(getattr(value, "value", value))
+    return ReceiptSnapshot(vendor_key=key, vendor_name=receipt.vendor_name, values=values)
+
+
+def add_counts(stats: dict[str, dict[str, int]], values: dict[str, str], sign: int) -> dict[str, dict[str, int]]:
+    """Return `stats` with `values` counted in (`sign=1`) or out (`sign=-1`)."""
+    updated = {name: dict(counts) for name, counts in stats.items()}
+    for name, value in values.items():
+        counts = updated.setdefault(name, {})
+        counts[value] = counts.get(value, 0) + sign
+        if counts[value] <= 0:
+            del counts[value]
+        if not counts:
+            del updated[name]
+    return updated
+
+
+def usual_fields(stats: dict[str, dict[str, int]], receipt_count: int, min_share: float) -> dict[str, str]:
+    """Fields whose most common value covers at least `min_share` of the vendor's receipts."""
+    usual = {}
+    for name, counts in stats.items():
+        value, count = max(counts.items(), key=lambda item: item[1])
+        if receipt_count and count / receipt_count >= min_share:
+            usual[name] = value
+    return usual
+
+
+@dataclass
+class VendorMatch:
+    vendor_name: str
+    fields: dict[str, str]
+
+
+class VendorProfiles:
+    """One user's known vendors, keyed by normalised name."""
+
+    def __init__(self, vendors: dict[str, VendorMatch]) -> None:
+        self.vendors = vendors
+
+    def __len__(self) -> int:
+        return len(self.vendors)
+
+    def match(self, ocr_text: str, header_lines: int) -> VendorMatch | None:
+        """Find a known vendor named at the start of one of the first `header_lines` lines."""
+        if not self.vendors:
+            return None
+        for line in ocr_text.splitlines()[:header_lines]:
+            words = normalize_vendor(line).split()
+            # Longest first, so "shell canada" wins over "shell".
+            for end in range(min(len(words), MAX_NAME_WORDS), 0, -1):
+                found = self.vendors.get(" ".join(words[:end]))
+                if found is not None:
+                    return found
+        return None
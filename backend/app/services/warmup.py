@@ -0,0 +1,131 @@
+"""Start-up warm-up of the OCR and LLM models.
+
+The first receipt after a deploy would otherwise pay for loading PaddleOCR
+(and, without a model bundle, downloading it) and for Ollama loading the model
+into memory. `Warmup` does both in a background thread when the app starts:
+it runs one dummy OCR inference (in every pool worker when OCR_WORKERS > 0)
+and sends Ollama the system prompt with `keep_alive`, so the model is resident
+and the prompt prefix is cached. Failed steps are retried until they succeed;
+`/health/ready` reports not-ready until then.
+"""
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Callable
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def _dummy_receipt() -> Any:
+    import cv2
+    import numpy as np
+
+    image = np.full((96, 320, 3), 255, dtype=np.uint8)
+    cv2.putText(image, "TOTAL 1.00", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    return image
+
+
+def warm_ocr() -> None:
+    """Load the first OCR tier and run one inference on a synthetic image."""
+    from app.services.extraction import _get_ocr, _ocr_lock, first_ocr_tier
+    from app.services.ocr_pool import get_ocr_pool
+
+    image = _dummy_receipt()
+    pool = get_ocr_pool()
+    if pool is None:
+        with _ocr_lock:
+            _get_ocr(first_ocr_tier()).ocr(image, cls=settings.ocr_angle_cls)
+        return
+
+    import cv2
+
+    fd, path = tempfile.mkstemp(suffix=".png")
+    os.close(fd)
+    try:
+        cv2.imwrite(path, image)
+        # One task per worker so every process is spawned and has run paddle once.
+        for future in [pool.submit(path) for _ in range(pool.workers)]:
+            future.result()
+    finally:
+        os.unlink(path)
+
+
+def warm_llm() -> None:
+    """Load the Ollama model and cache the system-prompt prefix on every backend."""
+    from app.services.extraction import SYSTEM_PROMPT
+    from app.services.ollama import get_ollama_client
+
+    for backend in get_ollama_client().backends:
+        backend.client.generate(
+            settings.ollama_model,
+            "",
+            system=SYSTEM_PROMPT,
+            options={"num_predict": 1},
+            keep_alive=settings.ollama_keep_alive,
+            stream=False,
+        )
+
+
+class Warmup:
+    """Runs the warm-up steps and tracks per-component readiness."""
+
+    def __init__(self, steps: dict[str, Callable[[], None]] | None = None) -> None:
+        self.steps = steps if steps is not None else {"ocr": warm_ocr, "llm": warm_llm}
+        self._lock = threading.Lock()
+        self._status = dict.fromkeys(self.steps, "pending")
+
+    def run(self, stop_event: threading.Event | None = None) -> None:
+        """Run every step, retrying failures every WARMUP_RETRY_SECONDS until all succeed or `stop_event` is set."""
+        stop = stop_event or threading.Event()
+        pending = list(self.steps)
+        while pending and not stop.is_set():
+            for name in list(pending):
+                try:
+                    self.steps[name]()
+                except Exception as exc:
+                    logger.warning("Warm-up of %s failed: %s", name, exc)
+                    self._set(name, "failed")
+                    continue
+                logger.info("Warm-up of %s done", name)
+                self._set(name, "ready")
+                pending.remove(name)
+            if pending:
+                stop.wait(settings.warmup_retry_seconds)
+
+    def start(self, stop_event: threading.Event | None = None) -> threading.Thread:
+        thread = threading.Thread(target=self.run, args=(stop_event,), name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _set(self, name: str, status: str) -> None:
+        with self._lock:
+            self._status[name] = status
+
+    def status(self) -> dict[str, str]:
+        with self._lock:
+            return dict(self._status)
+
+    @property
+    def ready(self) -> bool:
+        return all(status == "ready" for status in self.status().values())
+
+
+def api_warmup_enabled() -> bool:
+    """Whether the API process warms up; with EXTRACTION_ASYNC only workers run OCR and the LLM."""
+    return settings.warmup_enabled and not settings.extraction_async
+
+
+_warmup: Warmup | None = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> Warmup:
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup()
+        return _warmup
@@ -0,0 +1,98 @@
+"""Extraction worker: `python -m app.worker`.
+
+Polls `receipt_extractions` for pending jobs and runs OCR + LLM outside the
+API process. Any number of workers, on any number of machines, can share the
+same database.
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from typing import Callable
+
+from prometheus_client import start_http_server
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.receipt_extraction import claim_next_extraction
+from app.db.session import SessionLocal
+from app.services.extraction_jobs import run_extraction
+from app.services.recovery import start_recovery
+from app.services.shadow import shutdown_shadow
+from app.services.warmup import get_warmup
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_next(db: Session) -> bool:
+    """Claim and run one pending extraction. Returns False when the queue is empty."""
+    extraction = claim_next_extraction(db)
+    if extraction is None:
+        return False
+    try:
+        run_extraction(db, extraction)
+    except Exception:
+        logger.exception("Extraction %s failed", extraction.id)
+    return True
+
+
+def run_worker(
+    session_factory: Callable[[], Session] = SessionLocal,
+    poll_interval: float | None = None,
+    stop_event: threading.Event | None = None,
+    once: bool = False,
+) -> int:
+    """Drain the queue, sleeping `poll_interval` seconds whenever it is empty.
+
+    With `once=True` the worker exits as soon as the queue is empty, which is
+    handy for cron-style runs and tests. Returns the number of jobs processed.
+    """
+    interval = settings.worker_poll_interval_seconds if poll_interval is None else poll_interval
+    stop = stop_event or threading.Event()
+    processed = 0
+    while not stop.is_set():
+        db = session_factory()
+        try:
+            worked = process_next(db)
+        finally:
+            db.close()
+        if worked:
+            processed += 1
+            continue
+        if once:
+            break
+        stop.wait(interval)
+    return processed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the receipt extraction worker.")
+    parser.add_argument("--poll-interval", type=float, default=None, help="Seconds to sleep when idle.")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    stop_event = threading.Event()
+    # Finish the job in hand on SIGTERM/SIGINT instead of abandoning it mid-run.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stop_event.set())
+
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+    if settings.warmup_enabled:
+        # Jobs claimed meanwhile just wait on the same model load.
+        get_warmup().start(stop_event)
+    if settings.recovery_enabled:
+        start_recovery(stop_event)
+    started = time.monotonic()
+    processed = run_worker(poll_interval=args.poll_interval, stop_event=stop_event, once=args.once)
+    shutdown_shadow()
+    logger.info("Processed %d extraction(s) in %.1fs", processed, time.monotonic() - started)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
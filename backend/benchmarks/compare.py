@@ -0,0 +1,57 @@
+"""Compare two benchmark reports: `python -m benchmarks.compare base.json head.json`.
+
+Prints, per concurrency level, the change in throughput and in each stage's
+p50/p95/p99 from the base run to the head run.
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any
+
+from benchmarks.run import PERCENTILES
+
+
+def _delta(base: float, head: float) -> str:
+    if not base:
+        return "n/a"
+    return f"{(head - base) / base * 100:+.1f}%"
+
+
+def compare(base: dict[str, Any], head: dict[str, Any]) -> list[str]:
+    lines = [f"base {base.get('commit')} -> head {head.get('commit')}"]
+    head_levels = {level["concurrency"]: level for level in head["levels"]}
+    for base_level in base["levels"]:
+        head_level = head_levels.get(base_level["concurrency"])
+        if head_level is None:
+            continue
+        lines.append(
+            f"concurrency={base_level['concurrency']} throughput "
+            f"{base_level['throughput_per_s']} -> {head_level['throughput_per_s']}/s "
+            f"({_delta(base_level['throughput_per_s'], head_level['throughput_per_s'])})"
+        )
+        for stage, base_stats in base_level["stages"].items():
+            head_stats = head_level["stages"].get(stage)
+            if head_stats is None:
+                continue
+            changes = " ".join(
+                f"p{q} {base_stats[f'p{q}']:.1f}->{head_stats[f'p{q}']:.1f}ms "
+                f"({_delta(base_stats[f'p{q}'], head_stats[f'p{q}'])})"
+                for q in PERCENTILES
+            )
+            lines.append(f"  {stage:<10} {changes}")
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON reports.")
+    parser.add_argument("base", type=Path)
+    parser.add_argument("head", type=Path)
+    args = parser.parse_args(argv)
+    base = json.loads(args.base.read_text(encoding="utf-8"))
+    head = json.loads(args.head.read_text(encoding="utf-8"))
+    print("\n".join(compare(base, head)))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
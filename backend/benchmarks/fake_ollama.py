@@ -0,0 +1,129 @@
+"""A local stand-in for the Ollama HTTP API, shared by the benchmarks and the tests.
+
+`delay` models prompt evaluation (time to the first token) and
+`token_delay` the decode time per streamed chunk, so LLM-bound changes can be
+measured without a GPU. Replies are `response_text` (a schema-valid receipt
+by default) in `chunk_size` pieces followed by `tail` (tokens a real model
+might keep generating after the JSON); texts queued in `responses` are served
+first, one per request. Requests, client connections and whether the client
+hung up before the end are recorded.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Every ReceiptFields field, as the app asks Ollama for them.
+REPLY = {
+    "vendor_name": "BENCH STORE",
+    "location": "123 Main St",
+    "purchased_at": "2024-03-05T14:22:00",
+    "category": "other",
+    "subtotal": 10.0,
+    "tax": 1.3,
+    "total": 11.3,
+    "currency": "CAD",
+    "payment_type": "credit_card",
+    "card_type": "visa",
+    "card_last4": "1234",
+    "ref_number": None,
+    "invoice_number": None,
+    "auth_number": None,
+    "notes": None,
+}
+
+
+class FakeOllama:
+    def __init__(
+        self,
+        response_text: str | None = None,
+        delay: float = 0.0,
+        token_delay: float = 0.005,
+        chunk_size: int = 4,
+    ) -> None:
+        self.response_text = json.dumps(REPLY) if response_text is None else response_text
+        self.responses: list[str] = []
+        self.tail = ""
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.token_delay = token_delay
+        self.status = 200
+        self.requests: list[dict] = []
+        self.connections: set[int] = set()
+        self.hung_up = threading.Event()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                fake.connections.add(self.client_address[1])
+                self._send_json(fake.status, {"models": []})
+
+            def do_POST(self):
+                fake.connections.add(self.client_address[1])
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                fake.requests.append(body)
+                if fake.delay:
+                    time.sleep(fake.delay)
+                if fake.status != 200:
+                    self._send_json(fake.status, {"error": "unavailable"})
+                    return
+                text = (fake.responses.pop(0) if fake.responses else fake.response_text) + fake.tail
+                counts = {"prompt_eval_count": len(body.get("prompt", "")) // 4, "eval_count": len(text)}
+                pieces = [text[i:i + fake.chunk_size] for i in range(0, len(text), fake.chunk_size)]
+                if not body.get("stream", True):
+                    time.sleep(fake.token_delay * len(pieces))
+                    self._send_json(200, {"response": text, "done": True, **counts})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                lines = [{"response": piece, "done": False} for piece in pieces]
+                lines.append({"response": "", "done": True, **counts})
+                try:
+                    for line in lines:
+                        data = (json.dumps(line) + "\n").encode("utf-8")
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                        time.sleep(fake.token_delay)
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    fake.hung_up.set()
+                    self.close_connection = True
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeOllama":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
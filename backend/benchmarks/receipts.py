@@ -0,0 +1,89 @@
+"""Synthetic receipt photos for benchmarks.
+
+Each receipt is rendered as black text on a white strip, placed on a darker
+"table" background, rotated a few degrees and sprinkled with sensor noise, at
+a range of photo sizes. The generator is seeded so runs on different commits
+see the same images.
+"""
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+VENDORS = ["COSTCO WHOLESALE", "METRO", "SHOPPERS DRUG MART", "TIM HORTONS", "CANADIAN TIRE", "LOBLAWS"]
+ITEMS = ["MILK 2L", "BREAD", "EGGS DOZEN", "COFFEE", "BATTERIES", "APPLES", "SHAMPOO", "PAPER TOWEL"]
+# Longest side of the rendered photo, in pixels.
+PHOTO_SIZES = (960, 1600, 2400, 3200)
+
+
+@dataclass
+class SyntheticReceipt:
+    path: Path
+    lines: list[str]
+    total: float
+
+
+def receipt_lines(rng: random.Random) -> tuple[list[str], float]:
+    items = [(name, round(rng.uniform(1, 40), 2)) for name in rng.sample(ITEMS, rng.randint(2, 6))]
+    subtotal = round(sum(price for _name, price in items), 2)
+    tax = round(subtotal * 0.13, 2)
+    total = round(subtotal + tax, 2)
+    lines = [
+        rng.choice(VENDORS),
+        f"2024/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d} {rng.randint(8, 21):02d}:{rng.randint(0, 59):02d}",
+        *(f"{name:<16}{price:>8.2f}" for name, price in items),
+        f"{'SUBTOTAL':<16}{subtotal:>8.2f}",
+        f"{'HST 13%':<16}{tax:>8.2f}",
+        f"{'TOTAL':<16}{total:>8.2f}",
+        f"VISA ************{rng.randint(0, 9999):04d}",
+        f"AUTH CODE: {rng.randint(0, 999999):06d}",
+    ]
+    return lines, total
+
+
+def render_receipt(lines: list[str], size: int, angle: float, noise: float, rng: random.Random) -> np.ndarray:
+    """Render `lines` as a photo whose longest side is `size` pixels."""
+    line_height = 40
+    paper = np.full((line_height * (len(lines) + 2), 520), 255, dtype=np.uint8)
+    for index, line in enumerate(lines, start=1):
+        cv2.putText(paper, line, (20, line_height * index + 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2, cv2.LINE_AA)
+
+    # Paper covers about half of the photo so the receipt crop has an outline to find.
+    height = int(paper.shape[0] * 1.6)
+    width = int(paper.shape[1] * 2.2)
+    photo = np.full((height, width), rng.randint(60, 110), dtype=np.uint8)
+    top, left = (height - paper.shape[0]) // 2, (width - paper.shape[1]) // 2
+    photo[top:top + paper.shape[0], left:left + paper.shape[1]] = paper
+
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    photo = cv2.warpAffine(photo, matrix, (width, height), borderValue=int(photo[0, 0]))
+    scale = size / max(height, width)
+    photo = cv2.resize(photo, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+    if noise:
+        grain = np.random.default_rng(rng.randint(0, 2**32 - 1)).normal(0, noise, photo.shape)
+        photo = np.clip(photo.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(photo, cv2.COLOR_GRAY2BGR)
+
+
+def generate_receipts(
+    directory: Path,
+    count: int,
+    seed: int = 0,
+    max_angle: float = 8.0,
+    noise: float = 12.0,
+    sizes: tuple[int, ...] = PHOTO_SIZES,
+) -> list[SyntheticReceipt]:
+    """Write `count` JPEG receipts into `directory`, cycling through `sizes`."""
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    receipts = []
+    for index in range(count):
+        lines, total = receipt_lines(rng)
+        image = render_receipt(lines, sizes[index % len(sizes)], rng.uniform(-max_angle, max_angle), noise, rng)
+        path = directory / f"receipt-{index:04d}.jpg"
+        cv2.imwrite(str(path), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        receipts.append(SyntheticReceipt(path=path, lines=lines, total=total))
+    return receipts
@@ -0,0 +1,295 @@
+"""Extraction latency benchmark: `python -m benchmarks.run`.
+
+Generates synthetic receipt photos, points the app at a local fake Ollama
+with configurable latency and runs `extract_receipt` over every photo at each
+requested concurrency. Reports p50/p95/p99 per stage (decode, preprocess,
+OCR, compaction, rules, LLM, parse, DB write, total), throughput and the
+estimated prompt tokens OCR compaction saved as JSON, so runs on different
+commits can be compared with `python -m benchmarks.compare`.
+
+OCR and LLM caches are disabled so every image pays for real work; other
+settings (OCR_WORKERS, OCR_TIER_MODE, ...) come from the environment as usual.
+"""
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+from app.services import extraction, warmup
+from app.services.ocr_pool import shutdown_ocr_pool
+from app.services.shadow import percentile
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.receipts import PHOTO_SIZES, SyntheticReceipt, generate_receipts
+
+
+# Stage name -> ExtractionResult.timings keys summed into it.
+STAGES = {
+    "decode": ("decode_ms",),
+    "preprocess": ("grayscale_ms", "crop_ms", "resize_ms"),
+    "ocr": ("ocr_ms", "ocr_accurate_ms"),
+    "compact": ("compact_ms",),
+    "rules": ("rules_ms",),
+    "llm": ("llm_ms",),
+    "parse": ("parse_ms",),
+    "db_write": ("db_ms",),
+    "total": ("total_ms",),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def stage_samples(timings: dict[str, float]) -> dict[str, float]:
+    samples = {}
+    for stage, keys in STAGES.items():
+        present = [timings[key] for key in keys if key in timings]
+        if present:
+            samples[stage] = sum(present)
+    if "llm" in samples and "parse" in samples:
+        # llm_ms covers the request and parsing the reply; report them apart.
+        samples["llm"] -= samples["parse"]
+    return samples
+
+
+def summarize(samples: list[dict[str, float]]) -> dict[str, dict[str, float]]:
+    summary = {}
+    for stage in STAGES:
+        values = [sample[stage] for sample in samples if stage in sample]
+        if not values:
+            continue
+        summary[stage] = {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 2),
+            **{f"p{q}": round(percentile(values, q), 2) for q in PERCENTILES},
+            "max": round(max(values), 2),
+        }
+    return summary
+
+
+class DbWriter:
+    """Times persisting each result the way the API and worker do, against DATABASE_URL.
+
+    Rows are written for a throwaway user and deleted again by `close()`.
+    """
+
+    def __init__(self) -> None:
+        from app.crud.user import create_user
+        from app.db.session import SessionLocal
+
+        self.session_factory = SessionLocal
+        with SessionLocal() as db:
+            self.user_id = create_user(db, f"bench-{uuid.uuid4().hex}@example.com", uuid.uuid4().hex).id
+
+    def write(self, receipt: SyntheticReceipt, result: extraction.ExtractionResult) -> float:
+        from app.models.enums import ExtractionStatus
+        from app.models.receipt_extraction import ReceiptExtraction
+        from app.models.receipt_file import ReceiptFile
+        from app.services.extraction_jobs import _apply_result
+
+        with self.session_factory() as db:
+            receipt_file = ReceiptFile(
+                user_id=self.user_id,
+                file_path=str(receipt.path),
+                file_name=receipt.path.name,
+                mime_type="image/jpeg",
+                size_bytes=receipt.path.stat().st_size,
+                sha256=uuid.uuid4().hex,
+            )
+            db.add(receipt_file)
+            db.flush()
+            row = ReceiptExtraction(
+                user_id=self.user_id,
+                receipt_file_id=receipt_file.id,
+                status=ExtractionStatus.processing,
+                model_name=settings.ollama_model,
+            )
+            db.add(row)
+            db.commit()
+            started = time.perf_counter()
+            _apply_result(db, row, result)
+            return round((time.perf_counter() - started) * 1000, 2)
+
+    def close(self) -> None:
+        from app.models.receipt_extraction import ReceiptExtraction
+        from app.models.receipt_file import ReceiptFile
+        from app.models.user import User
+
+        with self.session_factory() as db:
+            for model in (ReceiptExtraction, ReceiptFile):
+                db.query(model).filter(model.user_id == self.user_id).delete()
+            db.query(User).filter(User.id == self.user_id).delete()
+            db.commit()
+
+
+def run_level(
+    receipts: list[SyntheticReceipt], concurrency: int, currency: str | None, writer: DbWriter | None
+) -> dict[str, Any]:
+    ocr_tokens = {"raw": 0, "compact": 0}
+    tokens_lock = threading.Lock()
+
+    def one(receipt: SyntheticReceipt) -> dict[str, float]:
+        started = time.perf_counter()
+        result = extraction.extract_receipt(str(receipt.path), currency)
+        layout = result.ocr_layout or {}
+        if "compact_tokens" in layout:
+            with tokens_lock:
+                ocr_tokens["raw"] += layout["raw_tokens"]
+                ocr_tokens["compact"] += layout["compact_tokens"]
+        timings = dict(result.timings)
+        if writer is not None:
+            timings["db_ms"] = writer.write(receipt, result)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return stage_samples(timings)
+
+    def guarded(receipt: SyntheticReceipt) -> dict[str, float] | Exception:
+        try:
+            return one(receipt)
+        except Exception as exc:
+            return exc
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(guarded, receipts))
+    wall = time.perf_counter() - started
+
+    samples = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    return {
+        "concurrency": concurrency,
+        "images": len(receipts),
+        "errors": len(errors),
+        "error_samples": sorted({repr(error) for error in errors})[:3],
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(samples) / wall, 3) if wall else 0.0,
+        "stages": summarize(samples),
+        "ocr_tokens": ocr_tokens,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def run_benchmark(args: argparse.Namespace, image_dir: Path) -> dict[str, Any]:
+    receipts = generate_receipts(
+        image_dir, args.images, seed=args.seed, max_angle=args.max_angle, noise=args.noise, sizes=tuple(args.sizes)
+    )
+    writer = DbWriter() if args.db else None
+    try:
+        with contextlib.ExitStack() as stack:
+            servers = [
+                stack.enter_context(
+                    FakeOllama(delay=args.llm_latency_ms / 1000, token_delay=args.llm_token_ms / 1000, chunk_size=8)
+                )
+                for _ in range(args.llm_backends)
+            ]
+            settings.ollama_urls = ",".join(server.url for server in servers)
+            settings.llm_cache_backend = "none"
+            settings.ocr_cache_enabled = False
+            if args.no_rules:
+                settings.rules_enabled = False
+            # Model loading is not what we are measuring.
+            warmup.warm_ocr()
+            warmup.warm_llm()
+            levels = [run_level(receipts, concurrency, args.currency, writer) for concurrency in args.concurrency]
+    finally:
+        if writer is not None:
+            writer.close()
+        shutdown_ocr_pool()
+
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "images": args.images,
+            "seed": args.seed,
+            "sizes": args.sizes,
+            "max_angle": args.max_angle,
+            "noise": args.noise,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_token_ms": args.llm_token_ms,
+            "llm_backends": args.llm_backends,
+            "ollama_hedge_after_seconds": settings.ollama_hedge_after_seconds,
+            "db": args.db,
+            "rules_enabled": settings.rules_enabled,
+            "ocr_workers": settings.ocr_workers,
+            "ocr_preprocess": settings.ocr_preprocess,
+            "ocr_tier_mode": settings.ocr_tier_mode,
+            "ocr_compact": settings.ocr_compact,
+            "ollama_stream": settings.ollama_stream,
+            "ollama_structured_output": settings.ollama_structured_output,
+        },
+        "levels": levels,
+    }
+
+
+def _print_table(report: dict[str, Any]) -> None:
+    for level in report["levels"]:
+        print(
+            f"concurrency={level['concurrency']} images={level['images']} errors={level['errors']} "
+            f"throughput={level['throughput_per_s']}/s "
+            f"ocr_tokens={level['ocr_tokens']['raw']}->{level['ocr_tokens']['compact']}",
+            file=sys.stderr,
+        )
+        for stage, stats in level["stages"].items():
+            print(
+                f"  {stage:<10} p50={stats['p50']:>9.1f}ms p95={stats['p95']:>9.1f}ms p99={stats['p99']:>9.1f}ms",
+                file=sys.stderr,
+            )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark receipt extraction latency per stage.")
+    parser.add_argument("--images", type=int, default=24, help="Synthetic receipts to generate.")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4], help="Comma-separated levels.")
+    parser.add_argument("--sizes", type=_int_list, default=list(PHOTO_SIZES), help="Photo long sides, px.")
+    parser.add_argument("--max-angle", type=float, default=8.0, help="Max rotation in degrees.")
+    parser.add_argument("--noise", type=float, default=12.0, help="Gaussian noise sigma (0-255 scale).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake Ollama time to first token.")
+    parser.add_argument("--llm-token-ms", type=float, default=5.0, help="Fake Ollama delay per streamed chunk.")
+    parser.add_argument("--llm-backends", type=int, default=1, help="Fake Ollama instances to route between.")
+    parser.add_argument("--currency", default="CAD")
+    parser.add_argument("--no-rules", action="store_true", help="Disable the rules pass so every image hits the LLM.")
+    parser.add_argument("--db", action="store_true", help="Also time the DB write (uses DATABASE_URL).")
+    parser.add_argument("--image-dir", type=Path, default=None, help="Keep the generated photos here.")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    if args.image_dir is not None:
+        report = run_benchmark(args, args.image_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="receipt-bench-") as directory:
+            report = run_benchmark(args, Path(directory))
+
+    _print_table(report)
+    data = json.dumps(report, indent=2)
+    if args.output is not None:
+        args.output.write_text(data + "\n", encoding="utf-8")
+    else:
+        print(data)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -1,5 +1,5 @@
 import os
-from typing import Generator
+from typing import Callable, Generator
 
 import pytest
 from sqlalchemy import create_engine, event, text
@@ -9,6 +9,7 @@ import app.models  # noqa: F401
 from app.db.base import Base
 from app.db.session import get_db
 from app.main import create_app
+from benchmarks.fake_ollama import FakeOllama
 
 
 TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
@@ -58,3 +59,36 @@ def app(db_session):
     app = create_app()
     app.dependency_overrides[get_db] = lambda: db_session
     return app
+
+
+@pytest.fixture(autouse=True)
+def reset_llm_cache(monkeypatch):
+    # The process-wide LLM cache would otherwise replay responses across tests.
+    monkeypatch.setattr("app.services.llm_cache._cache", None)
+
+
+@pytest.fixture()
+def make_fake_ollama() -> Generator[Callable[[], FakeOllama], None, None]:
+    """Start extra fake Ollama servers (e.g. several backends); all are stopped after the test."""
+    servers: list[FakeOllama] = []
+
+    def make() -> FakeOllama:
+        servers.append(FakeOllama(response_text="{}"))
+        return servers[-1]
+
+    try:
+        yield make
+    finally:
+        for server in servers:
+            server.close()
+
+
+@pytest.fixture()
+def fake_ollama(monkeypatch) -> Generator[FakeOllama, None, None]:
+    server = FakeOllama(response_text="{}")
+    monkeypatch.setattr("app.core.config.settings.ollama_url", server.url)
+    monkeypatch.setattr("app.services.ollama._client", None)
+    try:
+        yield server
+    finally:
+        server.close()
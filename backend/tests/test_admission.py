@@ -0,0 +1,111 @@
+import io
+import threading
+
+import httpx
+import pytest
+
+from app.services import admission
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+def test_admits_up_to_limit_then_queues_then_rejects():
+    controller = admission.AdmissionController(max_concurrent=1, max_waiting=1, wait_timeout=5)
+    holding, release = threading.Event(), threading.Event()
+    order = []
+
+    def hold():
+        with controller.admit():
+            holding.set()
+            release.wait(5)
+            order.append("first")
+
+    def queued():
+        with controller.admit():
+            order.append("second")
+
+    first = threading.Thread(target=hold)
+    first.start()
+    assert holding.wait(5)
+    second = threading.Thread(target=queued)
+    second.start()
+    while controller.stats()["waiting"] == 0:
+        pass
+
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        with controller.admit():
+            pass  # pragma: no cover
+    # No extraction has finished yet: two queued over one slot at the default duration.
+    assert exc.value.retry_after == 2 * admission.DEFAULT_DURATION_SECONDS
+
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert order == ["first", "second"]
+    assert controller.stats() == {"running": 0, "waiting": 0, "rejected": 1}
+
+
+def test_waiting_times_out_and_retry_after_uses_recent_durations():
+    controller = admission.AdmissionController(max_concurrent=2, max_waiting=4, wait_timeout=0.01)
+    controller._durations.extend([1.0, 30.0, 4.0])
+    controller.running = 2
+
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        with controller.admit():
+            pass  # pragma: no cover
+    # Median of recent extractions (4s) for one queued request over two slots.
+    assert exc.value.retry_after == 2
+    assert controller.waiting == 0
+
+    controller._durations.extend([9999.0] * 10)
+    assert controller.retry_after() == admission.MAX_RETRY_AFTER_SECONDS
+
+
+def test_controller_follows_settings(monkeypatch):
+    monkeypatch.setattr(admission, "_controller", None)
+    first = admission.get_admission_controller()
+    assert admission.get_admission_controller() is first
+    monkeypatch.setattr(admission.settings, "extraction_max_waiting", 1)
+    assert admission.get_admission_controller().max_waiting == 1
+
+
+@pytest.mark.asyncio
+async def test_extraction_returns_429_when_saturated_but_crud_still_works(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(admission, "_controller", None)
+    monkeypatch.setattr(admission.settings, "extraction_max_concurrent", 0)
+    monkeypatch.setattr(admission.settings, "extraction_max_waiting", 0)
+    monkeypatch.setattr(admission.settings, "storage_dir", str(tmp_path))
+
+    async with _client(app) as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "busy@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        files = {"file": ("r.jpg", io.BytesIO(b"busy"), "image/jpeg")}
+        rejected = await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+        batch = await client.post(
+            "/api/v1/receipts/extractions/batch", headers=headers, files=[("files", ("r.jpg", io.BytesIO(b"b"), "image/jpeg"))]
+        )
+        listed = await client.get("/api/v1/receipts", headers=headers)
+        # Slots are only taken after authentication.
+        files = {"file": ("r.jpg", io.BytesIO(b"busy"), "image/jpeg")}
+        anonymous = await client.post("/api/v1/receipts/extractions", files=files)
+        forged = await client.post(
+            "/api/v1/receipts/extractions", headers={"Authorization": "Bearer nope"}, files=files
+        )
+
+        monkeypatch.setattr(admission.settings, "extraction_async", True)
+        files = {"file": ("r.jpg", io.BytesIO(b"busy"), "image/jpeg")}
+        queued = await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert batch.status_code == 429
+    assert listed.status_code == 200
+    # HTTPBearer answers a missing header with 403.
+    assert anonymous.status_code == 403
+    assert forged.status_code == 401
+    assert admission.get_admission_controller().rejected == 2
+    # Async uploads only store the file, so they are never throttled.
+    assert queued.status_code == 202
@@ -52,7 +52,7 @@ async def test_auth_refresh_and_invalid_login(app):
 
 @pytest.mark.asyncio
 async def test_receipt_flow(app, monkeypatch, tmp_path):
-    def fake_extract_receipt(_path: str, _currency: str | None):
+    def fake_extract_receipt(_path: str, _currency: str | None, **_kwargs):
         return ExtractionResult(
             ocr_text="Store\nTotal 12.34",
             extracted={"vendor_name": "Sample Store", "total": 12.34, "currency": "CAD"},
@@ -61,7 +61,6 @@ async def test_receipt_flow(app, monkeypatch, tmp_path):
         )
 
     monkeypatch.setattr("app.services.extraction.extract_receipt", fake_extract_receipt)
-    monkeypatch.setattr("app.api.routes.receipts.extract_receipt", fake_extract_receipt)
     monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
 
     transport = httpx.ASGITransport(app=app)
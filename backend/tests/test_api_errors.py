@@ -122,13 +122,13 @@ def test_extraction_direct_call_missing_filename_returns_400(app, db_session):
     user = User(id=uuid.uuid4(), email="x@example.com", password_hash="x")
 
     with pytest.raises(Exception) as exc:
-        create_extraction(file=file, currency=None, db=db_session, current_user=user)
+        create_extraction(file=file, receipt_file_id=None, currency=None, db=db_session, current_user=user)
     assert "File name missing" in str(exc.value)
 
 
 @pytest.mark.asyncio
 async def test_extraction_injects_currency_when_missing(app, monkeypatch, tmp_path):
-    def fake_extract_receipt(_path: str, _currency: str | None):
+    def fake_extract_receipt(_path: str, _currency: str | None, **_kwargs):
         return ExtractionResult(
             ocr_text="Store\nTotal 1.23",
             extracted={"vendor_name": "No Currency", "total": 1.23},
@@ -137,7 +137,6 @@ async def test_extraction_injects_currency_when_missing(app, monkeypatch, tmp_pa
         )
 
     monkeypatch.setattr("app.services.extraction.extract_receipt", fake_extract_receipt)
-    monkeypatch.setattr("app.api.routes.receipts.extract_receipt", fake_extract_receipt)
     monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
 
     async with _client(app) as client:
@@ -157,11 +156,10 @@ async def test_extraction_injects_currency_when_missing(app, monkeypatch, tmp_pa
 
 @pytest.mark.asyncio
 async def test_extraction_failure_sets_status_failed(app, monkeypatch, tmp_path, db_session):
-    def failing_extract(_path: str, _currency: str | None):
+    def failing_extract(_path: str, _currency: str | None, **_kwargs):
         raise RuntimeError("boom")
 
     monkeypatch.setattr("app.services.extraction.extract_receipt", failing_extract)
-    monkeypatch.setattr("app.api.routes.receipts.extract_receipt", failing_extract)
     monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
 
     async with _client(app) as client:
@@ -194,7 +192,7 @@ async def test_create_receipt_rejects_unknown_receipt_file(app):
 
 @pytest.mark.asyncio
 async def test_photo_missing_returns_404(app, monkeypatch, tmp_path, db_session):
-    def fake_extract_receipt(_path: str, _currency: str | None):
+    def fake_extract_receipt(_path: str, _currency: str | None, **_kwargs):
         return ExtractionResult(
             ocr_text="Store\nTotal 12.34",
             extracted={"vendor_name": "Sample Store", "total": 12.34, "currency": "CAD"},
@@ -203,7 +201,6 @@ async def test_photo_missing_returns_404(app, monkeypatch, tmp_path, db_session)
         )
 
     monkeypatch.setattr("app.services.extraction.extract_receipt", fake_extract_receipt)
-    monkeypatch.setattr("app.api.routes.receipts.extract_receipt", fake_extract_receipt)
     monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
 
     async with _client(app) as client:
@@ -0,0 +1,72 @@
+import json
+
+import cv2
+
+from app.schemas.receipt import ReceiptFields
+from app.services import extraction, warmup
+from benchmarks import compare, run
+from benchmarks.fake_ollama import REPLY
+from benchmarks.receipts import generate_receipts
+
+
+def test_generate_receipts_varies_size_and_is_seeded(tmp_path):
+    first = generate_receipts(tmp_path / "a", 3, seed=1, sizes=(320, 640))
+    again = generate_receipts(tmp_path / "b", 3, seed=1, sizes=(320, 640))
+    shapes = [cv2.imread(str(receipt.path)).shape for receipt in first]
+    assert [max(shape[:2]) for shape in shapes] == [320, 640, 320]
+    assert [receipt.lines for receipt in first] == [receipt.lines for receipt in again]
+    assert any(line.startswith("TOTAL") for line in first[0].lines)
+
+
+def test_fake_ollama_replies_with_every_receipt_field():
+    assert set(REPLY) == set(ReceiptFields.model_fields)
+    assert ReceiptFields.model_validate(REPLY).total == 11.3
+
+
+def test_stage_samples():
+    samples = run.stage_samples({"grayscale_ms": 1.0, "resize_ms": 2.0, "llm_ms": 10.0, "parse_ms": 0.5})
+    assert samples == {"preprocess": 3.0, "llm": 9.5, "parse": 0.5}
+
+
+def test_benchmark_reports_stages_per_concurrency(monkeypatch, tmp_path):
+    for name in ("ollama_urls", "llm_cache_backend", "ocr_cache_enabled", "rules_enabled"):
+        monkeypatch.setattr(extraction.settings, name, getattr(extraction.settings, name))
+    monkeypatch.setattr(warmup, "warm_ocr", lambda: None)
+
+    def fake_run_ocr(path, timings, details, **_kwargs):
+        timings.update(decode_ms=1.0, ocr_ms=5.0)
+        return "BENCH STORE\nTotal 1.00"
+
+    monkeypatch.setattr(extraction, "run_ocr", fake_run_ocr)
+    output = tmp_path / "bench.json"
+    args = ["--images", "3", "--sizes", "320", "--concurrency", "1,3", "--llm-latency-ms", "1", "--no-rules"]
+    args += ["--llm-backends", "2"]
+    assert run.main([*args, "--image-dir", str(tmp_path / "images"), "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    assert [level["concurrency"] for level in report["levels"]] == [1, 3]
+    level = report["levels"][0]
+    assert level["errors"] == 0
+    assert set(level["stages"]) == {"decode", "ocr", "llm", "parse", "total"}
+    assert level["stages"]["ocr"]["p95"] == 5.0
+    assert report["config"]["rules_enabled"] is False
+    assert report["config"]["llm_backends"] == 2
+
+    lines = compare.compare(report, report)
+    assert "(+0.0%)" in lines[1]
+    assert any(line.strip().startswith("llm") for line in lines)
+
+
+def test_benchmark_counts_failures(monkeypatch, tmp_path, capsys):
+    for name in ("ollama_urls", "llm_cache_backend", "ocr_cache_enabled"):
+        monkeypatch.setattr(extraction.settings, name, getattr(extraction.settings, name))
+    monkeypatch.setattr(warmup, "warm_ocr", lambda: None)
+
+    def broken(*_args, **_kwargs):
+        raise RuntimeError("no ocr")
+
+    monkeypatch.setattr(extraction, "run_ocr", broken)
+    assert run.main(["--images", "2", "--sizes", "320", "--concurrency", "2", "--llm-latency-ms", "0"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["levels"][0]["errors"] == 2
+    assert report["levels"][0]["error_samples"] == ["RuntimeError('no ocr')"]
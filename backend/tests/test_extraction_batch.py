@@ -0,0 +1,141 @@
+import io
+import threading
+import uuid
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+from app.api.routes.receipts import create_extraction_batch
+from app.models.user import User
+from app.services import extraction
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+async def _headers(client, email: str) -> dict:
+    reg = await client.post("/api/v1/auth/register", json={"email": email, "password": "ChangeMe123!"})
+    return {"Authorization": f"Bearer {reg.json()['access_token']}"}
+
+
+async def _upload_batch(client, headers, contents: list[bytes], **data) -> httpx.Response:
+    files = [("files", (f"r{index}.jpg", io.BytesIO(content), "image/jpeg")) for index, content in enumerate(contents)]
+    return await client.post("/api/v1/receipts/extractions/batch", headers=headers, files=files, data=data)
+
+
+@pytest.fixture()
+def ocr_calls(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_run_ocr(path: str, **_kwargs) -> str:
+        with open(path, "rb") as handle:
+            content = handle.read().decode()
+        calls.append(content)
+        if content == "unreadable":
+            raise RuntimeError("ocr failed")
+        return f"{content}\nTotal 5.00"
+
+    def fake_run_llm(text: str, _currency: str | None, **_kwargs) -> tuple[dict, str]:
+        return {"vendor_name": text.splitlines()[0], "total": 5.0}, "fake-model"
+
+    monkeypatch.setattr("app.services.extraction.run_ocr", fake_run_ocr)
+    monkeypatch.setattr("app.services.extraction.run_llm", fake_run_llm)
+    monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_batch_returns_per_file_results(app, ocr_calls):
+    async with _client(app) as client:
+        headers = await _headers(client, "batch@example.com")
+        response = await _upload_batch(client, headers, [b"alpha", b"unreadable", b"beta", b"alpha"], currency="CAD")
+
+        assert response.status_code == 201
+        items = response.json()["items"]
+        assert [item["status"] for item in items] == ["completed", "failed", "completed", "completed"]
+        assert items[0]["extracted"]["vendor_name"] == "alpha"
+        assert items[0]["extracted"]["currency"] == "CAD"
+        assert items[2]["extracted"]["vendor_name"] == "beta"
+        assert items[3]["extracted"] == items[0]["extracted"]
+        assert items[3]["extraction_id"] != items[0]["extraction_id"]
+        # The duplicate inside the batch is extracted once.
+        assert sorted(ocr_calls) == ["alpha", "beta", "unreadable"]
+
+        fetched = await client.get(f"/api/v1/receipts/extractions/{items[1]['extraction_id']}", headers=headers)
+        assert fetched.json()["status"] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_batch_reuses_earlier_uploads(app, ocr_calls):
+    async with _client(app) as client:
+        headers = await _headers(client, "batch-dedup@example.com")
+        await _upload_batch(client, headers, [b"alpha"])
+        response = await _upload_batch(client, headers, [b"alpha"])
+
+    assert response.status_code == 201
+    assert response.json()["items"][0]["status"] == "completed"
+    assert ocr_calls == ["alpha"]
+
+
+@pytest.mark.asyncio
+async def test_batch_async_returns_job_ids(app, ocr_calls, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.extraction_async", True)
+    async with _client(app) as client:
+        headers = await _headers(client, "batch-async@example.com")
+        response = await _upload_batch(client, headers, [b"alpha", b"beta"])
+
+    assert response.status_code == 202
+    assert [item["status"] for item in response.json()["items"]] == ["pending", "pending"]
+    assert ocr_calls == []
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_too_many_files(app, ocr_calls, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.extraction_batch_max_files", 2)
+    async with _client(app) as client:
+        headers = await _headers(client, "batch-limit@example.com")
+        response = await _upload_batch(client, headers, [b"a", b"b", b"c"])
+
+    assert response.status_code == 413
+    assert ocr_calls == []
+
+
+def test_batch_missing_filename_returns_400(db_session):
+    files = [UploadFile(filename="a.jpg", file=io.BytesIO(b"a")), UploadFile(filename="", file=io.BytesIO(b"b"))]
+    user = User(id=uuid.uuid4(), email="x@example.com", password_hash="x")
+
+    with pytest.raises(HTTPException) as exc:
+        create_extraction_batch(files=files, currency=None, db=db_session, current_user=user)
+    assert exc.value.status_code == 400
+
+
+def test_extract_receipts_batch_pipelines_llm_behind_ocr(monkeypatch):
+    first_llm_started = threading.Event()
+
+    def fake_run_ocr(path: str, **_kwargs) -> str:
+        if path == "second.jpg":
+            # OCR is serial here, so this only returns if the LLM call for the
+            # first image was started while OCR was still busy.
+            assert first_llm_started.wait(timeout=5)
+        return path
+
+    def fake_run_llm(text: str, _currency: str | None, **_kwargs) -> tuple[dict, str]:
+        if text == "first.jpg":
+            first_llm_started.set()
+        if text == "third.jpg":
+            raise RuntimeError("llm down")
+        return {"vendor_name": text}, "m"
+
+    monkeypatch.setattr(extraction, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+
+    results = extraction.extract_receipts_batch([("first.jpg", None), ("second.jpg", "USD"), ("third.jpg", None)])
+
+    assert results[0].extracted == {"vendor_name": "first.jpg"}
+    assert results[1].extracted == {"vendor_name": "second.jpg", "currency": "USD"}
+    assert "llm_ms" in results[1].timings
+    assert isinstance(results[2], RuntimeError)
@@ -0,0 +1,197 @@
+import io
+import os
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app import worker
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+from app.services.extraction import ExtractionResult
+from app.services.singleflight import SingleFlight
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.fixture()
+def extract_calls(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_extract(path: str, _currency: str | None, **_kwargs) -> ExtractionResult:
+        calls.append(path)
+        return ExtractionResult(
+            ocr_text="Store\nTotal 7.00",
+            extracted={"vendor_name": "Dedup Store", "total": 7.0},
+            model_name="fake-model",
+            confidence=0.8,
+        )
+
+    monkeypatch.setattr("app.services.extraction.extract_receipt", fake_extract)
+    monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
+    return calls
+
+
+async def _upload(client, headers, content: bytes = b"same photo bytes") -> httpx.Response:
+    files = {"file": ("receipt.jpg", io.BytesIO(content), "image/jpeg")}
+    return await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+
+
+async def _headers(client, email: str) -> dict:
+    reg = await client.post("/api/v1/auth/register", json={"email": email, "password": "ChangeMe123!"})
+    return {"Authorization": f"Bearer {reg.json()['access_token']}"}
+
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_reuses_completed_extraction(app, extract_calls, db_session):
+    async with _client(app) as client:
+        headers = await _headers(client, "dedup@example.com")
+        first = await _upload(client, headers)
+        second = await _upload(client, headers)
+
+    assert first.status_code == second.status_code == 201
+    assert len(extract_calls) == 1
+    a, b = first.json(), second.json()
+    assert a["extraction_id"] != b["extraction_id"]
+    assert a["receipt_file_id"] != b["receipt_file_id"]
+    assert b["status"] == "completed"
+    assert b["extracted"] == a["extracted"]
+    assert b["ocr_text"] == a["ocr_text"]
+
+    copied = db_session.get(ReceiptFile, b["receipt_file_id"])
+    assert Path(copied.file_path).read_bytes() == b"same photo bytes"
+
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_is_per_user(app, extract_calls):
+    async with _client(app) as client:
+        await _upload(client, await _headers(client, "dedup-a@example.com"))
+        await _upload(client, await _headers(client, "dedup-b@example.com"))
+    assert len(extract_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_dedup_can_be_disabled(app, extract_calls, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.extraction_dedup", False)
+    async with _client(app) as client:
+        headers = await _headers(client, "dedup-off@example.com")
+        await _upload(client, headers)
+        await _upload(client, headers)
+    assert len(extract_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_hardlinks_original(app, extract_calls, monkeypatch, db_session):
+    monkeypatch.setattr("app.core.config.settings.dedup_hardlink", True)
+    async with _client(app) as client:
+        headers = await _headers(client, "dedup-link@example.com")
+        first = (await _upload(client, headers)).json()
+        second = (await _upload(client, headers)).json()
+
+    original = Path(db_session.get(ReceiptFile, first["receipt_file_id"]).file_path)
+    duplicate = Path(db_session.get(ReceiptFile, second["receipt_file_id"]).file_path)
+    assert original != duplicate
+    assert os.path.samefile(original, duplicate)
+    assert original.stat().st_nlink == 2
+
+
+@pytest.mark.asyncio
+async def test_hardlink_falls_back_to_copy_when_original_missing(app, extract_calls, monkeypatch, db_session):
+    monkeypatch.setattr("app.core.config.settings.dedup_hardlink", True)
+    async with _client(app) as client:
+        headers = await _headers(client, "dedup-gone@example.com")
+        first = (await _upload(client, headers)).json()
+        Path(db_session.get(ReceiptFile, first["receipt_file_id"]).file_path).unlink()
+        second = (await _upload(client, headers)).json()
+
+    duplicate = Path(db_session.get(ReceiptFile, second["receipt_file_id"]).file_path)
+    assert duplicate.read_bytes() == b"same photo bytes"
+    assert duplicate.stat().st_nlink == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_duplicates_run_extraction_once(app, extract_calls, monkeypatch, db_session):
+    monkeypatch.setattr("app.core.config.settings.extraction_async", True)
+    async with _client(app) as client:
+        headers = await _headers(client, "dedup-queue@example.com")
+        first = await _upload(client, headers)
+        second = await _upload(client, headers)
+    assert first.status_code == second.status_code == 202
+
+    assert worker.run_worker(session_factory=lambda: db_session, poll_interval=0, once=True) == 2
+    assert len(extract_calls) == 1
+    rows = db_session.query(ReceiptExtraction).filter(
+        ReceiptExtraction.id.in_([first.json()["extraction_id"], second.json()["extraction_id"]])
+    )
+    assert {row.status for row in rows} == {ExtractionStatus.completed}
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+    results = []
+
+    def slow():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return "ocr+llm"
+
+    def call():
+        results.append(flight.do("key", slow))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight._calls["key"].waiters < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(runs) == 1
+    assert sorted(results) == [("ocr+llm", True)] * 4
+    # The key is released afterwards, so a later call runs again.
+    assert flight.do("key", lambda: "fresh") == ("fresh", False)
+
+
+def test_singleflight_shares_exceptions_with_waiters():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("llm down")
+
+    def call():
+        try:
+            flight.do("key", failing)
+        except ValueError as exc:
+            errors.append(str(exc))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight._calls["key"].waiters < 1:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ["llm down", "llm down"]
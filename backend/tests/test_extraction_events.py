@@ -0,0 +1,173 @@
+import io
+import json
+import uuid
+
+import httpx
+import pytest
+
+from app import worker
+from app.api.routes import receipts
+from app.db.session import get_db
+from app.models.receipt_extraction import ReceiptExtraction
+from app.services import extraction
+from app.services.ollama import parse_partial_object
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+def _events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def _queue_extraction(client: httpx.AsyncClient, email: str) -> tuple[dict, str]:
+    reg = await client.post("/api/v1/auth/register", json={"email": email, "password": "ChangeMe123!"})
+    headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+    files = {"file": ("r.jpg", io.BytesIO(email.encode()), "image/jpeg")}
+    res = await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+    assert res.status_code == 202
+    return headers, res.json()["extraction_id"]
+
+
+class SharedSession:
+    """Hands the test session to each poll without letting it close it."""
+
+    def __init__(self, db_session):
+        self._db = db_session
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def queued(monkeypatch, tmp_path, fake_ollama, db_session):
+    monkeypatch.setattr(receipts, "SessionLocal", lambda: SharedSession(db_session))
+    def fake_run_ocr(_path, timings, details, **_kwargs):
+        details["ocr_tier"] = "fast"
+        return "Store\nTotal 2.00"
+
+    monkeypatch.setattr(extraction, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(extraction.settings, "storage_dir", str(tmp_path))
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    monkeypatch.setattr(extraction.settings, "extraction_async", True)
+    monkeypatch.setattr(extraction.settings, "extraction_events_poll_seconds", 0.01)
+    fake_ollama.response_text = '{"vendor_name": "Stream Store", "subtotal": 1.8, "tax": 0.2, "total": 2.0}'
+    return fake_ollama
+
+
+def test_parse_partial_object_keeps_completed_members():
+    assert parse_partial_object("") == {}
+    assert parse_partial_object('{"vendor_name": "Sto') == {}
+    assert parse_partial_object('Sure: {"vendor_name": "A, B", "total": 1.5, "notes": "unfin') == {
+        "vendor_name": "A, B",
+        "total": 1.5,
+    }
+    assert parse_partial_object('{"items": [1, 2], "note": "say \\"hi\\""} trailing') == {
+        "items": [1, 2],
+        "note": 'say "hi"',
+    }
+    assert parse_partial_object('{"total": tru, "tax": 1}') == {}
+
+
+def test_run_llm_reports_fields_as_they_stream(fake_ollama):
+    fake_ollama.response_text = '{"vendor_name": "Stream Store", "total": 2.0, "tax": 0.2}'
+    seen = []
+
+    fields, _raw = extraction.run_llm("Store\nTotal 2.00", "CAD", on_partial=seen.append)
+
+    assert fields["total"] == 2.0
+    assert seen == [{"vendor_name": "Stream Store"}, {"vendor_name": "Stream Store", "total": 2.0}]
+
+
+@pytest.mark.asyncio
+async def test_events_replay_progress_of_a_worker_extraction(app, db_session, queued):
+    async with _client(app) as client:
+        headers, extraction_id = await _queue_extraction(client, "events@example.com")
+        assert worker.process_next(db_session) is True
+        res = await client.get(f"/api/v1/receipts/extractions/{extraction_id}/events", headers=headers)
+
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = _events(res.text)
+    assert [name for name, _data in events] == ["stored", "ocr_done", "llm_started", "fields_parsed", "completed"]
+    assert events[1][1] == {"ocr_text": "Store\nTotal 2.00", "ocr_tier": "fast"}
+    assert "vendor_name" in events[2][1]["fields"]
+    assert events[3][1]["fields"]["vendor_name"] == "Stream Store"
+    assert events[4][1]["status"] == "completed"
+
+    row = db_session.get(ReceiptExtraction, uuid.UUID(extraction_id))
+    # Streamed partials were persisted for pollers while the LLM was running.
+    assert row.progress["stage"] == "fields_parsed"
+    assert row.progress["fields"]["total"] == 2.0
+
+
+@pytest.mark.asyncio
+async def test_events_stream_partials_until_timeout(app, db_session, queued, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "extraction_events_timeout_seconds", 0.05)
+    async with _client(app) as client:
+        headers, extraction_id = await _queue_extraction(client, "partial@example.com")
+        row = db_session.get(ReceiptExtraction, uuid.UUID(extraction_id))
+        row.progress = {"stage": "partial", "requested": ["total"], "fields": {"total": 2.0}}
+        db_session.commit()
+        res = await client.get(f"/api/v1/receipts/extractions/{extraction_id}/events", headers=headers)
+
+    events = _events(res.text)
+    # Polling again without new progress sends nothing new.
+    assert [name for name, _data in events] == ["stored", "llm_started", "partial", "timeout"]
+    assert events[2][1] == {"fields": {"total": 2.0}}
+
+
+@pytest.mark.asyncio
+async def test_events_outlive_the_request_session(app, db_session, queued):
+    def closing_db():
+        try:
+            yield db_session
+        finally:
+            # Runs before the streamed body is sent, as with the real get_db.
+            db_session.close()
+
+    app.dependency_overrides[get_db] = closing_db
+    async with _client(app) as client:
+        headers, extraction_id = await _queue_extraction(client, "closed-session@example.com")
+        worker.process_next(db_session)
+        res = await client.get(f"/api/v1/receipts/extractions/{extraction_id}/events", headers=headers)
+
+    assert [name for name, _data in _events(res.text)][-1] == "completed"
+
+
+def test_events_for_a_vanished_extraction_end_the_stream(queued):
+    events, finished = receipts._new_events(uuid.uuid4(), uuid.uuid4(), {})
+    assert finished is True
+    assert _events("".join(events))[0][0] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_events_report_failure(app, db_session, queued, monkeypatch):
+    def failing(_path, _currency, **_kwargs):
+        raise RuntimeError("ocr exploded")
+
+    monkeypatch.setattr(extraction, "extract_receipt", failing)
+    async with _client(app) as client:
+        headers, extraction_id = await _queue_extraction(client, "failed-events@example.com")
+        worker.process_next(db_session)
+        res = await client.get(f"/api/v1/receipts/extractions/{extraction_id}/events", headers=headers)
+
+    assert [name for name, _data in _events(res.text)] == ["stored", "failed"]
+
+
+@pytest.mark.asyncio
+async def test_events_unknown_extraction_returns_404(app):
+    async with _client(app) as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "no-events@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        res = await client.get(f"/api/v1/receipts/extractions/{uuid.uuid4()}/events", headers=headers)
+    assert res.status_code == 404
@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import types
-
 import pytest
 
 import app.services.extraction as extraction
@@ -17,8 +15,8 @@ def test_get_ocr_is_cached(monkeypatch):
         def ocr(self, _path: str, cls: bool):
             return []
 
-    monkeypatch.setattr(extraction, "_ocr_instance", None)
-    monkeypatch.setattr(extraction, "PaddleOCR", FakeOCR)
+    monkeypatch.setattr(extraction, "_ocr_instances", {})
+    monkeypatch.setattr(extraction, "_paddleocr_class", lambda: FakeOCR)
 
     o1 = extraction._get_ocr()
     o2 = extraction._get_ocr()
@@ -26,6 +24,11 @@ def test_get_ocr_is_cached(monkeypatch):
     assert calls["init"] == 1
 
 
+def test_paddleocr_is_imported_on_first_use():
+    paddleocr = pytest.importorskip("paddleocr")
+    assert extraction._paddleocr_class() is paddleocr.PaddleOCR
+
+
 def test_run_ocr_collects_non_empty_lines(monkeypatch):
     class FakeOCR:
         def ocr(self, _path: str, cls: bool):
@@ -38,34 +41,50 @@ def test_run_ocr_collects_non_empty_lines(monkeypatch):
                 ]
             ]
 
-    monkeypatch.setattr(extraction, "_get_ocr", lambda: FakeOCR())
+    monkeypatch.setattr(extraction, "_get_ocr", lambda _tier: FakeOCR())
+    monkeypatch.setattr(extraction.settings, "ocr_preprocess", False)
     text = extraction.run_ocr("dummy.png")
     assert text == "Hello\nWorld"
 
 
-def test_run_llm_posts_and_parses_response(monkeypatch):
-    class FakeResponse:
-        def raise_for_status(self):
-            return None
+def test_run_llm_posts_and_parses_response(fake_ollama, monkeypatch):
+    # Without structured output the model may wrap its JSON; exercises the regex path in _parse_json.
+    monkeypatch.setattr(extraction.settings, "ollama_structured_output", False)
+    fake_ollama.response_text = "prefix {\"vendor_name\":\"X\",\"total\":1.23} suffix"
+    timings = {}
+    extracted, model = extraction.run_llm("OCR", currency="CAD", timings=timings)
+    assert extracted["vendor_name"] == "X"
+    assert model
+    assert "parse_ms" in timings
+    assert "OCR text" in fake_ollama.requests[0]["prompt"]
+    assert "format" not in fake_ollama.requests[0]
 
-        def json(self):
-            # wrapped json to exercise regex extraction path in _parse_json
-            return {"response": "prefix {\"vendor_name\":\"X\",\"total\":1.23} suffix"}
 
-    def fake_post(url, json, timeout):
-        assert url.endswith("/api/generate")
-        assert isinstance(json.get("prompt"), str) and "OCR text" in json["prompt"]
-        return FakeResponse()
+def test_run_llm_sends_schema_and_static_system_prompt(fake_ollama):
+    fake_ollama.response_text = '{"vendor_name": "X", "category": "food"}'
+    extracted, _model = extraction.run_llm("Store A", currency="CAD", fields=["vendor_name", "category"])
+    extraction.run_llm("Store B\nTotal 1.00", currency="USD")
 
-    monkeypatch.setattr(extraction, "requests", types.SimpleNamespace(post=fake_post))
-    extracted, model = extraction.run_llm("OCR", currency="CAD")
-    assert extracted["vendor_name"] == "X"
-    assert model
+    partial, full = fake_ollama.requests
+    assert extracted == {"vendor_name": "X", "category": "food"}
+    # The instructions are a fixed prefix; only the short prompt varies.
+    assert partial["system"] == full["system"] == extraction.SYSTEM_PROMPT
+    assert partial["prompt"] == "Default currency: CAD\nReturn only: vendor_name, category\nOCR text:\nStore A"
+    assert partial["format"]["required"] == ["vendor_name", "category"]
+    assert partial["format"]["properties"]["category"]["anyOf"][0]["enum"][0] == "gas"
+    assert set(full["format"]["properties"]) == set(extraction.PROMPT_FIELDS)
+    assert full["format"]["properties"]["total"] == {"anyOf": [{"type": "number"}, {"type": "null"}]}
+
+
+def test_structured_run_llm_does_not_recover_wrapped_json(fake_ollama):
+    fake_ollama.response_text = "Sure! {\"total\": 1}"
+    with pytest.raises(ValueError):
+        extraction.run_llm("Store", currency=None)
 
 
 def test_extract_receipt_sets_currency_when_missing(monkeypatch):
-    monkeypatch.setattr(extraction, "run_ocr", lambda _p: "T")
-    monkeypatch.setattr(extraction, "run_llm", lambda _t, _c: ({"total": 1.0}, "m"))
+    monkeypatch.setattr(extraction, "run_ocr", lambda _p, **_kwargs: "T")
+    monkeypatch.setattr(extraction, "run_llm", lambda _t, _c, **_kwargs: ({"total": 1.0}, "m"))
     result = extraction.extract_receipt("dummy.png", currency="CAD")
     assert result.extracted["currency"] == "CAD"
 
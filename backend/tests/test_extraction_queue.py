@@ -0,0 +1,223 @@
+import io
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app import worker
+from app.crud.receipt_extraction import claim_next_extraction
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+from app.models.user import User
+from app.services.extraction import ExtractionResult
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+def _fake_extract(_path: str, _currency: str | None, **_kwargs) -> ExtractionResult:
+    return ExtractionResult(
+        ocr_text="Store\nTotal 4.56",
+        extracted={"vendor_name": "Queued Store", "total": 4.56},
+        model_name="fake-model",
+        confidence=0.5,
+    )
+
+
+def _pending_extraction(
+    db_session,
+    user: User,
+    tmp_path,
+    currency: str | None = None,
+    age_seconds: int = 0,
+) -> ReceiptExtraction:
+    path = tmp_path / f"{uuid.uuid4()}.jpg"
+    path.write_bytes(b"img")
+    receipt_file = ReceiptFile(
+        user_id=user.id,
+        file_path=str(path),
+        file_name="r.jpg",
+        mime_type="image/jpeg",
+        size_bytes=3,
+        sha256="0" * 64,
+    )
+    db_session.add(receipt_file)
+    db_session.commit()
+    extraction = ReceiptExtraction(
+        user_id=user.id,
+        receipt_file_id=receipt_file.id,
+        status=ExtractionStatus.pending,
+        model_name="m",
+        currency=currency,
+        # now() is frozen for the whole test transaction, so order explicitly.
+        created_at=datetime.now(timezone.utc) - timedelta(seconds=age_seconds),
+    )
+    db_session.add(extraction)
+    db_session.commit()
+    db_session.refresh(extraction)
+    return extraction
+
+
+@pytest.fixture()
+def user(db_session) -> User:
+    user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.mark.asyncio
+async def test_async_extraction_returns_202_and_worker_completes_it(app, monkeypatch, tmp_path, db_session):
+    monkeypatch.setattr("app.services.extraction.extract_receipt", _fake_extract)
+    monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
+    monkeypatch.setattr("app.core.config.settings.extraction_async", True)
+
+    async with _client(app) as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "async@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        files = {"file": ("receipt.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+        res = await client.post("/api/v1/receipts/extractions", headers=headers, files=files, data={"currency": "USD"})
+        assert res.status_code == 202
+        data = res.json()
+        assert data["status"] == "pending"
+        assert data["extracted"] is None
+
+        status_res = await client.get(f"/api/v1/receipts/extractions/{data['extraction_id']}", headers=headers)
+        assert status_res.status_code == 200
+        assert status_res.json()["status"] == "pending"
+
+        assert worker.process_next(db_session) is True
+
+        done = await client.get(f"/api/v1/receipts/extractions/{data['extraction_id']}", headers=headers)
+        body = done.json()
+        assert body["status"] == "completed"
+        assert body["extracted"]["vendor_name"] == "Queued Store"
+        # Currency submitted with the upload is carried through the queue.
+        assert body["extracted"]["currency"] == "USD"
+
+
+@pytest.mark.asyncio
+async def test_get_extraction_unknown_returns_404(app):
+    async with _client(app) as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "no-job@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        res = await client.get(f"/api/v1/receipts/extractions/{uuid.uuid4()}", headers=headers)
+        assert res.status_code == 404
+
+
+def test_claim_next_extraction_is_fifo_and_marks_processing(db_session, user, tmp_path):
+    second = _pending_extraction(db_session, user, tmp_path, age_seconds=10)
+    first = _pending_extraction(db_session, user, tmp_path, age_seconds=20)
+
+    claimed = claim_next_extraction(db_session)
+    assert claimed.id == first.id
+    assert claimed.status == ExtractionStatus.processing
+    assert claimed.claimed_at is not None
+
+    assert claim_next_extraction(db_session).id == second.id
+    assert claim_next_extraction(db_session) is None
+
+
+def test_process_next_marks_failed_and_keeps_going(db_session, user, tmp_path, monkeypatch):
+    def failing(_path, _currency, **_kwargs):
+        raise RuntimeError("ocr exploded")
+
+    monkeypatch.setattr("app.services.extraction.extract_receipt", failing)
+    extraction = _pending_extraction(db_session, user, tmp_path)
+
+    assert worker.process_next(db_session) is True
+    db_session.refresh(extraction)
+    assert extraction.status == ExtractionStatus.failed
+    assert extraction.completed_at is not None
+    assert worker.process_next(db_session) is False
+
+
+def test_run_worker_drains_queue_once(db_session, user, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.extraction.extract_receipt", _fake_extract)
+    _pending_extraction(db_session, user, tmp_path, currency="CAD")
+    _pending_extraction(db_session, user, tmp_path)
+
+    processed = worker.run_worker(session_factory=lambda: db_session, poll_interval=0, once=True)
+    assert processed == 2
+
+
+def test_run_worker_sleeps_until_stopped(monkeypatch):
+    class IdleSession:
+        def close(self):
+            pass
+
+    stop = threading.Event()
+    waits = []
+
+    def fake_process_next(_db):
+        return False
+
+    def fake_wait(timeout):
+        waits.append(timeout)
+        stop.set()
+
+    monkeypatch.setattr(worker, "process_next", fake_process_next)
+    monkeypatch.setattr(stop, "wait", fake_wait)
+    processed = worker.run_worker(session_factory=IdleSession, poll_interval=None, stop_event=stop)
+    assert processed == 0
+    assert waits == [worker.settings.worker_poll_interval_seconds]
+
+
+def test_worker_main_parses_args_and_installs_signal_handlers(monkeypatch):
+    calls = {}
+    handlers = {}
+
+    def fake_run_worker(poll_interval, stop_event, once):
+        calls.update(poll_interval=poll_interval, once=once)
+        handlers[worker.signal.SIGTERM]()
+        assert stop_event.is_set()
+        return 3
+
+    class FakeWarmup:
+        def start(self, stop_event):
+            calls["warmup"] = stop_event
+
+    monkeypatch.setattr(worker, "run_worker", fake_run_worker)
+    monkeypatch.setattr(worker, "get_warmup", FakeWarmup)
+    monkeypatch.setattr(worker, "start_recovery", lambda stop_event: calls.__setitem__("recovery", stop_event))
+    monkeypatch.setattr(worker.signal, "signal", lambda signum, handler: handlers.__setitem__(signum, handler))
+    monkeypatch.setattr(worker, "start_http_server", lambda port: calls.__setitem__("metrics_port", port))
+    assert worker.main(["--poll-interval", "0.5", "--once", "--metrics-port", "9100"]) == 0
+    assert calls.pop("metrics_port") == 9100
+    assert calls.pop("warmup").is_set()
+    assert calls.pop("recovery").is_set()
+    assert calls == {"poll_interval": 0.5, "once": True}
+    monkeypatch.setattr(worker.settings, "warmup_enabled", False)
+    monkeypatch.setattr(worker.settings, "recovery_enabled", False)
+    assert worker.main(["--once"]) == 0
+    assert "warmup" not in calls
+    assert "recovery" not in calls
+
+
+@pytest.mark.asyncio
+async def test_invalid_currency_is_rejected_before_storing(app, monkeypatch, tmp_path):
+    monkeypatch.setattr("app.core.config.settings.storage_dir", str(tmp_path))
+
+    async with _client(app) as client:
+        reg = await client.post(
+            "/api/v1/auth/register", json={"email": "bad-ccy@example.com", "password": "ChangeMe123!"}
+        )
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        for currency in ("usd", "DOLLARS", "C$"):
+            files = {"file": ("receipt.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+            res = await client.post(
+                "/api/v1/receipts/extractions", headers=headers, files=files, data={"currency": currency}
+            )
+            assert res.status_code == 422
+        files = [("files", ("a.jpg", io.BytesIO(b"a"), "image/jpeg"))]
+        res = await client.post(
+            "/api/v1/receipts/extractions/batch", headers=headers, files=files, data={"currency": "EURO"}
+        )
+        assert res.status_code == 422
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,135 @@
+import json
+
+from app.services import extraction, metrics, repair, rules
+
+
+RECEIPT = """CORNER STORE
+123 Main St
+2024/03/05 14:22
+MILK 2% 4L 3.00
+BREAD WHOLE WHEAT 2.50
+EGGS LARGE DOZEN 4.50
+SUBTOTAL 10.00
+HST 1.30
+TOTAL
+11.30
+VISA ****1234
+"""
+
+
+def test_find_problems_reports_invalid_inconsistent_and_missing_fields():
+    problems = repair.find_problems(
+        {
+            "purchased_at": "yesterday",
+            "category": "groceries",
+            "subtotal": 10.0,
+            "tax": 1.3,
+            "total": 12.0,
+            "currency": "usd",
+            "card_last4": "12",
+            "notes": None,
+        },
+        required=["vendor_name", "total"],
+    )
+    assert problems == {
+        "purchased_at": "'yesterday' is not an ISO 8601 date",
+        "category": "'groceries' is not one of: gas, food, office, travel, lodging, entertainment, medical, personal, other",
+        "currency": "'usd' is not a 3-letter ISO 4217 code",
+        "card_last4": "'12' is not 4 digits",
+        "subtotal": "subtotal 10.00 + tax 1.30 does not equal total 12.00",
+        "tax": "subtotal 10.00 + tax 1.30 does not equal total 12.00",
+        "total": "subtotal 10.00 + tax 1.30 does not equal total 12.00",
+        "vendor_name": repair.MISSING,
+    }
+    # A non-numeric amount is reported as such, without a cross-check.
+    assert repair.find_problems({"subtotal": "ten", "tax": 1.3, "total": 11.3, "extra": 1}, []) == {
+        "subtotal": "'ten' is not a number"
+    }
+    assert repair.find_problems({"subtotal": "10.00", "tax": 1.3, "total": 11.3}, []) == {}
+
+
+def test_drop_invalid_keeps_storable_values():
+    assert repair.drop_invalid({"purchased_at": "yesterday", "total": 11.3, "payment_type": "cash"}) == {
+        "purchased_at": None,
+        "total": 11.3,
+        "payment_type": "cash",
+    }
+
+
+def test_lines_for_fields_picks_labels_dates_and_header():
+    assert rules.lines_for_fields(RECEIPT, ["total"]) == "TOTAL\n11.30"
+    assert rules.lines_for_fields(RECEIPT, ["purchased_at", "card_type"]) == "2024/03/05 14:22\nVISA ****1234"
+    assert rules.lines_for_fields(RECEIPT, ["vendor_name"]).splitlines()[:2] == ["CORNER STORE", "123 Main St"]
+    assert rules.lines_for_fields("A\nB", ["notes"]) == "A\nB"
+    assert rules.printed_fields(RECEIPT) >= {"purchased_at", "total", "card_last4"}
+    assert "purchased_at" not in rules.printed_fields("CORNER STORE\nTOTAL 1.00")
+
+
+def test_wrong_fields_are_re_asked_with_a_short_prompt(fake_ollama, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    fake_ollama.responses = [
+        json.dumps(
+            {"vendor_name": "Corner Store", "purchased_at": "March fifth", "subtotal": 10.0, "tax": 1.3, "total": 12.0}
+        ),
+        json.dumps({"purchased_at": "2024-03-05T14:22:00", "subtotal": 10.0, "tax": 1.3, "total": 11.3}),
+    ]
+    fixed = metrics.LLM_REPAIRS.labels(field="total", outcome="fixed")._value.get()
+
+    result = extraction.extract_from_ocr_text(RECEIPT, "CAD")
+
+    assert result.extracted["total"] == 11.3
+    assert result.extracted["purchased_at"] == "2024-03-05T14:22:00"
+    assert len(fake_ollama.requests) == 2
+    follow_up = fake_ollama.requests[1]
+    assert "Return only: purchased_at, subtotal, tax, total" in follow_up["prompt"]
+    assert "does not equal total 12.00" in follow_up["prompt"]
+    # Only the lines holding the date and the amounts, not the whole receipt.
+    assert "MILK" not in follow_up["prompt"]
+    assert "CORNER STORE" not in follow_up["prompt"]
+    assert follow_up["prompt"].endswith("OCR text:\n2024/03/05 14:22\nSUBTOTAL 10.00\nHST 1.30\nTOTAL\n11.30")
+    assert result.prompt_tokens == sum(len(request["prompt"]) // 4 for request in fake_ollama.requests)
+    assert "repair_ms" in result.timings
+    assert metrics.LLM_REPAIRS.labels(field="total", outcome="fixed")._value.get() == fixed + 1
+
+
+def test_unfixable_fields_are_dropped_not_fatal(fake_ollama, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    monkeypatch.setattr(extraction.settings, "llm_repair_rounds", 3)
+    fake_ollama.response_text = json.dumps({"vendor_name": "Corner Store", "purchased_at": "soon", "category": "snacks"})
+    unresolved = metrics.LLM_REPAIRS.labels(field="category", outcome="unresolved")._value.get()
+
+    result = extraction.extract_from_ocr_text(RECEIPT, None)
+
+    # The same answer twice ends the loop early.
+    assert len(fake_ollama.requests) == 2
+    assert result.extracted["purchased_at"] is None
+    assert result.extracted["category"] is None
+    assert result.extracted["vendor_name"] == "Corner Store"
+    assert metrics.LLM_REPAIRS.labels(field="category", outcome="unresolved")._value.get() == unresolved + 1
+
+
+def test_rule_fields_are_not_re_asked(monkeypatch):
+    seen = []
+
+    def fake_run_llm(_text, _currency, fields=None, problems=None, **_kwargs):
+        seen.append((fields, problems))
+        # A wrong total, but the rules already settled it.
+        return {"vendor_name": "Corner Store", "total": 99.0, "category": "food"}, "m"
+
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+    result = extraction.extract_from_ocr_text(RECEIPT, "CAD")
+
+    assert len(seen) == 1
+    assert result.extracted["total"] == 11.3
+
+
+def test_repair_can_be_turned_off(fake_ollama, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    monkeypatch.setattr(extraction.settings, "llm_repair_rounds", 0)
+    fake_ollama.response_text = json.dumps({"vendor_name": "Corner Store", "purchased_at": "soon"})
+
+    result = extraction.extract_from_ocr_text(RECEIPT, None)
+
+    assert len(fake_ollama.requests) == 1
+    assert result.extracted["purchased_at"] is None
+    assert "repair_ms" not in result.timings
@@ -2,10 +2,10 @@ from app.services.extraction import extract_receipt
 
 
 def test_extract_receipt_merges_currency(monkeypatch):
-    def fake_run_ocr(_path: str) -> str:
+    def fake_run_ocr(_path: str, **_kwargs) -> str:
         return "Store\nTotal 9.99"
 
-    def fake_run_llm(_text: str, _currency: str | None):
+    def fake_run_llm(_text: str, _currency: str | None, **_kwargs):
         return {"vendor_name": "Sample", "total": 9.99}, "fake-model"
 
     monkeypatch.setattr("app.services.extraction.run_ocr", fake_run_ocr)
@@ -15,3 +15,11 @@ def test_extract_receipt_merges_currency(monkeypatch):
     assert result.extracted["currency"] == "CAD"
     assert result.extracted["vendor_name"] == "Sample"
     assert result.model_name == "fake-model"
+
+
+def test_extract_receipt_keeps_currency_from_llm(monkeypatch):
+    monkeypatch.setattr("app.services.extraction.run_ocr", lambda _path, **_kwargs: "Store\nTotal 9.99 USD")
+    monkeypatch.setattr("app.services.extraction.run_llm", lambda _text, _currency, **_kwargs: ({"currency": "USD"}, "m"))
+
+    result = extract_receipt("dummy.png", "CAD")
+    assert result.extracted["currency"] == "USD"
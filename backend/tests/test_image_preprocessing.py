@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+import pytest
+
+import app.services.extraction as extraction
+
+
+def _receipt_photo(path, size=(3000, 4000), angle=12.0):
+    """Dark table with a rotated white receipt covering roughly a third of the frame."""
+    width, height = size
+    canvas = np.full((height, width, 3), 45, dtype=np.uint8)
+    receipt_w, receipt_h = width // 3, int(height * 0.7)
+    receipt = np.full((receipt_h, receipt_w, 3), 250, dtype=np.uint8)
+    for row in range(10):
+        cv2.putText(receipt, f"ITEM {row} 1.99", (40, 150 + row * 180), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0), 6)
+    x0, y0 = (width - receipt_w) // 2, (height - receipt_h) // 2
+    canvas[y0:y0 + receipt_h, x0:x0 + receipt_w] = receipt
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    canvas = cv2.warpAffine(canvas, matrix, (width, height), borderValue=(45, 45, 45))
+    cv2.imwrite(str(path), canvas)
+    return receipt_w, receipt_h
+
+
+def test_preprocess_crops_receipt_and_downscales(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "ocr_max_dimension", 1600)
+    path = tmp_path / "photo.png"
+    receipt_w, receipt_h = _receipt_photo(path)
+    timings = {}
+
+    image = extraction.preprocess_image(str(path), timings)
+
+    assert image.ndim == 2
+    assert max(image.shape) <= 1600
+    # Cropped to the receipt: mostly paper, and the receipt's aspect ratio.
+    assert image.mean() > 180
+    assert image.shape[0] / image.shape[1] == pytest.approx(receipt_h / receipt_w, rel=0.1)
+    assert set(timings) == {"decode_ms", "grayscale_ms", "crop_ms", "resize_ms"}
+
+
+def test_preprocess_keeps_frame_when_no_receipt_found(tmp_path):
+    path = tmp_path / "plain.png"
+    cv2.imwrite(str(path), np.full((300, 200, 3), 200, dtype=np.uint8))
+    image = extraction.preprocess_image(str(path))
+    assert image.shape == (300, 200)
+
+
+def test_preprocess_ignores_small_quadrilaterals(tmp_path):
+    path = tmp_path / "sticker.png"
+    canvas = np.full((1000, 1000, 3), 40, dtype=np.uint8)
+    cv2.rectangle(canvas, (100, 100), (250, 250), (255, 255, 255), -1)
+    cv2.imwrite(str(path), canvas)
+    assert extraction.preprocess_image(str(path)).shape == (1000, 1000)
+
+
+def test_preprocess_without_crop(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "ocr_crop_receipt", False)
+    monkeypatch.setattr(extraction.settings, "ocr_max_dimension", 1000)
+    path = tmp_path / "photo.png"
+    _receipt_photo(path, size=(2000, 1500), angle=0)
+    timings = {}
+    image = extraction.preprocess_image(str(path), timings)
+    assert image.shape == (750, 1000)
+    assert "crop_ms" not in timings
+
+
+def test_preprocess_applies_exif_orientation(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.setattr(extraction.settings, "ocr_crop_receipt", False)
+    path = tmp_path / "rotated.jpg"
+    photo = Image.new("RGB", (400, 100), (255, 255, 255))
+    exif = photo.getexif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW to display
+    photo.save(path, exif=exif)
+
+    assert extraction.preprocess_image(str(path)).shape == (400, 100)
+
+
+def test_preprocess_rejects_unreadable_file(tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    with pytest.raises(ValueError):
+        extraction.preprocess_image(str(path))
+
+
+def test_run_ocr_feeds_preprocessed_array_without_angle_cls(tmp_path, monkeypatch):
+    seen = {}
+
+    class FakeOCR:
+        def ocr(self, image, cls):
+            seen.update(shape=image.shape, cls=cls)
+            return [[(None, ("TOTAL 1.99", 0.9))]]
+
+    monkeypatch.setattr(extraction, "_get_ocr", lambda _tier: FakeOCR())
+    monkeypatch.setattr(extraction.settings, "ocr_cache_enabled", False)
+    path = tmp_path / "photo.png"
+    _receipt_photo(path, size=(1200, 1600))
+    timings = {}
+
+    assert extraction.run_ocr(str(path), timings=timings) == "TOTAL 1.99"
+    assert seen["cls"] is False
+    assert len(seen["shape"]) == 2
+    assert {"decode_ms", "ocr_ms"} <= set(timings)
+
+
+def test_extract_receipt_reports_stage_timings(monkeypatch):
+    def fake_run_ocr(_path, timings, details, **_kwargs):
+        timings["ocr_ms"] = 5.0
+        details["ocr_tier"] = "fast"
+        return "Total 1"
+
+    monkeypatch.setattr(extraction, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(extraction, "run_llm", lambda _text, _currency, **_kwargs: ({}, "m"))
+    result = extraction.extract_receipt("x.png", None)
+    assert result.timings["ocr_ms"] == 5.0
+    assert "llm_ms" in result.timings
+    assert result.ocr_tier == "fast"
@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ("paddleocr", "paddle", "cv2", "numpy")
+# `import app.main` takes about a second (FastAPI + SQLAlchemy); paddle alone adds ~3s.
+IMPORT_BUDGET_SECONDS = 2.5
+
+# Runs in a fresh interpreter where the OCR stack cannot be imported at all,
+# as on an API-only host without paddle installed.
+SCRIPT = f"""
+import json, sys, time
+for name in {HEAVY_MODULES!r}:
+    sys.modules[name] = None
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+import app.worker
+print(json.dumps({{"elapsed": elapsed, "routes": len(app.main.app.routes)}}))
+"""
+
+
+def test_app_imports_fast_without_ocr_stack():
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.splitlines()[-1])
+    assert report["routes"] > 0
+    assert report["elapsed"] < IMPORT_BUDGET_SECONDS
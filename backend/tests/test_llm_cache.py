@@ -0,0 +1,198 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app.services.extraction as extraction
+from app.models.llm_cache_entry import LlmCacheEntry
+from app.services import llm_cache, metrics
+from app.services.llm_cache import DbLlmCache, MemoryLlmCache, llm_cache_key, normalize_prompt
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_prompt_normalization_ignores_incidental_whitespace():
+    assert normalize_prompt("Total \t 9.99  \n\n  Store ") == "Total 9.99\nStore"
+    assert llm_cache_key("m", "A  B\n") == llm_cache_key("m", "A B")
+
+
+def test_cache_key_covers_model_prompt_and_options():
+    base = llm_cache_key("llama3.1", "prompt", {"num_ctx": 2048})
+    assert base != llm_cache_key("mistral", "prompt", {"num_ctx": 2048})
+    assert base != llm_cache_key("llama3.1", "other prompt", {"num_ctx": 2048})
+    assert base != llm_cache_key("llama3.1", "prompt", {"num_ctx": 4096})
+    assert base != llm_cache_key("llama3.1", "prompt", {"num_ctx": 2048}, system="Be brief.")
+    assert llm_cache_key("m", "p") == llm_cache_key("m", "p", {})
+
+
+def test_memory_cache_lru_eviction():
+    cache = MemoryLlmCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", "m", "A")
+    cache.put("b", "m", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "m", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert len(cache) == 2
+
+
+def test_memory_cache_ttl_and_stats():
+    clock = FakeClock()
+    cache = MemoryLlmCache(max_entries=10, ttl_seconds=5, clock=clock)
+    assert cache.stats()["hit_rate"] == 0.0
+    cache.put("a", "m", "A")
+    assert cache.get("a") == "A"
+    clock.now = 5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_base_cache_requires_a_store():
+    with pytest.raises(TypeError):
+        llm_cache.LlmCache()
+
+
+def test_lookups_are_exported_per_tier():
+    def count(outcome):
+        return metrics.LLM_CACHE_LOOKUPS.labels(tier="memory", outcome=outcome)._value.get()
+
+    hits, misses = count("hit"), count("miss")
+    cache = MemoryLlmCache(max_entries=10, ttl_seconds=60)
+    cache.get("a")
+    cache.put("a", "m", "A")
+    cache.get("a")
+    cache.get("a")
+    assert (count("hit"), count("miss")) == (hits + 2, misses + 1)
+
+
+class SharedSession:
+    """Hands the test session to the cache without letting it close it."""
+
+    def __init__(self, db_session):
+        self._db = db_session
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def close(self):
+        pass
+
+
+def test_db_cache_shares_entries_between_processes(db_session):
+    factory = lambda: SharedSession(db_session)  # noqa: E731
+    writer = DbLlmCache(MemoryLlmCache(10, 60), max_entries=100, ttl_seconds=60, session_factory=factory)
+    reader = DbLlmCache(MemoryLlmCache(10, 60), max_entries=100, ttl_seconds=60, session_factory=factory)
+
+    assert reader.get("k") is None
+    writer.put("k", "llama3.1", '{"total": 1}')
+    writer.put("k", "llama3.1", '{"total": 2}')
+    assert reader.get("k") == '{"total": 2}'
+    # Second read is served from the reader's memory tier.
+    assert reader.get("k") == '{"total": 2}'
+
+    entry = db_session.get(LlmCacheEntry, "k")
+    assert entry.hit_count == 1
+    stats = reader.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["memory"]["hits"] == 1
+
+
+def test_db_cache_expires_and_caps_entries(db_session):
+    factory = lambda: SharedSession(db_session)  # noqa: E731
+    cache = DbLlmCache(
+        MemoryLlmCache(10, 60), max_entries=2, ttl_seconds=60, session_factory=factory, evict_interval_seconds=0
+    )
+    cache.put("old", "m", "1")
+    entry = db_session.get(LlmCacheEntry, "old")
+    entry.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db_session.commit()
+
+    fresh = DbLlmCache(MemoryLlmCache(10, 60), max_entries=2, ttl_seconds=60, session_factory=factory)
+    assert fresh.get("old") is None
+
+    for age, key in ((300, "a"), (200, "b"), (100, "c")):
+        cache.put(key, "m", key)
+        row = db_session.get(LlmCacheEntry, key)
+        row.last_used_at = datetime.now(timezone.utc) - timedelta(seconds=age)
+        db_session.commit()
+    cache.put("d", "m", "d")
+    db_session.expire_all()
+    keys = {row.key for row in db_session.query(LlmCacheEntry).all()}
+    # Expired rows go first, then the least recently used beyond max_entries.
+    assert keys == {"c", "d"}
+
+
+def test_db_cache_evicts_at_most_once_per_interval(db_session):
+    factory = lambda: SharedSession(db_session)  # noqa: E731
+    clock = FakeClock()
+    cache = DbLlmCache(
+        MemoryLlmCache(10, 60),
+        max_entries=1,
+        ttl_seconds=60,
+        session_factory=factory,
+        evict_interval_seconds=30,
+        clock=clock,
+    )
+    for key in ("a", "b", "c"):
+        cache.put(key, "m", key)
+        row = db_session.get(LlmCacheEntry, key)
+        row.last_used_at = datetime.now(timezone.utc) - timedelta(seconds=ord("z") - ord(key))
+        db_session.commit()
+    # The first put trimmed an empty table; the next two waited for the interval.
+    assert db_session.query(LlmCacheEntry).count() == 3
+
+    clock.now = 30
+    cache.put("d", "m", "d")
+    db_session.expire_all()
+    assert [row.key for row in db_session.query(LlmCacheEntry).all()] == ["d"]
+
+
+def test_get_llm_cache_backends(monkeypatch):
+    monkeypatch.setattr(llm_cache.settings, "llm_cache_backend", "memory")
+    memory = llm_cache.get_llm_cache()
+    assert isinstance(memory, MemoryLlmCache)
+    assert llm_cache.get_llm_cache() is memory
+
+    monkeypatch.setattr(llm_cache.settings, "llm_cache_backend", "db")
+    assert isinstance(llm_cache.get_llm_cache(), DbLlmCache)
+
+    monkeypatch.setattr(llm_cache.settings, "llm_cache_backend", "none")
+    assert llm_cache.get_llm_cache() is None
+
+    monkeypatch.setattr(llm_cache.settings, "llm_cache_backend", "redis")
+    with pytest.raises(ValueError):
+        llm_cache.get_llm_cache()
+
+
+def test_run_llm_serves_repeat_prompts_from_cache(fake_ollama):
+    fake_ollama.response_text = '{"total": 3.5}'
+
+    first = extraction.run_llm("Store\nTotal 3.50", currency="CAD")
+    second = extraction.run_llm("Store  \nTotal 3.50", currency="CAD")
+    assert first == second == ({"total": 3.5}, extraction.settings.ollama_model)
+    assert len(fake_ollama.requests) == 1
+    # Different currency default changes the prompt.
+    extraction.run_llm("Store\nTotal 3.50", currency="USD")
+    assert len(fake_ollama.requests) == 2
+
+
+def test_run_llm_does_not_cache_unparseable_responses(fake_ollama):
+    fake_ollama.response_text = "no json here"
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            extraction.run_llm("Store", currency=None)
+    assert len(fake_ollama.requests) == 2
+
+
+def test_run_llm_without_cache(monkeypatch, fake_ollama):
+    monkeypatch.setattr(extraction.settings, "llm_cache_backend", "none")
+    extraction.run_llm("Store", currency=None)
+    extraction.run_llm("Store", currency=None)
+    assert len(fake_ollama.requests) == 2
@@ -0,0 +1,89 @@
+import io
+
+import httpx
+import pytest
+
+from app.services import extraction, metrics
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+def _sample(text: str, name: str, **labels) -> float:
+    for line in text.splitlines():
+        if not line.startswith(name):
+            continue
+        key, _sep, value = line.rpartition(" ")
+        if all(f'{label}="{expected}"' in key for label, expected in labels.items()):
+            return float(value)
+    return 0.0
+
+
+@pytest.fixture()
+def fake_pipeline(monkeypatch, tmp_path, fake_ollama):
+    def fake_run_ocr(_path, timings, details, **_kwargs):
+        timings.update(decode_ms=2.0, ocr_ms=30.0)
+        details["ocr_tier"] = "fast"
+        return "Store\nTotal 2.00"
+
+    monkeypatch.setattr(extraction, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(extraction.settings, "storage_dir", str(tmp_path))
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    fake_ollama.response_text = '{"vendor_name": "Store", "total": 2.0}'
+    return fake_ollama
+
+
+@pytest.mark.asyncio
+async def test_extraction_persists_stage_timings_and_tokens(app, fake_pipeline):
+    async with _client(app) as client:
+        before = (await client.get("/metrics")).text
+        reg = await client.post("/api/v1/auth/register", json={"email": "metrics@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        files = {"file": ("r.jpg", io.BytesIO(b"metrics photo"), "image/jpeg")}
+        created = await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+        fetched = await client.get(f"/api/v1/receipts/extractions/{created.json()['extraction_id']}", headers=headers)
+        scraped = await client.get("/metrics")
+
+    body = fetched.json()
+    assert {"upload_write_ms", "hash_ms", "decode_ms", "ocr_ms", "llm_ms", "parse_ms", "validate_ms"} <= set(body["timings"])
+    # Streamed (the default): the counts come from Ollama's final chunk.
+    assert fake_pipeline.requests[0]["stream"] is True
+    assert body["prompt_tokens"] == len(fake_pipeline.requests[0]["prompt"]) // 4
+    assert body["completion_tokens"] == len(fake_pipeline.response_text)
+
+    assert scraped.status_code == 200
+    assert scraped.headers["content-type"].startswith("text/plain")
+    text = scraped.text
+    for stage in ("upload_write", "hash", "ocr", "llm", "parse", "validate"):
+        name = "receipt_extraction_stage_seconds_count"
+        assert _sample(text, name, stage=stage) == _sample(before, name, stage=stage) + 1
+    name = "receipt_extractions_total"
+    assert _sample(text, name, status="completed") == _sample(before, name, status="completed") + 1
+    assert _sample(text, "receipt_extraction_llm_tokens_total", kind="prompt") > 0
+    assert _sample(text, "receipt_extractions_in_flight") == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_queue_depth(app, fake_pipeline, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "extraction_async", True)
+    async with _client(app) as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "queue@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        for content in (b"one", b"two"):
+            files = {"file": ("r.jpg", io.BytesIO(content), "image/jpeg")}
+            await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+        scraped = await client.get("/metrics")
+
+    assert _sample(scraped.text, "receipt_extraction_queue_depth", status="pending") == 2
+    assert _sample(scraped.text, "receipt_extraction_queue_depth", status="processing") == 0
+
+
+def test_observe_helpers_skip_missing_values():
+    before = metrics.LLM_TOKENS.labels(kind="completion")._value.get()
+    metrics.observe_tokens(None, 0)
+    metrics.observe_timings({"ocr_tier": "fast", "notes_ms": "n/a"})
+    assert metrics.LLM_TOKENS.labels(kind="completion")._value.get() == before
+    metrics.observe_tokens(None, 3)
+    assert metrics.LLM_TOKENS.labels(kind="completion")._value.get() == before + 3
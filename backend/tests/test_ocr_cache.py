@@ -0,0 +1,180 @@
+import json
+import os
+import time
+
+import pytest
+
+import app.services.extraction as extraction
+from app.services import ocr_cache
+from app.services.ocr_cache import OcrCache, ocr_cache_key
+
+
+LINES = [{"text": "Total 9.99", "score": 0.97, "box": [[0.0, 0.0], [10.0, 0.0], [10.0, 5.0], [0.0, 5.0]]}]
+ENTRY = {"lines": LINES, "ocr_tier": "fast"}
+EMPTY = {"lines": []}
+
+
+def test_cache_key_covers_ocr_configuration():
+    base = ocr_cache_key("a" * 64, "en", "2.7.0.3", True)
+    assert base == ocr_cache_key("a" * 64, "en", "2.7.0.3", True)
+    assert base != ocr_cache_key("b" * 64, "en", "2.7.0.3", True)
+    assert base != ocr_cache_key("a" * 64, "fr", "2.7.0.3", True)
+    assert base != ocr_cache_key("a" * 64, "en", "2.8.0", True)
+    assert base != ocr_cache_key("a" * 64, "en", "2.7.0.3", False)
+    assert base != ocr_cache_key("a" * 64, "en", "2.7.0.3", True, extra="pre:1600:crop")
+
+
+def test_cache_round_trip_and_counters(tmp_path):
+    cache = OcrCache(tmp_path, max_bytes=1024 * 1024)
+    assert cache.get("k" * 64) is None
+    cache.put("k" * 64, ENTRY)
+    assert cache.get("k" * 64) == ENTRY
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5}
+
+
+def test_cache_stats_with_no_lookups(tmp_path):
+    assert OcrCache(tmp_path, max_bytes=1).stats()["hit_rate"] == 0.0
+
+
+def test_cache_drops_entries_larger_than_budget(tmp_path):
+    cache = OcrCache(tmp_path, max_bytes=1)
+    cache.put("a" * 64, ENTRY)
+    assert cache.get("a" * 64) is None
+    assert cache._size == 0
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    entry_size = len(b'{"lines":[]}')
+    # Room for two and a half entries: one eviction gets back under the low-water mark.
+    cache = OcrCache(tmp_path, max_bytes=entry_size * 5 // 2)
+    cache.put("a" * 64, EMPTY)
+    cache.put("b" * 64, EMPTY)
+    old = time.time() - 100
+    os.utime(cache._path("a" * 64), (old, old))
+    os.utime(cache._path("b" * 64), (old + 1, old + 1))
+    # Reading "a" makes it the most recently used entry.
+    assert cache.get("a" * 64) == EMPTY
+
+    cache.put("c" * 64, EMPTY)
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == EMPTY
+    assert cache.get("c" * 64) == EMPTY
+    assert cache.evictions == 1
+
+
+def test_cache_evicts_to_low_water_mark_and_then_skips_rescans(tmp_path, monkeypatch):
+    entry_size = len(b'{"lines":[]}')
+    cache = OcrCache(tmp_path, max_bytes=entry_size * 10)
+    for index in range(11):
+        cache.put(f"{index:02d}" * 32, EMPTY)
+    assert cache.evictions == 2
+    assert cache._size == entry_size * 9
+
+    scans = []
+    real_entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or real_entries())
+    cache.put("ff" * 32, EMPTY)
+    assert scans == []
+    assert cache._size == entry_size * 10
+
+
+def test_cache_size_is_seeded_from_existing_directory(tmp_path):
+    entry_size = len(json.dumps(ENTRY, separators=(",", ":")).encode("utf-8"))
+    OcrCache(tmp_path, max_bytes=10_000).put("a" * 64, ENTRY)
+    reopened = OcrCache(tmp_path, max_bytes=10_000)
+    reopened.put("b" * 64, ENTRY)
+    assert reopened._size == 2 * entry_size
+
+
+def test_entries_skip_files_removed_during_scan(tmp_path, monkeypatch):
+    cache = OcrCache(tmp_path, max_bytes=10_000)
+    cache.put("a" * 64, EMPTY)
+    ghost = tmp_path / "zz" / ("z" * 64 + ".json")
+    real_glob = type(tmp_path).glob
+    monkeypatch.setattr(type(tmp_path), "glob", lambda self, pattern: [*real_glob(self, pattern), ghost])
+    assert [path for _mtime, _size, path in cache._entries()] == [cache._path("a" * 64)]
+
+
+def test_get_ocr_cache_follows_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_cache, "_cache", None)
+    monkeypatch.setattr(ocr_cache.settings, "storage_dir", str(tmp_path))
+    monkeypatch.setattr(ocr_cache.settings, "ocr_cache_dir", None)
+    cache = ocr_cache.get_ocr_cache()
+    assert cache.directory == tmp_path / "_ocr_cache"
+    assert ocr_cache.get_ocr_cache() is cache
+
+    monkeypatch.setattr(ocr_cache.settings, "ocr_cache_dir", str(tmp_path / "elsewhere"))
+    assert ocr_cache.get_ocr_cache().directory == tmp_path / "elsewhere"
+
+    monkeypatch.setattr(ocr_cache.settings, "ocr_cache_enabled", False)
+    assert ocr_cache.get_ocr_cache() is None
+
+
+@pytest.fixture()
+def counting_ocr(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_ocr_raw(image_path, _timings, _tier_mode=None):
+        calls.append(image_path)
+        return [[([[1, 2], [3, 2], [3, 4], [1, 4]], ("Total 9.99", 0.97)), (None, ("", 0.1))]], "mixed"
+
+    monkeypatch.setattr(extraction, "_ocr_raw", fake_ocr_raw)
+    monkeypatch.setattr(ocr_cache, "_cache", None)
+    monkeypatch.setattr(ocr_cache.settings, "ocr_cache_dir", str(tmp_path / "cache"))
+    return calls
+
+
+def test_run_ocr_lines_caches_by_image_hash(tmp_path, counting_ocr):
+    image = tmp_path / "receipt.jpg"
+    image.write_bytes(b"pixels")
+    copy = tmp_path / "retry.jpg"
+    copy.write_bytes(b"pixels")
+
+    first = extraction.run_ocr_lines(str(image))
+    details = {}
+    second = extraction.run_ocr_lines(str(copy), details=details)
+    assert first == second
+    # The tier that produced the cached lines is reported on a hit.
+    assert details == {"ocr_tier": "mixed"}
+    assert first[0].box == [[1.0, 2.0], [3.0, 2.0], [3.0, 4.0], [1.0, 4.0]]
+    assert first[0].score == pytest.approx(0.97)
+    assert counting_ocr == [str(image)]
+    assert ocr_cache.get_ocr_cache().stats()["hits"] == 1
+
+
+def test_run_ocr_accepts_known_hash(tmp_path, counting_ocr):
+    assert extraction.run_ocr("missing.jpg", sha256="c" * 64) == "Total 9.99"
+    assert extraction.run_ocr("also-missing.jpg", sha256="c" * 64) == "Total 9.99"
+    assert len(counting_ocr) == 1
+
+
+def test_run_ocr_skips_cache_when_file_unreadable(counting_ocr):
+    extraction.run_ocr("missing.jpg")
+    extraction.run_ocr("missing.jpg")
+    assert len(counting_ocr) == 2
+
+
+def test_run_ocr_without_cache(monkeypatch, counting_ocr):
+    monkeypatch.setattr(ocr_cache.settings, "ocr_cache_enabled", False)
+    assert extraction.run_ocr("missing.jpg", sha256="d" * 64) == "Total 9.99"
+    assert len(counting_ocr) == 1
+
+
+def test_paddleocr_version_handles_missing_distribution(monkeypatch):
+    def missing(_name):
+        raise extraction.metadata.PackageNotFoundError
+
+    extraction._paddleocr_version.cache_clear()
+    monkeypatch.setattr(extraction.metadata, "version", missing)
+    try:
+        assert extraction._paddleocr_version() == "unknown"
+    finally:
+        extraction._paddleocr_version.cache_clear()
+
+
+def test_preprocessing_options_are_part_of_the_key(monkeypatch, counting_ocr):
+    extraction.run_ocr("missing.jpg", sha256="e" * 64)
+    monkeypatch.setattr(ocr_cache.settings, "ocr_preprocess", False)
+    extraction.run_ocr("missing.jpg", sha256="e" * 64)
+    extraction.run_ocr("missing.jpg", sha256="e" * 64)
+    assert len(counting_ocr) == 2
@@ -0,0 +1,123 @@
+import io
+import uuid
+
+import httpx
+import pytest
+
+from app.models.receipt_extraction import ReceiptExtraction
+from app.services import extraction, metrics, ocr_layout
+from app.services.extraction import OcrLine
+
+
+def _line(text: str, x: float, y: float, score: float = 0.95, width: float = 80, height: float = 20) -> OcrLine:
+    return OcrLine(text=text, score=score, box=[[x, y], [x + width, y], [x + width, y + height], [x, y + height]])
+
+
+RECEIPT = [
+    _line("CORNER STORE", 100, 10),
+    _line("TOTAL", 10, 200),
+    # Slightly lower than its label, as on a photo taken at an angle.
+    _line("12.34", 300, 205),
+    _line("Visa ****1234", 10, 240),
+    _line("SUBTOTAL", 10, 150),
+    _line("11.00", 300, 148),
+    _line("HST 1.34", 10, 175, score=0.3),
+    _line("*** ***", 10, 260),
+    _line("0123456789012345", 10, 280),
+    _line("Thank you for shopping!", 10, 300),
+    _line("CORNER STORE", 100, 320),
+]
+
+
+def test_compact_text_merges_rows_and_drops_noise():
+    assert ocr_layout.compact_text(RECEIPT, min_score=0.5) == "CORNER STORE\nSUBTOTAL 11.00\nTOTAL 12.34\nVisa ****1234"
+
+
+def test_compact_text_keeps_ocr_order_without_boxes():
+    lines = [OcrLine("TOTAL 2.00", 0.9, []), _line("STORE", 0, 0), OcrLine("store", 0.9, [])]
+    assert ocr_layout.compact_text(lines, min_score=0.5) == "TOTAL 2.00\nSTORE"
+
+
+def test_compact_text_keeps_repeated_item_rows():
+    lines = [
+        _line("CAFE", 10, 0),
+        _line("COFFEE", 10, 40),
+        _line("2.50", 300, 40),
+        _line("COFFEE", 10, 70),
+        _line("2.50", 300, 70),
+        _line("TOTAL 5.00", 10, 100),
+        _line("CAFE", 10, 130),
+    ]
+    assert ocr_layout.compact_text(lines, min_score=0.5) == "CAFE\nCOFFEE 2.50\nCOFFEE 2.50\nTOTAL 5.00"
+
+
+def test_encode_layout_is_compact():
+    layout = ocr_layout.encode_layout([_line("TOTAL", 10.4, 200.6, score=0.98765), OcrLine("x", 0.5, [])])
+    assert layout == {"v": 1, "lines": [["TOTAL", 0.988, 10, 201, 90, 221], ["x", 0.5]]}
+
+
+def test_run_ocr_keeps_the_raw_text_and_compaction_reports_token_reduction(monkeypatch):
+    monkeypatch.setattr(extraction, "run_ocr_lines", lambda *_args, **_kwargs: RECEIPT)
+    saved = metrics.OCR_TOKENS_SAVED._value.get()
+    timings, details = {}, {}
+
+    raw = extraction.run_ocr("r.jpg", timings=timings, details=details)
+    text, layout = extraction._compact(raw, details["ocr_layout"], timings)
+
+    assert raw == "\n".join(line.text for line in RECEIPT)
+    assert text == ocr_layout.compact_text(RECEIPT, extraction.settings.ocr_compact_min_score)
+    assert len(layout["lines"]) == len(RECEIPT)
+    assert "raw_tokens" not in details["ocr_layout"]
+    assert layout["compact_tokens"] == ocr_layout.estimate_tokens(text) < layout["raw_tokens"]
+    assert metrics.OCR_TOKENS_SAVED._value.get() == saved + layout["raw_tokens"] - layout["compact_tokens"]
+    assert "compact_ms" in timings
+
+    monkeypatch.setattr(extraction.settings, "ocr_compact", False)
+    assert extraction._compact(raw, details["ocr_layout"], {}) == (raw, details["ocr_layout"])
+    monkeypatch.setattr(extraction.settings, "ocr_compact", True)
+    assert extraction._compact(raw, None, {}) == (raw, None)
+    assert extraction._compact("", ocr_layout.encode_layout([]), {})[0] == ""
+
+
+def test_layout_lines_rebuild_boxes_from_bounds():
+    layout = ocr_layout.encode_layout([_line("TOTAL", 10, 200), OcrLine("x", 0.5, [])])
+    assert extraction._layout_lines(layout) == [
+        OcrLine("TOTAL", 0.95, [[10, 200], [90, 200], [90, 220], [10, 220]]),
+        OcrLine("x", 0.5, []),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_extraction_stores_layout_and_prompts_with_compacted_text(app, db_session, monkeypatch, tmp_path, fake_ollama):
+    monkeypatch.setattr(extraction, "run_ocr_lines", lambda *_args, **_kwargs: RECEIPT)
+    monkeypatch.setattr(extraction.settings, "storage_dir", str(tmp_path))
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    fake_ollama.response_text = '{"vendor_name": "CORNER STORE", "total": 12.34}'
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "layout@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        files = {"file": ("r.jpg", io.BytesIO(b"layout photo"), "image/jpeg")}
+        res = await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+
+    assert res.status_code == 201
+    assert "SUBTOTAL 11.00\nTOTAL 12.34" in fake_ollama.requests[0]["prompt"]
+    assert "Thank you" not in fake_ollama.requests[0]["prompt"]
+    row = db_session.get(ReceiptExtraction, uuid.UUID(res.json()["extraction_id"]))
+    assert row.raw_ocr_text == "\n".join(line.text for line in RECEIPT)
+    assert row.ocr_layout["lines"][1] == ["TOTAL", 0.95, 10, 200, 90, 220]
+    assert row.ocr_layout["compact_tokens"] < row.ocr_layout["raw_tokens"]
+
+
+def test_rerun_from_saved_ocr_compacts_the_saved_layout(monkeypatch, fake_ollama):
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    fake_ollama.response_text = '{"total": 12.34}'
+    raw = "\n".join(line.text for line in RECEIPT)
+
+    result = extraction.extract_from_ocr_text(raw, None, layout=ocr_layout.encode_layout(RECEIPT))
+
+    assert result.ocr_text == raw
+    assert "SUBTOTAL 11.00\nTOTAL 12.34" in fake_ollama.requests[0]["prompt"]
+    assert "Thank you" not in fake_ollama.requests[0]["prompt"]
+    assert "compact_tokens" in result.ocr_layout
@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+import app.services.extraction as extraction
+from app.services import ocr_pool
+
+
+class EnvReportingOCR:
+    """Stands in for PaddleOCR inside pool workers and reports worker state."""
+
+    def __init__(self, threads):
+        self.threads = threads
+
+    def ocr(self, image_path, cls):
+        cpus = ",".join(str(cpu) for cpu in sorted(os.sched_getaffinity(0)))
+        text = f"{image_path}|{os.environ['OMP_NUM_THREADS']}|{self.threads}|{cpus}|{cls}"
+        return [[(None, (text, 0.99))]]
+
+
+@pytest.fixture()
+def fake_worker_ocr(monkeypatch):
+    # Forked workers inherit the patched factory and settings, so no
+    # PaddleOCR is built and the fake paths are passed straight through.
+    monkeypatch.setattr(ocr_pool, "_build_worker_ocr", lambda threads, _tier: EnvReportingOCR(threads))
+    monkeypatch.setattr(ocr_pool.settings, "ocr_preprocess", False)
+
+
+def test_pool_runs_ocr_in_worker_processes(fake_worker_ocr):
+    pool = ocr_pool.OcrPool(workers=2, threads_per_worker=3, start_method="fork")
+    try:
+        futures = [pool.submit(f"img-{i}.png") for i in range(4)]
+        results = [future.result(timeout=30) for future in futures]
+    finally:
+        pool.shutdown()
+
+    for i, (result, timings, tier) in enumerate(results):
+        path, omp, threads, _cpus, cls = result[0][0][1][0].split("|")
+        assert path == f"img-{i}.png"
+        assert omp == "3"
+        assert threads == "3"
+        assert cls == "True"
+        assert "ocr_ms" in timings
+        assert tier == "fast"
+
+
+def test_pool_pins_each_worker_to_one_cpu(fake_worker_ocr):
+    pool = ocr_pool.OcrPool(workers=1, pin_cpus=True, start_method="fork")
+    try:
+        text = pool.ocr("img.png")[0][0][0][1][0]
+    finally:
+        pool.shutdown()
+    cpus = text.split("|")[3].split(",")
+    assert len(cpus) == 1
+
+
+def test_init_worker_sets_thread_limits_and_affinity(monkeypatch, fake_worker_ocr):
+    for name in ocr_pool.THREAD_ENV_VARS:
+        monkeypatch.setenv(name, "99")
+    pinned = []
+    monkeypatch.setattr(ocr_pool.os, "sched_getaffinity", lambda _pid: {0, 1})
+    monkeypatch.setattr(ocr_pool.os, "sched_setaffinity", lambda _pid, cpus: pinned.append(cpus))
+    monkeypatch.setattr(ocr_pool, "_worker_ocrs", {})
+
+    class Counter:
+        value = 3
+
+        def get_lock(self):
+            import contextlib
+
+            return contextlib.nullcontext()
+
+    counter = Counter()
+    ocr_pool._init_worker(counter, threads=2, pin_cpus=True)
+
+    assert all(os.environ[name] == "2" for name in ocr_pool.THREAD_ENV_VARS)
+    assert pinned == [{1}]
+    assert counter.value == 4
+    assert ocr_pool._run_in_worker("x.png")[0][0][0][1][0].startswith("x.png|2|2|")
+
+
+def test_build_worker_ocr_uses_thread_limit(monkeypatch):
+    built = {}
+
+    class FakeOCR:
+        def __init__(self, **kwargs):
+            built.update(kwargs)
+
+    monkeypatch.setattr(extraction, "_paddleocr_class", lambda: FakeOCR)
+    ocr_pool._build_worker_ocr(4, "fast")
+    assert built["cpu_threads"] == 4
+    assert built["use_angle_cls"] is True
+
+
+def test_get_ocr_pool_disabled_by_default():
+    assert ocr_pool.get_ocr_pool() is None
+
+
+def test_get_ocr_pool_is_shared_and_shut_down(monkeypatch):
+    created = []
+
+    class FakePool:
+        def __init__(self, workers, threads_per_worker, pin_cpus):
+            created.append((workers, threads_per_worker, pin_cpus))
+            self.closed = False
+
+        def shutdown(self):
+            self.closed = True
+
+    monkeypatch.setattr(ocr_pool, "OcrPool", FakePool)
+    monkeypatch.setattr(ocr_pool, "_pool", None)
+    monkeypatch.setattr(ocr_pool.settings, "ocr_workers", 2)
+    monkeypatch.setattr(ocr_pool.settings, "ocr_worker_threads", 1)
+
+    pool = ocr_pool.get_ocr_pool()
+    assert ocr_pool.get_ocr_pool() is pool
+    assert created == [(2, 1, False)]
+
+    ocr_pool.shutdown_ocr_pool()
+    assert pool.closed
+    assert ocr_pool._pool is None
+    ocr_pool.shutdown_ocr_pool()
+
+
+def test_run_ocr_uses_pool_when_configured(monkeypatch):
+    class FakePool:
+        def ocr(self, image_path, _tier_mode=None):
+            return [[(None, (f"pooled {image_path}", 0.9))], None], {"ocr_ms": 1.0}, "fast"
+
+    monkeypatch.setattr(extraction, "get_ocr_pool", lambda: FakePool())
+    timings = {}
+    assert extraction.run_ocr("a.png", timings=timings) == "pooled a.png"
+    assert timings["ocr_ms"] == 1.0
+    assert set(timings) == {"ocr_ms"}
+
+
+def test_init_worker_without_pinning_keeps_affinity(monkeypatch, fake_worker_ocr):
+    for name in ocr_pool.THREAD_ENV_VARS:
+        monkeypatch.setenv(name, "99")
+    monkeypatch.setattr(ocr_pool.os, "sched_setaffinity", lambda *_args: pytest.fail("should not pin"))
+    monkeypatch.setattr(ocr_pool, "_worker_ocrs", {})
+    ocr_pool._init_worker(None, threads=1, pin_cpus=False)
+    assert os.environ["OMP_NUM_THREADS"] == "1"
+    assert isinstance(ocr_pool._worker_ocrs["fast"], EnvReportingOCR)
@@ -0,0 +1,187 @@
+import io
+
+import cv2
+import httpx
+import numpy as np
+import pytest
+
+import app.services.extraction as extraction
+
+
+BOX_A = [[0, 0], [40, 0], [40, 10], [0, 10]]
+BOX_B = [[0, 20], [40, 20], [40, 30], [0, 30]]
+CONFIDENT = [[BOX_B, ("VISA", 0.9)], [BOX_B, ("1234", 0.95)], [BOX_B, ("HST", 0.9)]]
+
+
+class TierOCR:
+    """Fake PaddleOCR per tier: returns `pages` for full reads, a fixed read for crops.
+
+    Like PaddleOCR's recogniser, crops must have three channels.
+    """
+
+    def __init__(self, tier, pages=None, crop_score=0.95):
+        self.tier = tier
+        self.pages = pages
+        self.crop_score = crop_score
+        self.calls = []
+
+    def ocr(self, source, cls=True, det=True):
+        self.calls.append({"det": det, "cls": cls})
+        if not det:
+            assert all(crop.ndim == 3 and crop.shape[2] == 3 for crop in source[0])
+            return [[(f"{self.tier}-crop{index}", self.crop_score) for index, _crop in enumerate(source[0])]]
+        return self.pages
+
+
+@pytest.fixture()
+def tiers(monkeypatch):
+    monkeypatch.setattr(extraction.settings, "ocr_tier_mode", "tiered")
+    models = {"fast": TierOCR("fast"), "accurate": TierOCR("accurate", pages=[[[BOX_A, ("ACCURATE", 0.99)]]])}
+    return models
+
+
+def _run(models, source=None):
+    timings = {}
+    source = np.full((40, 60), 255, dtype=np.uint8) if source is None else source
+    result, tier = extraction._tiered_ocr(models.__getitem__, source, False, timings)
+    return result, tier, timings
+
+
+def test_confident_fast_read_stays_on_fast_tier(tiers):
+    tiers["fast"].pages = [[[BOX_A, ("TOTAL 1.00", 0.97)], [BOX_B, ("VISA", 0.9)]]]
+    result, tier, timings = _run(tiers)
+    assert tier == "fast"
+    assert result is tiers["fast"].pages
+    assert tiers["accurate"].calls == []
+    assert "ocr_accurate_ms" not in timings
+
+
+def test_low_confidence_lines_are_re_recognised(tiers):
+    tiers["fast"].pages = [[[BOX_A, ("T0TAL 1.00", 0.5)], *CONFIDENT]]
+    result, tier, timings = _run(tiers)
+    assert tier == "mixed"
+    assert [entry[1][0] for entry in result[0]] == ["accurate-crop0", "VISA", "1234", "HST"]
+    assert result[0][0][0] == BOX_A
+    assert tiers["accurate"].calls == [{"det": False, "cls": False}]
+    assert "ocr_accurate_ms" in timings
+
+
+def test_re_recognition_keeps_better_fast_read(tiers, tmp_path):
+    path = tmp_path / "photo.png"
+    cv2.imwrite(str(path), np.full((40, 60, 3), 255, dtype=np.uint8))
+    tiers["accurate"].crop_score = 0.1
+    tiers["fast"].pages = [[[BOX_A, ("T0TAL", 0.5)], *CONFIDENT]]
+    result, tier, _timings = _run(tiers, source=str(path))
+    assert tier == "mixed"
+    assert result[0][0][1] == ("T0TAL", 0.5)
+
+
+@pytest.mark.parametrize(
+    "pages",
+    [
+        [None],
+        [[[BOX_A, ("??", 0.2)], [BOX_B, ("VISA", 0.9)]]],
+    ],
+)
+def test_empty_or_mostly_weak_reads_rerun_whole_image(tiers, pages):
+    tiers["fast"].pages = pages
+    result, tier, timings = _run(tiers)
+    assert tier == "accurate"
+    assert result == [[[BOX_A, ("ACCURATE", 0.99)]]]
+    assert {"ocr_ms", "ocr_accurate_ms"} <= set(timings)
+
+
+def test_weak_lines_without_boxes_are_kept(tiers, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "ocr_tier_max_low_fraction", 1.0)
+    tiers["fast"].pages = [[[None, ("??", 0.2)]]]
+    _result, tier, _timings = _run(tiers)
+    assert tier == "fast"
+
+
+def test_single_tier_modes(tiers, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "ocr_tier_mode", "accurate")
+    result, tier, _timings = _run(tiers)
+    assert tier == "accurate"
+    assert tiers["fast"].calls == []
+    assert extraction.first_ocr_tier() == "accurate"
+
+
+def test_tier_model_configuration(monkeypatch):
+    built = []
+
+    class FakeOCR:
+        def __init__(self, **kwargs):
+            built.append(kwargs)
+
+    monkeypatch.setattr(extraction, "_paddleocr_class", lambda: FakeOCR)
+    monkeypatch.setattr(extraction, "_ocr_instances", {})
+    monkeypatch.setattr(extraction.settings, "ocr_fast_rec_model_dir", "/models/fast_rec")
+    monkeypatch.setattr(extraction.settings, "ocr_accurate_det_model_dir", "/models/server_det")
+
+    assert extraction._get_ocr("fast") is extraction._get_ocr("fast")
+    extraction._get_ocr("accurate")
+    assert built[0]["rec_model_dir"] == "/models/fast_rec"
+    assert "det_model_dir" not in built[0]
+    assert built[1]["det_model_dir"] == "/models/server_det"
+    assert built[1]["det_limit_side_len"] == extraction.settings.ocr_accurate_det_limit_side_len
+    with pytest.raises(ValueError):
+        extraction._build_ocr(tier="huge")
+
+
+def test_cache_tag_covers_tier_settings(monkeypatch):
+    base = extraction._ocr_config_tag()
+    monkeypatch.setattr(extraction.settings, "ocr_tier_mode", "accurate")
+    accurate = extraction._ocr_config_tag()
+    monkeypatch.setattr(extraction.settings, "ocr_tier_mode", "tiered")
+    tiered = extraction._ocr_config_tag()
+    monkeypatch.setattr(extraction.settings, "ocr_tier_min_score", 0.5)
+    tags = {base, accurate, tiered, extraction._ocr_config_tag()}
+    # Other model directories read differently, even at the same PaddleOCR version.
+    monkeypatch.setattr(extraction.settings, "ocr_accurate_rec_model_dir", "/models/server_rec")
+    tags.add(extraction._ocr_config_tag())
+    monkeypatch.setattr(extraction.settings, "ocr_tier_mode", "fast")
+    monkeypatch.setattr(extraction.settings, "ocr_fast_det_model_dir", "/models/v4_det")
+    tags.add(extraction._ocr_config_tag())
+    monkeypatch.setattr(extraction.settings, "ocr_model_dir", "/models/bundle")
+    tags.add(extraction._ocr_config_tag())
+    assert len(tags) == 7
+
+
+@pytest.mark.asyncio
+async def test_extraction_records_ocr_tier(app, monkeypatch, tmp_path):
+    def fake_run_ocr(_path, timings, details, **_kwargs):
+        details["ocr_tier"] = "mixed"
+        return "Store\nTotal 2.00"
+
+    monkeypatch.setattr(extraction, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(extraction, "run_llm", lambda _text, _currency, **_kwargs: ({"vendor_name": "S"}, "m"))
+    monkeypatch.setattr(extraction.settings, "storage_dir", str(tmp_path))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        reg = await client.post("/api/v1/auth/register", json={"email": "tier@example.com", "password": "ChangeMe123!"})
+        headers = {"Authorization": f"Bearer {reg.json()['access_token']}"}
+        files = {"file": ("r.jpg", io.BytesIO(b"tier photo"), "image/jpeg")}
+        created = await client.post("/api/v1/receipts/extractions", headers=headers, files=files)
+        fetched = await client.get(f"/api/v1/receipts/extractions/{created.json()['extraction_id']}", headers=headers)
+
+    assert created.json()["ocr_tier"] == "mixed"
+    assert fetched.json()["ocr_tier"] == "mixed"
+
+
+def test_offline_model_bundle(monkeypatch, tmp_path):
+    for name in ("det", "rec", "cls"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "inference.pdmodel").write_bytes(b"")
+    monkeypatch.setattr(extraction.settings, "ocr_model_dir", str(tmp_path))
+    monkeypatch.setattr(extraction.settings, "ocr_accurate_rec_model_dir", "/models/server_rec")
+
+    fast = extraction._tier_kwargs("fast")
+    accurate = extraction._tier_kwargs("accurate")
+    assert (fast["det_model_dir"], fast["rec_model_dir"]) == (str(tmp_path / "det"), str(tmp_path / "rec"))
+    assert accurate["rec_model_dir"] == "/models/server_rec"
+    assert accurate["cls_model_dir"] == str(tmp_path / "cls")
+
+    (tmp_path / "cls" / "inference.pdmodel").unlink()
+    with pytest.raises(RuntimeError, match="no cls model"):
+        extraction._tier_kwargs("fast")
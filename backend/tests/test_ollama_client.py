@@ -0,0 +1,178 @@
+import pytest
+import requests
+
+import app.services.extraction as extraction
+from app.services import ollama
+from app.services.ollama import JsonObjectTracker, OllamaClient
+
+
+def test_json_tracker_finds_end_of_first_object_across_pieces():
+    tracker = JsonObjectTracker()
+    assert tracker.feed('Sure! {"a": "br') is None
+    assert tracker.feed('ace } in \\" string", "b": {"c": 1}') is None
+    assert tracker.feed("} trailing {") == 1
+    assert tracker.consumed == len('Sure! {"a": "brace } in \\" string", "b": {"c": 1}') + 1
+
+
+def test_json_tracker_ignores_quotes_and_braces_before_object():
+    tracker = JsonObjectTracker()
+    assert tracker.feed('"quoted" } ') is None
+    assert tracker.feed("{}") == 2
+
+
+def test_streaming_stops_after_complete_json(fake_ollama):
+    fake_ollama.response_text = '{"vendor_name": "A {b}", "total": 1.5}'
+    fake_ollama.tail = "\nHere is some explanation that we do not want to wait for." * 20
+    client = OllamaClient(fake_ollama.url, timeout=10)
+
+    response = client.generate("m", "prompt", options={"num_ctx": 2048}, keep_alive="10m")
+
+    assert response.text == fake_ollama.response_text
+    assert response.stopped_early is True
+    assert response.prompt_tokens is None
+    assert response.completion_tokens is None
+    assert fake_ollama.hung_up.wait(5)
+    sent = fake_ollama.requests[0]
+    assert sent["stream"] is True
+    assert sent["keep_alive"] == "10m"
+    assert sent["options"] == {"num_ctx": 2048}
+
+
+def test_streaming_hangs_up_when_more_text_follows_the_object(fake_ollama):
+    fake_ollama.response_text = '{"a": 1}'
+    fake_ollama.tail = " and then some" * 50
+    fake_ollama.chunk_size = 8
+
+    response = OllamaClient(fake_ollama.url, timeout=10).generate("m", "p")
+
+    assert response.text == '{"a": 1}'
+    assert response.stopped_early is True
+    assert response.completion_tokens is None
+    assert fake_ollama.hung_up.wait(5)
+
+
+def test_streaming_reads_the_final_counts_when_the_model_stops_after_the_object(fake_ollama):
+    fake_ollama.response_text = '{"vendor_name": "A {b}", "total": 1.5}'
+
+    response = OllamaClient(fake_ollama.url, timeout=10).generate("m", "abcdefgh")
+
+    assert response.text == fake_ollama.response_text
+    assert response.stopped_early is False
+    assert response.prompt_tokens == 2
+    assert response.completion_tokens == len(fake_ollama.response_text)
+
+
+def test_streaming_reads_to_done_without_json_stop(fake_ollama):
+    fake_ollama.response_text = '{"a": 1} and more'
+    client = OllamaClient(fake_ollama.url, timeout=10)
+
+    response = client.generate("m", "abcdefgh", stop_after_json=False)
+
+    assert response.text == '{"a": 1} and more'
+    assert response.stopped_early is False
+    assert response.prompt_tokens == 2
+    assert response.completion_tokens == len(response.text)
+    assert "options" not in fake_ollama.requests[0]
+    assert "keep_alive" not in fake_ollama.requests[0]
+
+
+def test_streaming_to_done_when_json_never_closes(fake_ollama):
+    fake_ollama.response_text = '{"a": 1'
+    response = OllamaClient(fake_ollama.url, timeout=10).generate("m", "p")
+    assert response.text == '{"a": 1'
+    assert response.stopped_early is False
+
+
+def test_non_streaming_reports_token_counts(fake_ollama):
+    fake_ollama.response_text = '{"a": 1}'
+    response = OllamaClient(fake_ollama.url, timeout=10).generate("m", "abcd", stream=False)
+    assert response.text == '{"a": 1}'
+    assert response.prompt_tokens == 1
+    assert response.completion_tokens == 8
+
+
+def test_connections_are_reused(fake_ollama):
+    fake_ollama.response_text = '{"a": 1}'
+    client = OllamaClient(fake_ollama.url, timeout=10)
+    for _ in range(3):
+        client.generate("m", "p", stream=False)
+    assert len(fake_ollama.connections) == 1
+    client.close()
+
+
+def test_http_errors_raise(fake_ollama):
+    fake_ollama.status = 503
+    client = OllamaClient(fake_ollama.url, timeout=10)
+    with pytest.raises(requests.HTTPError):
+        client.generate("m", "p")
+    with pytest.raises(requests.HTTPError):
+        client.generate("m", "p", stream=False)
+
+
+def test_stream_error_chunk_raises(monkeypatch):
+    class FakeStream:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *_args):
+            return False
+
+        def raise_for_status(self):
+            return None
+
+        def iter_lines(self):
+            yield b""
+            yield b'{"error": "model not found"}'
+
+    client = OllamaClient("http://ollama", timeout=1)
+    monkeypatch.setattr(client.session, "post", lambda *_args, **_kwargs: FakeStream())
+    with pytest.raises(requests.HTTPError, match="model not found"):
+        client.generate("m", "p")
+
+
+def test_get_ollama_client_is_shared_and_follows_settings(monkeypatch):
+    monkeypatch.setattr(ollama, "_client", None)
+    monkeypatch.setattr(ollama.settings, "ollama_url", "http://one:11434/")
+    client = ollama.get_ollama_client()
+    assert [backend.url for backend in client.backends] == ["http://one:11434"]
+    assert ollama.get_ollama_client() is client
+
+    monkeypatch.setattr(ollama.settings, "ollama_url", "http://two:11434")
+    assert ollama.get_ollama_client() is not client
+
+
+def test_run_llm_sends_generation_settings(monkeypatch, fake_ollama):
+    fake_ollama.response_text = '{"total": 2}'
+    monkeypatch.setattr(extraction.settings, "ollama_num_ctx", 4096)
+    monkeypatch.setattr(extraction.settings, "ollama_num_predict", 256)
+    monkeypatch.setattr(extraction.settings, "ollama_keep_alive", "1h")
+
+    assert extraction.run_llm("Total 2", currency=None)[0] == {"total": 2}
+    sent = fake_ollama.requests[0]
+    assert sent["options"] == {"num_ctx": 4096, "num_predict": 256}
+    assert sent["keep_alive"] == "1h"
+
+
+def test_run_llm_treats_empty_response_as_empty_object(monkeypatch, fake_ollama):
+    fake_ollama.response_text = ""
+    monkeypatch.setattr(extraction.settings, "ollama_stream", False)
+    assert extraction.run_llm("nothing", currency=None)[0] == {}
+
+
+def test_stream_ending_without_done_returns_partial_text(monkeypatch):
+    class FakeStream:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *_args):
+            return False
+
+        def raise_for_status(self):
+            return None
+
+        def iter_lines(self):
+            yield b'{"response": "{\\"a\\"", "done": false}'
+
+    client = OllamaClient("http://ollama", timeout=1)
+    monkeypatch.setattr(client.session, "post", lambda *_args, **_kwargs: FakeStream())
+    assert client.generate("m", "p").text == '{"a"'
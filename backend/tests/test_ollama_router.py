@@ -0,0 +1,146 @@
+import socket
+
+import pytest
+import requests
+
+from app.services import metrics, ollama, warmup
+from app.services.ollama import OllamaBackend, OllamaRouter, is_backend_failure, parse_backends
+
+
+def _router(*urls: str, weights: tuple[float, ...] = (), **kwargs) -> OllamaRouter:
+    weights = weights or (1,) * len(urls)
+    return OllamaRouter([OllamaBackend(url, weight, 5, 2) for url, weight in zip(urls, weights)], **kwargs)
+
+
+def _closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_parse_backends():
+    assert parse_backends("http://a:11434=2, http://b:11434/,,") == [("http://a:11434", 2.0), ("http://b:11434", 1.0)]
+    for weight in ("0", "-1", "inf", "nan", "heavy"):
+        with pytest.raises(ValueError, match="positive number"):
+            parse_backends(f"http://a:11434=2,http://b:11434={weight}")
+
+
+def test_is_backend_failure():
+    assert is_backend_failure(requests.ConnectionError())
+    assert is_backend_failure(requests.HTTPError("no response"))
+    assert not is_backend_failure(RuntimeError("bug"))
+
+
+def test_least_outstanding_per_weight():
+    router = _router("http://a", "http://b", weights=(2, 1))
+    a, b = router.backends
+    picks = [router._acquire(set()) for _ in range(3)]
+    # Ties on load go by weighted share of requests served so far.
+    assert picks == [a, b, a]
+    assert (a.outstanding, b.outstanding) == (2, 1)
+    assert router._acquire({a, b}) is None
+
+
+def test_idle_backends_share_sequential_calls_by_weight(make_fake_ollama):
+    heavy, light = make_fake_ollama(), make_fake_ollama()
+    router = _router(heavy.url, light.url, weights=(2, 1))
+    for _ in range(6):
+        router.generate("m", "p", stream=False)
+    assert (len(heavy.requests), len(light.requests)) == (4, 2)
+    assert router.stats()[light.url] == {"weight": 1, "outstanding": 0, "served": 2, "failures": 0, "healthy": True}
+    scraped = metrics.render()[0].decode()
+    assert f'receipt_ollama_request_seconds_count{{backend="{heavy.url}",outcome="ok"}}' in scraped
+    router.close()
+
+
+def test_failing_backend_fails_over_and_is_taken_out_of_rotation(make_fake_ollama):
+    down = _closed_port_url()
+    up = make_fake_ollama()
+    up.response_text = '{"total": 1}'
+    router = _router(down, up.url, unhealthy_after=2, unhealthy_seconds=60)
+
+    for _ in range(4):
+        assert router.generate("m", "p").text == '{"total": 1}'
+
+    stats = router.stats()
+    assert stats[down]["failures"] == 2
+    assert stats[down]["healthy"] is False
+    # After the second failure the dead backend is no longer tried first.
+    assert stats[down]["served"] == 2
+    assert len(up.requests) == 4
+
+
+def test_router_tries_cooling_down_backend_when_nothing_else_is_left(make_fake_ollama):
+    server = make_fake_ollama()
+    router = _router(server.url, unhealthy_after=1, unhealthy_seconds=60)
+    server.status = 503
+    with pytest.raises(requests.HTTPError):
+        router.generate("m", "p", stream=False)
+    assert router.stats()[server.url]["healthy"] is False
+
+    server.status = 200
+    router.generate("m", "p", stream=False)
+    # A success puts it straight back in rotation.
+    assert router.stats()[server.url] == {"weight": 1, "outstanding": 0, "served": 2, "failures": 0, "healthy": True}
+
+
+def test_request_errors_are_not_retried_elsewhere(make_fake_ollama):
+    first, second = make_fake_ollama(), make_fake_ollama()
+    first.status = second.status = 400
+    router = _router(first.url, second.url, unhealthy_after=1)
+    with pytest.raises(requests.HTTPError):
+        router.generate("m", "p", stream=False)
+    assert len(first.requests) + len(second.requests) == 1
+    assert all(stats["healthy"] for stats in router.stats().values())
+
+
+def test_slow_call_is_hedged_to_a_second_backend(make_fake_ollama):
+    slow, fast = make_fake_ollama(), make_fake_ollama()
+    text = '{"notes": "' + "x" * 400 + '"}'
+    slow.response_text = fast.response_text = text
+    # One character per line: the slow backend is still streaming when the hedge answers.
+    slow.chunk_size, fast.chunk_size = 1, 1000
+    router = _router(slow.url, fast.url, hedge_after=0.1)
+    hedges = metrics.OLLAMA_HEDGES._value.get()
+    seen = []
+
+    response = router.generate("m", "p", on_text=seen.append)
+
+    assert response.text == text
+    assert metrics.OLLAMA_HEDGES._value.get() == hedges + 1
+    assert len(slow.requests) == len(fast.requests) == 1
+    # Only the primary reports progress, and the loser is hung up on.
+    assert seen and all(text.startswith(partial) for partial in seen)
+    assert slow.hung_up.wait(5)
+    router.close()
+
+
+def test_hedging_returns_the_first_error_when_every_backend_fails(make_fake_ollama):
+    slow = make_fake_ollama()
+    slow.delay, slow.status = 0.3, 503
+    router = _router(_closed_port_url(), slow.url, hedge_after=0.1)
+    # The primary already failed over to the slow backend, so there is nothing left to hedge to.
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            router.generate("m", "p", stream=False)
+    router.close()
+
+    fast = make_fake_ollama()
+    fast.status = 400
+    router = _router(fast.url, slow.url, hedge_after=5)
+    with pytest.raises(requests.HTTPError):
+        router.generate("m", "p", stream=False)
+    router.close()
+
+
+def test_settings_build_one_backend_per_url_and_warm_up_all(monkeypatch, make_fake_ollama):
+    first, second = make_fake_ollama(), make_fake_ollama()
+    monkeypatch.setattr(ollama, "_client", None)
+    monkeypatch.setattr(ollama.settings, "ollama_urls", f"{first.url}=3,{second.url}")
+    monkeypatch.setattr(ollama.settings, "ollama_hedge_after_seconds", 2.5)
+    router = ollama.get_ollama_client()
+    assert [(backend.url, backend.weight) for backend in router.backends] == [(first.url, 3.0), (second.url, 1.0)]
+    assert router.hedge_after == 2.5
+
+    warmup.warm_llm()
+    assert len(first.requests) == len(second.requests) == 1
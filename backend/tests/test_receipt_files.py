@@ -0,0 +1,158 @@
+import io
+import threading
+import time
+
+import httpx
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.api.routes.receipts import upload_receipt_file
+from app.models.user import User
+from app.services import extraction, metrics, ocr_cache, ocr_prefetch
+
+
+BOX = [[0, 0], [80, 0], [80, 20], [0, 20]]
+
+
+@pytest.fixture()
+def ocr_calls(monkeypatch, tmp_path):
+    monkeypatch.setattr(extraction.settings, "storage_dir", str(tmp_path))
+    monkeypatch.setattr(extraction.settings, "ocr_cache_dir", None)
+    monkeypatch.setattr(ocr_cache, "_cache", None)
+    calls = []
+
+    def fake_ocr_raw(image_path, _timings, _tier_mode=None):
+        calls.append(image_path)
+        return [[[BOX, ("CORNER STORE", 0.99)], [[[0, 40], [80, 40], [80, 60], [0, 60]], ("TOTAL 5.00", 0.99)]]], "fast"
+
+    monkeypatch.setattr(extraction, "_ocr_raw", fake_ocr_raw)
+    yield calls
+    ocr_prefetch.shutdown_ocr_prefetch()
+
+
+async def _register(client: httpx.AsyncClient) -> dict[str, str]:
+    reg = await client.post("/api/v1/auth/register", json={"email": "files@example.com", "password": "ChangeMe123!"})
+    return {"Authorization": f"Bearer {reg.json()['access_token']}"}
+
+
+@pytest.mark.asyncio
+async def test_uploaded_file_is_ocrd_once_and_extracted_by_id(app, ocr_calls, fake_ollama, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    fake_ollama.response_text = '{"vendor_name": "Corner Store", "total": 5.0}'
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        headers = await _register(client)
+        files = {"file": ("r.jpg", io.BytesIO(b"prefetch photo"), "image/jpeg")}
+        uploaded = await client.post("/api/v1/receipts/files", headers=headers, files=files)
+        assert uploaded.status_code == 201
+        assert uploaded.json()["ocr_started"] is True
+        assert uploaded.json()["size_bytes"] == len(b"prefetch photo")
+        # Wait for the background OCR to land in the cache.
+        ocr_prefetch.shutdown_ocr_prefetch()
+        assert len(ocr_calls) == 1
+
+        file_id = uploaded.json()["receipt_file_id"]
+
+        async def extract(currency: str) -> httpx.Response:
+            data = {"receipt_file_id": file_id, "currency": currency}
+            return await client.post("/api/v1/receipts/extractions", headers=headers, data=data)
+
+        first = await extract("USD")
+        assert first.status_code == 201
+        assert first.json()["receipt_file_id"] == file_id
+        assert first.json()["ocr_text"] == "CORNER STORE\nTOTAL 5.00"
+        assert first.json()["extracted"]["currency"] == "USD"
+
+        # Other options re-run the LLM on the same file; the same options reuse the result.
+        second = await extract("CAD")
+        again = await extract("USD")
+
+    assert second.json()["extracted"]["currency"] == "CAD"
+    assert again.json()["extraction_id"] != first.json()["extraction_id"]
+    assert again.json()["extracted"] == first.json()["extracted"]
+    assert len(fake_ollama.requests) == 2
+    assert len(ocr_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_extraction_needs_exactly_one_known_source(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        headers = await _register(client)
+        neither = await client.post("/api/v1/receipts/extractions", headers=headers, data={"currency": "CAD"})
+        both = await client.post(
+            "/api/v1/receipts/extractions",
+            headers=headers,
+            data={"receipt_file_id": "00000000-0000-0000-0000-000000000000"},
+            files={"file": ("r.jpg", io.BytesIO(b"x"), "image/jpeg")},
+        )
+        unknown = await client.post(
+            "/api/v1/receipts/extractions",
+            headers=headers,
+            data={"receipt_file_id": "00000000-0000-0000-0000-000000000000"},
+        )
+
+    assert neither.status_code == both.status_code == 400
+    assert unknown.status_code == 404
+
+
+def test_upload_without_filename_returns_400(db_session):
+    user = User(email="x@example.com", password_hash="x")
+    with pytest.raises(Exception) as exc:
+        upload_receipt_file(file=UploadFile(filename="", file=io.BytesIO(b"x")), db=db_session, current_user=user)
+    assert "File name missing" in str(exc.value)
+
+
+def test_prefetch_is_skipped_or_fails_quietly(ocr_calls, monkeypatch, caplog):
+    monkeypatch.setattr(ocr_prefetch.settings, "extraction_async", True)
+    assert ocr_prefetch.prefetch_ocr("r.jpg", "a" * 64) is False
+    monkeypatch.setattr(ocr_prefetch.settings, "extraction_async", False)
+
+    skipped = metrics.OCR_PREFETCH.labels(outcome="skipped")._value.get()
+    monkeypatch.setattr(ocr_prefetch.settings, "ocr_prefetch_max_pending", 0)
+    assert ocr_prefetch.prefetch_ocr("r.jpg", "a" * 64) is False
+    assert metrics.OCR_PREFETCH.labels(outcome="skipped")._value.get() == skipped + 1
+    monkeypatch.setattr(ocr_prefetch.settings, "ocr_prefetch_max_pending", 16)
+
+    def failing(*_args, **_kwargs):
+        raise RuntimeError("unreadable image")
+
+    monkeypatch.setattr(extraction, "run_ocr_lines", failing)
+    failed = metrics.OCR_PREFETCH.labels(outcome="failed")._value.get()
+    assert ocr_prefetch.prefetch_ocr("r.jpg", "a" * 64) is True
+    assert ocr_prefetch.prefetch_ocr("r.jpg", "a" * 64) is True
+    ocr_prefetch.shutdown_ocr_prefetch()
+    # The second file may be dropped at shutdown instead of failing, but it is not left pending.
+    assert metrics.OCR_PREFETCH.labels(outcome="failed")._value.get() >= failed + 1
+    assert "Background OCR of r.jpg failed" in caplog.text
+    assert ocr_prefetch._pending == 0
+
+
+def test_concurrent_ocr_of_one_image_runs_once(ocr_calls, monkeypatch):
+    release = threading.Event()
+    plain = extraction._ocr_raw
+
+    def slow_ocr_raw(image_path, timings, tier_mode=None):
+        release.wait(5)
+        return plain(image_path, timings, tier_mode)
+
+    monkeypatch.setattr(extraction, "_ocr_raw", slow_ocr_raw)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(extraction.run_ocr_lines("r.jpg", sha256="b" * 64)))
+        for _ in range(2)
+    ]
+    threads[0].start()
+    while not extraction._ocr_inflight._calls:
+        time.sleep(0.01)
+    threads[1].start()
+    while not any(call.waiters for call in extraction._ocr_inflight._calls.values()):
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(ocr_calls) == 1
+    assert results[0] == results[1]
+    assert results[0][0].text == "CORNER STORE"
@@ -0,0 +1,162 @@
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import worker
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+from app.models.user import User
+from app.services import recovery
+from app.services.extraction import ExtractionResult
+
+
+def _result(ocr_text: str) -> ExtractionResult:
+    return ExtractionResult(
+        ocr_text=ocr_text,
+        extracted={"vendor_name": "Recovered Store", "total": 9.99},
+        model_name="fake-model",
+    )
+
+
+@pytest.fixture()
+def user(db_session) -> User:
+    user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture()
+def stale(db_session, user, tmp_path, monkeypatch):
+    monkeypatch.setattr(recovery.settings, "extraction_async", False)
+    monkeypatch.setattr(recovery.settings, "extraction_lease_seconds", 60)
+    monkeypatch.setattr(recovery.settings, "recovery_parallelism", 1)
+
+    def make(status=ExtractionStatus.processing, age_seconds=600, attempts=1, raw_ocr_text=None):
+        path = tmp_path / f"{uuid.uuid4()}.jpg"
+        path.write_bytes(b"img")
+        receipt_file = ReceiptFile(
+            user_id=user.id,
+            file_path=str(path),
+            file_name="r.jpg",
+            mime_type="image/jpeg",
+            size_bytes=3,
+            sha256=uuid.uuid4().hex,
+        )
+        db_session.add(receipt_file)
+        db_session.flush()
+        started = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+        extraction = ReceiptExtraction(
+            user_id=user.id,
+            receipt_file_id=receipt_file.id,
+            status=status,
+            model_name="m",
+            attempts=attempts,
+            raw_ocr_text=raw_ocr_text,
+            ocr_tier="fast" if raw_ocr_text else None,
+            claimed_at=started if status == ExtractionStatus.processing else None,
+            created_at=started,
+        )
+        db_session.add(extraction)
+        db_session.commit()
+        # The sweep closes the session it is given, detaching loaded rows; tests reload by id.
+        return extraction.id
+
+    return make
+
+
+def _sweep(db_session) -> int:
+    return recovery.recover_stale_extractions(session_factory=lambda: db_session)
+
+
+def _reload(db_session):
+    return lambda extraction_id: db_session.get(ReceiptExtraction, extraction_id)
+
+
+def test_sweep_reruns_abandoned_extractions_from_saved_ocr_text(db_session, stale, monkeypatch):
+    def fake_from_text(ocr_text, _currency, ocr_tier, **_kwargs):
+        assert ocr_tier == "fast"
+        return _result(ocr_text)
+
+    monkeypatch.setattr("app.services.extraction.extract_from_ocr_text", fake_from_text)
+    monkeypatch.setattr("app.services.extraction.extract_receipt", lambda path, _currency, **_kwargs: _result("fresh"))
+    crashed_after_ocr = stale(raw_ocr_text="Saved OCR text")
+    never_started = stale(status=ExtractionStatus.pending, attempts=0)
+    running = stale(age_seconds=5)
+
+    assert _sweep(db_session) == 2
+
+    crashed_after_ocr, never_started, running = map(_reload(db_session), (crashed_after_ocr, never_started, running))
+    assert crashed_after_ocr.status == ExtractionStatus.completed
+    assert crashed_after_ocr.raw_ocr_text == "Saved OCR text"
+    assert crashed_after_ocr.attempts == 2
+    assert crashed_after_ocr.last_error == "Lease expired during attempt 1"
+    assert never_started.status == ExtractionStatus.completed
+    assert never_started.raw_ocr_text == "fresh"
+    assert (never_started.attempts, never_started.last_error) == (1, None)
+    # Still within its lease: some process is working on it.
+    assert running.status == ExtractionStatus.processing
+    assert running.attempts == 1
+    assert _sweep(db_session) == 0
+
+
+def test_sweep_gives_up_after_max_attempts_and_records_errors(db_session, stale, monkeypatch):
+    def failing(*_args, **_kwargs):
+        raise RuntimeError("ollama down")
+
+    monkeypatch.setattr(recovery.settings, "extraction_max_attempts", 2)
+    monkeypatch.setattr("app.services.extraction.extract_receipt", failing)
+    exhausted = stale(attempts=2)
+    retried = stale(attempts=1)
+
+    assert _sweep(db_session) == 1
+
+    exhausted, retried = map(_reload(db_session), (exhausted, retried))
+    assert exhausted.status == ExtractionStatus.failed
+    assert exhausted.last_error == "Lease expired after 2 attempt(s); giving up"
+    assert exhausted.completed_at is not None
+    assert retried.status == ExtractionStatus.failed
+    assert retried.last_error == "RuntimeError: ollama down"
+    assert retried.attempts == 2
+
+
+def test_async_sweep_requeues_for_workers(db_session, stale, monkeypatch, fake_ollama):
+    monkeypatch.setattr(recovery.settings, "extraction_async", True)
+    monkeypatch.setattr(recovery.settings, "rules_enabled", False)
+    monkeypatch.setattr("app.services.extraction.extract_receipt", lambda path, _currency, **_kwargs: _result("fresh"))
+    fake_ollama.response_text = '{"vendor_name": "Recovered Store", "total": 9.99}'
+    crashed = stale(raw_ocr_text="Saved OCR text", age_seconds=900)
+    # The workers' queue, not abandoned work.
+    queued = stale(status=ExtractionStatus.pending, attempts=0)
+    reload = _reload(db_session)
+
+    assert _sweep(db_session) == 1
+
+    assert reload(crashed).status == ExtractionStatus.pending
+    assert reload(crashed).claimed_at is None
+    assert reload(queued).status == ExtractionStatus.pending
+
+    assert worker.process_next(db_session) is True
+    row = reload(crashed)
+    assert row.status == ExtractionStatus.completed
+    assert row.attempts == 2
+    assert (row.raw_ocr_text, row.ocr_tier) == ("Saved OCR text", "fast")
+    # Only the LLM step was redone.
+    assert "Saved OCR text" in fake_ollama.requests[0]["prompt"]
+
+
+def test_run_recovery_survives_a_failing_sweep(monkeypatch, caplog):
+    stop = threading.Event()
+
+    def failing_sweep(_session_factory):
+        stop.set()
+        raise RuntimeError("db unavailable")
+
+    monkeypatch.setattr(recovery, "recover_stale_extractions", failing_sweep)
+    recovery.run_recovery(stop, session_factory=lambda: None)
+    assert "Recovery sweep failed" in caplog.text
+
+    recovery.start_recovery(stop).join(timeout=5)
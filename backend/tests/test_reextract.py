@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app import cli
+from app.models.enums import ExtractionStatus
+from app.models.receipt import Receipt
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+from app.models.user import User
+from app.services import extraction, reextract
+
+
+@pytest.fixture()
+def user(db_session) -> User:
+    user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _file(db_session, user, name: str) -> ReceiptFile:
+    receipt_file = ReceiptFile(
+        user_id=user.id, file_path=f"/tmp/{name}", file_name=name, mime_type="image/jpeg", size_bytes=1, sha256=name
+    )
+    db_session.add(receipt_file)
+    db_session.commit()
+    return receipt_file
+
+
+@pytest.fixture()
+def extracted(monkeypatch):
+    calls = []
+
+    def fake_extract(path, currency, **_kwargs):
+        calls.append((path, currency))
+        if path.endswith("broken.jpg"):
+            raise RuntimeError("unreadable image")
+        return extraction.ExtractionResult(ocr_text="NEW", extracted={"vendor_name": "New Model"}, model_name="new")
+
+    monkeypatch.setattr(extraction, "extract_receipt", fake_extract)
+    return calls
+
+
+def _run(db_session, tmp_path, **kwargs) -> reextract.ReextractStats:
+    return reextract.reextract_files(
+        tmp_path / "checkpoint.json", session_factory=lambda: db_session, parallelism=1, **kwargs
+    )
+
+
+def test_reextract_adds_extractions_and_resumes_from_the_checkpoint(db_session, user, extracted, tmp_path):
+    files = [_file(db_session, user, name) for name in ("a.jpg", "b.jpg", "c.jpg", "d.jpg")]
+    old = ReceiptExtraction(
+        user_id=user.id,
+        receipt_file_id=files[0].id,
+        status=ExtractionStatus.completed,
+        model_name="old",
+        currency="USD",
+        extracted_json={"vendor_name": "Old Model"},
+    )
+    db_session.add(old)
+    db_session.commit()
+    receipt = Receipt(user_id=user.id, vendor_name="Confirmed", currency="USD", source_extraction_id=old.id)
+    db_session.add(receipt)
+    db_session.commit()
+    # Files made in one transaction share created_at; the id breaks the tie.
+    ordered = sorted(receipt_file.id for receipt_file in files)
+    old_id, receipt_id = old.id, receipt.id
+
+    first = _run(db_session, tmp_path, limit=3)
+    saved = json.loads((tmp_path / "checkpoint.json").read_text())
+    second = _run(db_session, tmp_path)
+    third = _run(db_session, tmp_path)
+
+    assert (first.done, second.done, third.done) == (3, 1, 0)
+    assert saved["after"][1] == str(ordered[2])
+    assert json.loads((tmp_path / "checkpoint.json").read_text())["done"] == 4
+    assert sorted(path for path, _currency in extracted) == ["/tmp/a.jpg", "/tmp/b.jpg", "/tmp/c.jpg", "/tmp/d.jpg"]
+    # The currency given with the file's last extraction is kept; the earlier result is not reused.
+    assert ("/tmp/a.jpg", "USD") in extracted
+    new = db_session.query(ReceiptExtraction).filter(ReceiptExtraction.model_name == "new").all()
+    assert len(new) == 4
+    assert {row.status for row in new} == {ExtractionStatus.completed}
+    receipt = db_session.get(Receipt, receipt_id)
+    assert receipt.vendor_name == "Confirmed"
+    assert receipt.source_extraction_id == old_id
+
+
+def test_failed_files_are_counted_and_passed(db_session, user, extracted, tmp_path, caplog):
+    broken_id, user_id = _file(db_session, user, "broken.jpg").id, user.id
+    other_user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db_session.add(other_user)
+    db_session.commit()
+    _file(db_session, other_user, "other.jpg")
+
+    stats = _run(db_session, tmp_path, user_id=user_id)
+
+    assert (stats.done, stats.failed) == (0, 1)
+    assert extracted == [("/tmp/broken.jpg", None)]
+    assert f"Re-extraction of file {broken_id} failed" in caplog.text
+    row = db_session.query(ReceiptExtraction).filter_by(receipt_file_id=broken_id).one()
+    assert row.status == ExtractionStatus.failed
+    assert _run(db_session, tmp_path, user_id=user_id).failed == 0
+
+
+def test_stop_event_starts_nothing(db_session, user, extracted, tmp_path):
+    _file(db_session, user, "a.jpg")
+    stop = threading.Event()
+    stop.set()
+    assert _run(db_session, tmp_path, stop_event=stop) == reextract.ReextractStats()
+    assert extracted == []
+    assert not (tmp_path / "checkpoint.json").exists()
+
+
+def test_checkpoint_only_moves_past_files_finished_in_order(tmp_path):
+    path = tmp_path / "nested" / "checkpoint.json"
+    checkpoint = reextract.Checkpoint(path)
+    positions = [(datetime(2026, 1, 1, tzinfo=timezone.utc), uuid.uuid4()) for _ in range(3)]
+    for position in positions:
+        checkpoint.start(position)
+
+    checkpoint.finish(positions[1], ok=False)
+    assert checkpoint.after is None
+    assert reextract.Checkpoint(path).failed == 1
+    checkpoint.finish(positions[0], ok=True)
+    assert checkpoint.after == positions[1]
+
+    resumed = reextract.Checkpoint(path)
+    assert resumed.after == positions[1]
+    assert (resumed.done, resumed.failed) == (1, 1)
+
+
+def test_rate_limiter_spaces_out_calls():
+    stop = threading.Event()
+    unlimited = reextract.RateLimiter(0)
+    limited = reextract.RateLimiter(20)
+    started = time.monotonic()
+    for _ in range(3):
+        unlimited.wait(stop)
+    assert time.monotonic() - started < 0.04
+    for _ in range(3):
+        limited.wait(stop)
+    assert time.monotonic() - started >= 0.09
+
+
+def test_cli_parses_reextract_args_and_installs_signal_handlers(monkeypatch, tmp_path):
+    calls = {}
+    handlers = {}
+    user_id = uuid.uuid4()
+
+    def fake_reextract_files(checkpoint_path, stop_event, **kwargs):
+        calls.update(kwargs, checkpoint_path=checkpoint_path)
+        handlers[cli.signal.SIGINT]()
+        assert stop_event.is_set()
+        return reextract.ReextractStats(done=2, failed=calls.pop("failed", 0))
+
+    monkeypatch.setattr(cli, "reextract_files", fake_reextract_files)
+    monkeypatch.setattr(cli.signal, "signal", lambda signum, handler: handlers.__setitem__(signum, handler))
+    argv = ["reextract", "--checkpoint", str(tmp_path / "c.json"), "--parallelism", "4", "--rate", "2.5"]
+    assert cli.main([*argv, "--user-id", str(user_id), "--limit", "10"]) == 0
+    assert calls == {
+        "checkpoint_path": tmp_path / "c.json",
+        "parallelism": 4,
+        "rate": 2.5,
+        "batch_size": 100,
+        "user_id": user_id,
+        "limit": 10,
+    }
+    calls["failed"] = 1
+    assert cli.main(["reextract"]) == 1
@@ -0,0 +1,197 @@
+import pytest
+
+from app.services import extraction, metrics, rules
+
+
+RECEIPT = """COSTCO WHOLESALE #123
+2024/03/05 14:22
+SUBTOTAL 10.00
+HST 13% 1.30
+TOTAL
+11.30
+VISA ************1234
+AUTH CODE: 012345
+REF # 000123
+INVOICE 98765
+"""
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(rules, "rules_stats", rules.RulesStats())
+
+
+def test_extracts_fixed_format_fields():
+    found = rules.extract_fields(RECEIPT)
+    assert found.fields == {
+        "total": 11.3,
+        "subtotal": 10.0,
+        "tax": 1.3,
+        "purchased_at": "2024-03-05T14:22:00",
+        "card_last4": "1234",
+        "auth_number": "012345",
+        "ref_number": "000123",
+        "invoice_number": "98765",
+    }
+    # subtotal + tax == total, so all three amounts are trusted.
+    assert found.confidence["total"] == found.confidence["tax"] == 0.99
+
+
+def test_sums_separate_tax_lines_and_picks_consistent_total():
+    text = "GST 0.50\nPST 0.70\nTOTAL DUE 99.00\nTotal (incl. HST) 11.20\nSub-total 10.00\nTotal savings 5.00"
+    found = rules.extract_fields(text)
+    assert (found.fields["subtotal"], found.fields["tax"], found.fields["total"]) == (10.0, 1.2, 11.2)
+    assert found.confidence["total"] == 0.99
+
+
+def test_total_tax_line_wins_over_individual_taxes():
+    found = rules.extract_fields("Subtotal 1,000.00\nGST 50.00\nTotal tax 130.00\nTotal 1,130.00")
+    assert found.fields["tax"] == 130.0
+    assert found.fields["total"] == 1130.0
+
+
+@pytest.mark.parametrize(
+    ("text", "confidence"),
+    [
+        ("Subtotal 10.00\nTax 1.00\nTotal 12.00", 0.5),
+        ("Subtotal 10.00\nTotal 10.00", 0.95),
+        ("Subtotal 10.00\nTotal 12.00", 0.6),
+        ("Total 9.99", 0.8),
+        ("Total 9.99\nAmount due 8.00", 0.6),
+    ],
+)
+def test_amount_confidence(text, confidence):
+    assert rules.extract_fields(text).confidence["total"] == confidence
+
+
+def test_amounts_without_total_are_not_confident():
+    found = rules.extract_fields("Subtotal 10.00\nHST\nsee below\nTotal")
+    assert "total" not in found.fields
+    assert found.confidence["subtotal"] == 0.6
+    assert "tax" not in found.fields
+
+
+@pytest.mark.parametrize(
+    ("line", "expected", "confidence"),
+    [
+        ("Date: 12 Mar 2024", "2024-03-12T00:00:00", 0.95),
+        ("March 5, 2024 9:05 AM", "2024-03-05T09:05:00", 0.95),
+        ("Dec 1 2023 12:10:30 am", "2023-12-01T00:10:30", 0.95),
+        ("25/12/2023 7:30 p.m.", "2023-12-25T19:30:00", 0.9),
+        ("12/25/23", "2023-12-25T00:00:00", 0.9),
+        ("03/04/2024 12:00 PM", "2024-03-04T12:00:00", 0.6),
+        ("2024-02-30 then 2024-03-01 99:99", "2024-03-01T00:00:00", 0.95),
+    ],
+)
+def test_dates(line, expected, confidence):
+    found = rules.extract_fields(line)
+    assert found.fields["purchased_at"] == expected
+    assert found.confidence["purchased_at"] == confidence
+
+
+def test_ignores_lines_without_ids():
+    found = rules.extract_fields("APPROVED\nREFUND\nNo date 13/13/2024\nXX")
+    assert found.fields == {}
+
+
+def test_score_fields():
+    found = rules.extract_fields("Total 9.99\n03/04/2024")
+    extracted = {
+        "vendor_name": "Store",
+        "total": 9.99,
+        "purchased_at": "2024-05-04T00:00:00",
+        "currency": "CAD",
+        "notes": None,
+    }
+    # vendor only from the LLM (0.7), total agrees with rules (0.9), date disagrees (0.5).
+    assert rules.score_fields(extracted, found) == 0.7
+    assert rules.score_fields({"total": "n/a"}, found) == 0.5
+    assert rules.score_fields({}, found) == 0.0
+    assert rules.score_fields({"card_last4": " 1234"}, rules.extract_fields(RECEIPT)) == 0.95
+
+
+def test_required_fields_setting(monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.rules_required_fields", " total, ,purchased_at")
+    assert rules.required_fields() == ["total", "purchased_at"]
+
+
+def test_extract_receipt_skips_llm_when_rules_suffice(monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.rules_skip_llm", True)
+    monkeypatch.setattr(extraction, "run_ocr", lambda _path, **_kwargs: RECEIPT)
+    monkeypatch.setattr(extraction, "run_llm", lambda *_args, **_kwargs: pytest.fail("LLM called"))
+    skipped = metrics.RULES_EXTRACTIONS.labels(llm="skipped")._value.get()
+
+    result = extraction.extract_receipt("dummy.png", "CAD")
+    assert result.model_name == extraction.RULES_MODEL_NAME
+    assert result.extracted["total"] == 11.3
+    assert result.extracted["currency"] == "CAD"
+    assert result.confidence == 0.95
+    assert "llm_ms" not in result.timings
+    assert rules.rules_stats.stats()["llm_avoided_rate"] == 1.0
+    assert metrics.RULES_EXTRACTIONS.labels(llm="skipped")._value.get() == skipped + 1
+
+
+def test_extract_receipt_asks_llm_only_for_remaining_fields(monkeypatch):
+    seen = {}
+
+    def fake_run_llm(_text, _currency, fields=None, **_kwargs):
+        seen["fields"] = fields
+        return {"vendor_name": "Costco", "total": 99.0, "category": "food"}, "m"
+
+    monkeypatch.setattr(extraction, "run_ocr", lambda _path, **_kwargs: RECEIPT)
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+
+    result = extraction.extract_receipt("dummy.png", None)
+    assert "total" not in seen["fields"]
+    assert "vendor_name" in seen["fields"]
+    # Confident rule values override the LLM.
+    assert result.extracted["total"] == 11.3
+    assert result.extracted["vendor_name"] == "Costco"
+    assert rules.rules_stats.stats() == {
+        "extractions": 1,
+        "llm_skipped": 0,
+        "llm_partial": 1,
+        "llm_full": 0,
+        "llm_avoided_rate": 0.0,
+        "llm_reduced_rate": 1.0,
+    }
+
+
+def test_default_settings_ask_the_llm_only_for_what_rules_cannot_read(monkeypatch):
+    seen = {}
+
+    def fake_run_llm(_text, _currency, fields=None, **_kwargs):
+        seen["fields"] = fields
+        return {"vendor_name": "Costco", "category": "food"}, "m"
+
+    monkeypatch.setattr(extraction, "run_ocr", lambda _path, **_kwargs: RECEIPT)
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+    partial = metrics.RULES_EXTRACTIONS.labels(llm="partial")._value.get()
+
+    result = extraction.extract_receipt("dummy.png", None)
+
+    # Rules settle the default required fields, and the LLM still reads the vendor.
+    assert set(rules.required_fields()) <= set(rules.extract_fields(RECEIPT).confident(0.9))
+    assert {"purchased_at", "total"}.isdisjoint(seen["fields"])
+    assert result.extracted["vendor_name"] == "Costco"
+    assert result.extracted["total"] == 11.3
+    assert rules.rules_stats.stats()["llm_reduced_rate"] == 1.0
+    assert metrics.RULES_EXTRACTIONS.labels(llm="partial")._value.get() == partial + 1
+
+
+def test_extract_receipt_without_rules(monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.rules_enabled", False)
+    monkeypatch.setattr(extraction, "run_ocr", lambda _path, **_kwargs: RECEIPT)
+    monkeypatch.setattr(extraction, "run_llm", lambda _text, _currency, **_kwargs: ({"total": 1.0}, "m"))
+
+    result = extraction.extract_receipt("dummy.png", None)
+    assert result.extracted == {"total": 1.0}
+    assert result.confidence is None
+    assert "rules_ms" not in result.timings
+    assert rules.rules_stats.stats()["extractions"] == 0
+
+
+def test_partial_prompt_lists_only_requested_fields():
+    prompt = extraction._build_prompt("text", "USD", ["vendor_name", "category"])
+    assert "Return only: vendor_name, category\n" in prompt
+    assert "payment_type" not in prompt
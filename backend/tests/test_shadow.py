@@ -0,0 +1,255 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app import cli
+from app.models.enums import ExtractionStatus, ReceiptCategory, ReceiptStatus
+from app.models.receipt import Receipt
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+from app.models.shadow_extraction import ShadowExtraction
+from app.models.user import User
+from app.services import extraction, metrics, ocr_cache, shadow
+
+
+@pytest.fixture()
+def user(db_session) -> User:
+    user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture()
+def primary(db_session, user) -> ReceiptExtraction:
+    receipt_file = ReceiptFile(
+        user_id=user.id, file_path="/tmp/r.jpg", file_name="r.jpg", mime_type="image/jpeg", size_bytes=1, sha256="x"
+    )
+    db_session.add(receipt_file)
+    db_session.commit()
+    row = ReceiptExtraction(
+        user_id=user.id,
+        receipt_file_id=receipt_file.id,
+        status=ExtractionStatus.completed,
+        model_name="llama3.1",
+        raw_ocr_text="CORNER STORE\nTOTAL 12.50",
+        extracted_json={"vendor_name": "Corner Store", "total": 12.0, "currency": "CAD"},
+        timings={"ocr_ms": 100.0, "llm_ms": 1000.0, "repair_ms": 100.0},
+        prompt_tokens=500,
+        completion_tokens=50,
+    )
+    db_session.add(row)
+    db_session.commit()
+    return row
+
+
+@pytest.fixture()
+def candidate(monkeypatch):
+    monkeypatch.setattr(shadow.settings, "shadow_model", "candidate")
+    monkeypatch.setattr(shadow.settings, "shadow_sample_rate", 1.0)
+    yield
+    shadow.shutdown_shadow()
+
+
+def _only_shadow(db_session, extraction_id) -> ShadowExtraction:
+    return db_session.query(ShadowExtraction).filter_by(extraction_id=extraction_id).one()
+
+
+def test_field_agreement_ignores_case_spacing_and_time_of_day():
+    expected = {"vendor_name": "Corner  Store", "total": 12.3, "purchased_at": "2024-03-05T14:22:00", "notes": "a"}
+    actual = {
+        "vendor_name": "corner store",
+        "total": 12.30,
+        "purchased_at": datetime(2024, 3, 5, 9, 0),
+        "category": ReceiptCategory.gas,
+        "tax": "",
+        "notes": "b",
+    }
+    assert shadow.field_agreement(expected, actual) == {
+        "vendor_name": True,
+        "purchased_at": True,
+        "category": False,
+        "total": True,
+    }
+
+
+def test_sampling_queues_off_the_request_path(candidate, monkeypatch, caplog):
+    row = ReceiptExtraction(id=uuid.uuid4())
+    ran = []
+
+    def fake_run_shadow(extraction_id):
+        ran.append(extraction_id)
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(shadow, "run_shadow", fake_run_shadow)
+    monkeypatch.setattr(shadow.random, "random", lambda: 0.5)
+    monkeypatch.setattr(shadow.settings, "shadow_sample_rate", 0.5)
+    assert shadow.maybe_shadow(row) is False
+    monkeypatch.setattr(shadow.settings, "shadow_sample_rate", 1.0)
+
+    skipped = metrics.SHADOW_RUNS.labels(outcome="skipped")._value.get()
+    monkeypatch.setattr(shadow.settings, "shadow_max_pending", 0)
+    assert shadow.maybe_shadow(row) is False
+    assert metrics.SHADOW_RUNS.labels(outcome="skipped")._value.get() == skipped + 1
+    monkeypatch.setattr(shadow.settings, "shadow_max_pending", 16)
+
+    assert shadow.maybe_shadow(row) is True
+    assert shadow.maybe_shadow(row) is True
+    shadow.shutdown_shadow()
+    # The second sample may be dropped at shutdown, but it is not left pending.
+    assert ran[0] == row.id
+    assert f"Shadow run of extraction {row.id} could not be stored" in caplog.text
+    assert shadow._pending == 0
+
+    monkeypatch.setattr(shadow.settings, "shadow_model", None)
+    assert shadow.maybe_shadow(row) is False
+
+
+def test_candidate_model_reads_the_primary_ocr_text(db_session, primary, candidate, fake_ollama, monkeypatch):
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    monkeypatch.setattr(extraction.settings, "ollama_stream", False)
+    fake_ollama.response_text = '{"vendor_name": "CORNER STORE", "total": 12.5}'
+    done = metrics.SHADOW_RUNS.labels(outcome="done")._value.get()
+    extraction_id = primary.id
+
+    shadow.run_shadow(extraction_id, session_factory=lambda: db_session)
+
+    assert fake_ollama.requests[0]["model"] == "candidate"
+    assert "CORNER STORE\nTOTAL 12.50" in fake_ollama.requests[0]["prompt"]
+    row = _only_shadow(db_session, extraction_id)
+    assert row.status == ExtractionStatus.completed
+    assert (row.candidate_model, row.candidate_ocr_tier_mode, row.model_name) == ("candidate", None, "candidate")
+    assert row.agreement == {"vendor_name": True, "total": False, "currency": False}
+    assert "llm_ms" in row.timings
+    assert row.prompt_tokens > 0
+    assert metrics.SHADOW_RUNS.labels(outcome="done")._value.get() == done + 1
+    # The primary result is left as it was.
+    assert db_session.get(ReceiptExtraction, extraction_id).model_name == "llama3.1"
+
+
+def test_candidate_ocr_tier_reruns_ocr(db_session, primary, candidate, monkeypatch, tmp_path):
+    monkeypatch.setattr(shadow.settings, "shadow_model", None)
+    monkeypatch.setattr(shadow.settings, "shadow_ocr_tier_mode", "accurate")
+    monkeypatch.setattr(extraction.settings, "storage_dir", str(tmp_path))
+    monkeypatch.setattr(extraction.settings, "ocr_cache_dir", None)
+    monkeypatch.setattr(ocr_cache, "_cache", None)
+    seen = {}
+
+    def fake_ocr_raw(image_path, timings, tier_mode=None):
+        seen["ocr"] = (image_path, tier_mode)
+        timings["ocr_ms"] = 300.0
+        return [[[[[0, 0], [80, 0], [80, 20], [0, 20]], ("CORNER STORE", 0.99)]]], tier_mode
+
+    def fake_run_llm(_text, _currency, model=None, **_kwargs):
+        seen["model"] = model
+        return {"vendor_name": "Corner Store"}, "llama3.1"
+
+    monkeypatch.setattr(extraction, "_ocr_raw", fake_ocr_raw)
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+    extraction_id = primary.id
+
+    shadow.run_shadow(extraction_id, session_factory=lambda: db_session)
+
+    assert seen == {"ocr": ("/tmp/r.jpg", "accurate"), "model": None}
+    row = _only_shadow(db_session, extraction_id)
+    assert row.candidate_ocr_tier_mode == "accurate"
+    assert row.timings["ocr_ms"] == 300.0
+    assert extraction._ocr_config_tag("accurate") != extraction._ocr_config_tag()
+
+
+def test_failed_candidate_is_recorded(db_session, primary, candidate, monkeypatch):
+    def failing(*_args, **_kwargs):
+        raise RuntimeError("model not found")
+
+    monkeypatch.setattr(extraction, "extract_from_ocr_text", failing)
+    extraction_id = primary.id
+
+    shadow.run_shadow(extraction_id, session_factory=lambda: db_session)
+
+    row = _only_shadow(db_session, extraction_id)
+    assert row.status == ExtractionStatus.failed
+    assert row.last_error == "RuntimeError: model not found"
+    assert row.extracted_json is None
+
+
+def _shadow_row(db_session, extraction, status=ExtractionStatus.completed, ocr_tier_mode=None, **fields):
+    row = ShadowExtraction(
+        extraction_id=extraction.id,
+        user_id=extraction.user_id,
+        candidate_model=None if ocr_tier_mode else "candidate",
+        candidate_ocr_tier_mode=ocr_tier_mode,
+        status=status,
+        **fields,
+    )
+    db_session.add(row)
+    db_session.commit()
+    return row
+
+
+def test_report_compares_latency_tokens_and_accuracy(db_session, user, primary, monkeypatch, capsys):
+    _shadow_row(
+        db_session,
+        primary,
+        model_name="candidate",
+        extracted_json={"vendor_name": "Corner Store", "total": 12.5, "currency": "CAD"},
+        agreement={"vendor_name": True, "total": False, "currency": True},
+        timings={"llm_ms": 600.0},
+        prompt_tokens=300,
+        completion_tokens=40,
+    )
+    _shadow_row(db_session, primary, status=ExtractionStatus.failed, last_error="boom")
+    # Not confirmed yet: counts for latency and agreement, not accuracy.
+    unconfirmed = ReceiptExtraction(
+        user_id=user.id, receipt_file_id=primary.receipt_file_id, status=ExtractionStatus.completed, model_name="m"
+    )
+    db_session.add(unconfirmed)
+    db_session.commit()
+    _shadow_row(
+        db_session, unconfirmed, ocr_tier_mode="accurate", extracted_json={}, agreement={}, timings={"ocr_ms": 250.0}
+    )
+    db_session.add(
+        Receipt(
+            user_id=user.id,
+            vendor_name="Corner Store",
+            total=12.5,
+            currency="CAD",
+            status=ReceiptStatus.confirmed,
+            source_extraction_id=primary.id,
+        )
+    )
+    db_session.commit()
+
+    reports = {report.candidate_model: report for report in shadow.shadow_report(db_session)}
+
+    model = reports["candidate"]
+    assert (model.runs, model.failed, model.confirmed) == (2, 1, 1)
+    assert model.primary.llm_ms == [1100.0]
+    assert model.shadow.llm_ms == [600.0]
+    assert model.shadow.ocr_ms == []
+    assert model.primary.correct == {"vendor_name": [True], "total": [False], "currency": [True]}
+    assert model.shadow.correct == {"vendor_name": [True], "total": [True], "currency": [True]}
+    assert reports[None].shadow.ocr_ms == [250.0]
+    assert reports[None].confirmed == 0
+
+    lines = shadow.format_report([model])
+    assert lines[0] == "candidate model=candidate ocr=-: 2 run(s), 1 failed, 1 with a confirmed receipt"
+    assert lines[1] == "  ocr        p50 100.0ms->n/a p95 100.0ms->n/a"
+    assert lines[2] == "  llm        p50 1100.0ms->600.0ms p95 1100.0ms->600.0ms"
+    assert lines[3] == "  tokens     prompt 500.0->300.0 completion 50.0->40.0 (mean)"
+    assert lines[4] == "  fields     66.7% agree with the primary, 66.7%->100.0% match the confirmed receipt"
+    assert "    total           agree 0.0% correct 0.0%->100.0%" in lines
+    assert shadow.format_report([])[0].startswith("No shadow runs yet")
+    assert shadow.shadow_report(db_session, since=datetime(2999, 1, 1, tzinfo=timezone.utc)) == []
+    assert shadow.format_report([shadow.CandidateReport("m", None, runs=1, failed=1)])[3] == (
+        "  tokens     prompt n/a->n/a completion n/a->n/a (mean)"
+    )
+
+    monkeypatch.setattr(cli, "SessionLocal", lambda: db_session)
+    assert cli.main(["shadow-report", "--since", "2000-01-01"]) == 0
+    assert "candidate model=- ocr=accurate: 1 run(s)" in capsys.readouterr().out
+
+
+def test_percentile_interpolates():
+    assert shadow.percentile([1.0], 95) == 1.0
+    assert shadow.percentile([0.0, 10.0, 20.0], 95) == pytest.approx(19.0)
@@ -0,0 +1,220 @@
+import uuid
+
+import pytest
+
+from app.crud.receipt import create_receipt, update_receipt
+from app.crud.vendor_profile import load_vendor_profiles
+from app.models.enums import ExtractionStatus
+from app.models.receipt_extraction import ReceiptExtraction
+from app.models.receipt_file import ReceiptFile
+from app.models.user import User
+from app.models.vendor_profile import VendorProfile
+from app.services import extraction, extraction_jobs, metrics, rules
+from app.services.vendor_profiles import (
+    VendorMatch,
+    VendorProfiles,
+    add_counts,
+    normalize_vendor,
+    usual_fields,
+)
+
+
+RECEIPT = """COSTCO WHOLESALE #123
+2024/03/05 14:22
+SUBTOTAL 10.00
+HST 13% 1.30
+TOTAL
+11.30
+"""
+
+COSTCO = {"category": "gas", "location": "Kanata", "currency": "CAD", "card_type": "visa", "card_last4": "1234"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(rules, "rules_stats", rules.RulesStats())
+
+
+@pytest.fixture()
+def user(db_session) -> User:
+    user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture()
+def receipt_file(db_session, user) -> ReceiptFile:
+    receipt_file = ReceiptFile(
+        user_id=user.id, file_path="/tmp/r.jpg", file_name="r.jpg", mime_type="image/jpeg", size_bytes=1, sha256="x"
+    )
+    db_session.add(receipt_file)
+    db_session.commit()
+    return receipt_file
+
+
+def _profile(db_session, user) -> VendorProfile | None:
+    return db_session.query(VendorProfile).filter_by(user_id=user.id, vendor_key="costco wholesale").one_or_none()
+
+
+def test_normalize_vendor_ignores_store_numbers_and_suffixes():
+    assert normalize_vendor("COSTCO WHOLESALE #123") == "costco wholesale"
+    assert normalize_vendor("Tim Hortons Store 0042, Inc.") == "tim hortons"
+    assert normalize_vendor("A&W No. 7") == "a&w"
+    assert normalize_vendor("#12 --") == ""
+
+
+def test_counts_and_usual_fields():
+    stats = add_counts({}, {"category": "gas", "card_last4": "1234"}, 1)
+    stats = add_counts(stats, {"category": "gas", "card_last4": "9999"}, 1)
+    assert usual_fields(stats, 2, min_share=0.8) == {"category": "gas"}
+    assert add_counts(stats, {"category": "gas", "card_last4": "9999"}, -1) == {
+        "category": {"gas": 1},
+        "card_last4": {"1234": 1},
+    }
+    assert usual_fields({}, 0, min_share=0.8) == {}
+
+
+def test_match_prefers_longest_known_name_in_header():
+    shell = VendorMatch("Shell", {})
+    shell_canada = VendorMatch("Shell Canada", {"category": "gas"})
+    profiles = VendorProfiles({"shell": shell, "shell canada": shell_canada})
+    assert profiles.match("Welcome\nSHELL CANADA #42 Ottawa\nTOTAL 5.00", header_lines=5) is shell_canada
+    assert profiles.match("Welcome\nTOTAL 5.00\nSHELL", header_lines=2) is None
+    assert VendorProfiles({}).match("SHELL", header_lines=5) is None
+
+
+def test_profiles_follow_confirmed_receipts(db_session, user):
+    data = {"vendor_name": "Costco Wholesale #123", **COSTCO}
+    first = create_receipt(db_session, user.id, data)
+    create_receipt(db_session, user.id, {**data, "vendor_name": "COSTCO WHOLESALE"})
+    create_receipt(db_session, user.id, {**data, "status": "draft"})
+    create_receipt(db_session, user.id, {**data, "vendor_name": "#1"})
+
+    profile = _profile(db_session, user)
+    assert profile.receipt_count == 2
+    assert profile.vendor_name == "COSTCO WHOLESALE"
+    assert profile.stats["category"] == {"gas": 2}
+
+    update_receipt(db_session, first, {"category": "food", "card_last4": None})
+    db_session.refresh(profile)
+    assert profile.stats["category"] == {"gas": 1, "food": 1}
+    assert profile.stats["card_last4"] == {"1234": 1}
+
+    profiles = load_vendor_profiles(db_session, user.id)
+    assert profiles.vendors["costco wholesale"].fields == {"location": "Kanata", "currency": "CAD", "card_type": "visa"}
+
+    # Renaming moves the receipt to another vendor; the last receipt leaving deletes the profile.
+    update_receipt(db_session, first, {"vendor_name": "Walmart"})
+    update_receipt(db_session, first, {"notes": "unchanged vendor fields"})
+    assert _profile(db_session, user).receipt_count == 1
+    assert len(load_vendor_profiles(db_session, user.id)) == 0
+    update_receipt(db_session, first, {"status": "draft"})
+    assert db_session.query(VendorProfile).filter_by(user_id=user.id, vendor_key="walmart").one_or_none() is None
+
+
+def test_known_vendor_fills_what_rules_leave_empty_when_they_skip_the_llm(monkeypatch):
+    monkeypatch.setattr(extraction.settings, "rules_skip_llm", True)
+    monkeypatch.setattr(extraction, "run_ocr", lambda _path, **_kwargs: RECEIPT)
+    monkeypatch.setattr(extraction, "run_llm", lambda *_args, **_kwargs: pytest.fail("LLM called"))
+    profiles = VendorProfiles({"costco wholesale": VendorMatch("Costco", dict(COSTCO, card_last4="0000"))})
+    hits = metrics.VENDOR_PROFILE_LOOKUPS.labels(outcome="hit")._value.get()
+
+    result = extraction.extract_receipt("r.jpg", "USD", vendor_profiles=profiles)
+
+    assert result.model_name == extraction.PROFILE_MODEL_NAME
+    assert result.extracted["vendor_name"] == "Costco"
+    assert result.extracted["category"] == "gas"
+    assert result.extracted["card_last4"] == "0000"
+    assert result.extracted["total"] == 11.3
+    # The upload's currency beats the vendor's usual one.
+    assert result.extracted["currency"] == "USD"
+    assert "profile_ms" in result.timings
+    assert metrics.VENDOR_PROFILE_LOOKUPS.labels(outcome="hit")._value.get() == hits + 1
+
+
+def test_known_vendor_never_counts_towards_skipping_the_llm(monkeypatch):
+    seen = {}
+
+    def fake_run_llm(_text, _currency, fields=None, **_kwargs):
+        seen["fields"] = fields
+        return {"category": "food"}, "m"
+
+    monkeypatch.setattr(extraction.settings, "rules_skip_llm", True)
+    monkeypatch.setattr(extraction.settings, "rules_required_fields", "purchased_at,total,category")
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+    profiles = VendorProfiles({"costco wholesale": VendorMatch("Costco", COSTCO)})
+
+    result = extraction.extract_from_ocr_text(RECEIPT, None, vendor_profiles=profiles)
+
+    assert "category" in seen["fields"]
+    assert "vendor_name" in seen["fields"]
+    assert result.extracted["category"] == "food"
+    assert result.model_name == "m"
+
+
+def test_known_vendor_hints_the_prompt_and_fills_what_the_llm_left_empty(monkeypatch):
+    seen = {}
+
+    def fake_run_llm(_text, _currency, fields=None, hints=None, **_kwargs):
+        seen.update(fields=fields, hints=hints)
+        return {"category": "food", "location": None, "total": 1.0, "purchased_at": "2024-03-05"}, "m"
+
+    monkeypatch.setattr(extraction.settings, "rules_enabled", False)
+    monkeypatch.setattr(extraction, "run_llm", fake_run_llm)
+    profiles = VendorProfiles({"costco wholesale": VendorMatch("Costco", COSTCO)})
+
+    result = extraction.extract_from_ocr_text(RECEIPT, None, vendor_profiles=profiles)
+
+    assert seen["fields"] is None
+    assert seen["hints"] == {"vendor_name": "Costco", **COSTCO}
+    # What the receipt says wins; the vendor's usual values only fill the gaps.
+    assert result.extracted["category"] == "food"
+    assert result.extracted["location"] == "Kanata"
+    assert result.extracted["vendor_name"] == "Costco"
+    assert result.model_name == "m"
+
+    misses = metrics.VENDOR_PROFILE_LOOKUPS.labels(outcome="miss")._value.get()
+    extraction.extract_from_ocr_text("UNKNOWN MART\nTOTAL 1.00", None, vendor_profiles=profiles)
+    assert seen["hints"] == {}
+    assert metrics.VENDOR_PROFILE_LOOKUPS.labels(outcome="miss")._value.get() == misses + 1
+
+
+def test_hints_go_into_the_prompt():
+    prompt = extraction._build_prompt("COSTCO", None, hints={"category": "gas", "location": "Kanata"})
+    assert "Usual for this vendor, unless the receipt says otherwise: category=gas, location=Kanata" in prompt
+    assert "Usual for this vendor" not in extraction._build_prompt("COSTCO", None)
+
+
+def test_jobs_load_the_users_profiles(db_session, user, receipt_file, monkeypatch):
+    for _ in range(2):
+        create_receipt(db_session, user.id, {"vendor_name": "Costco", **COSTCO})
+    seen = []
+
+    def fake_extract(_path, _currency, vendor_profiles=None, **_kwargs):
+        seen.append(vendor_profiles)
+        return extraction.ExtractionResult(ocr_text="COSTCO", extracted={"vendor_name": "Costco"}, model_name="m")
+
+    def fake_batch(items, vendor_profiles=None):
+        seen.append(vendor_profiles)
+        return [fake_extract(*item) for item in items]
+
+    monkeypatch.setattr(extraction_jobs.settings, "extraction_dedup", False)
+    monkeypatch.setattr(extraction, "extract_receipt", fake_extract)
+    monkeypatch.setattr(extraction, "extract_receipts_batch", fake_batch)
+
+    def claimed() -> ReceiptExtraction:
+        row = ReceiptExtraction(
+            user_id=user.id, receipt_file_id=receipt_file.id, status=ExtractionStatus.processing, model_name="m"
+        )
+        db_session.add(row)
+        db_session.commit()
+        return row
+
+    extraction_jobs.run_extraction(db_session, claimed())
+    extraction_jobs.run_extractions_batch(db_session, [claimed()])
+    monkeypatch.setattr(extraction.settings, "vendor_profiles_enabled", False)
+    extraction_jobs.run_extraction(db_session, claimed())
+
+    assert [profiles.vendors["costco"].fields["category"] for profiles in seen[:2]] == ["gas", "gas"]
+    assert seen[2] is None
@@ -0,0 +1,136 @@
+import threading
+
+import httpx
+import pytest
+
+import app.main as main
+from app.services import extraction, warmup
+
+
+def _client(app) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.fixture()
+def fresh_warmup(monkeypatch):
+    state = warmup.Warmup(steps={"ocr": lambda: None, "llm": lambda: None})
+    monkeypatch.setattr(warmup, "_warmup", state)
+    return state
+
+
+def test_failed_steps_are_retried_until_ready(monkeypatch):
+    attempts = []
+    stop = threading.Event()
+    statuses = []
+
+    def flaky_llm():
+        attempts.append("llm")
+        if len(attempts) == 1:
+            raise ConnectionError("ollama not up yet")
+
+    state = warmup.Warmup(steps={"ocr": lambda: None, "llm": flaky_llm})
+    monkeypatch.setattr(stop, "wait", lambda seconds: statuses.append((seconds, state.status())))
+    assert state.status() == {"ocr": "pending", "llm": "pending"}
+
+    state.run(stop)
+
+    assert attempts == ["llm", "llm"]
+    assert statuses == [(warmup.settings.warmup_retry_seconds, {"ocr": "ready", "llm": "failed"})]
+    assert state.ready
+
+
+def test_run_stops_when_asked():
+    stop = threading.Event()
+    stop.set()
+    state = warmup.Warmup(steps={"ocr": lambda: pytest.fail("ran after stop")})
+    state.start(stop).join(timeout=5)
+    assert not state.ready
+
+
+def test_get_warmup_is_a_singleton(monkeypatch):
+    monkeypatch.setattr(warmup, "_warmup", None)
+    assert warmup.get_warmup() is warmup.get_warmup()
+    assert set(warmup.get_warmup().steps) == {"ocr", "llm"}
+
+
+@pytest.mark.asyncio
+async def test_readiness_reports_warm_up(app, fresh_warmup, monkeypatch):
+    async with _client(app) as client:
+        warming = await client.get("/api/v1/health/ready")
+        fresh_warmup.run()
+        ready = await client.get("/api/v1/health/ready")
+        monkeypatch.setattr(warmup.settings, "warmup_enabled", False)
+        disabled = await client.get("/api/v1/health/ready")
+        monkeypatch.setattr(warmup.settings, "warmup_enabled", True)
+        monkeypatch.setattr(warmup.settings, "extraction_async", True)
+        api_only = await client.get("/api/v1/health/ready")
+
+    assert warming.status_code == 503
+    assert warming.json() == {"status": "warming_up", "components": {"ocr": "pending", "llm": "pending"}}
+    assert ready.status_code == 200
+    assert ready.json()["components"] == {"ocr": "ready", "llm": "ready"}
+    assert disabled.json() == api_only.json() == {"status": "ready", "components": {}}
+
+
+@pytest.mark.asyncio
+async def test_lifespan_starts_warm_up_and_stops_pool(fresh_warmup, monkeypatch):
+    started = []
+    monkeypatch.setattr(fresh_warmup, "start", lambda: started.append(True))
+    monkeypatch.setattr(main, "shutdown_ocr_pool", lambda: started.append("shutdown"))
+    monkeypatch.setattr(main, "start_recovery", started.append)
+    app = main.create_app()
+
+    async with app.router.lifespan_context(app):
+        assert started[0] is True
+        assert not started[1].is_set()
+    assert started[1].is_set()
+    monkeypatch.setattr(main.settings, "warmup_enabled", False)
+    monkeypatch.setattr(main.settings, "recovery_enabled", False)
+    async with app.router.lifespan_context(app):
+        pass
+    assert started[2:] == ["shutdown", "shutdown"]
+
+
+def test_warm_ocr_in_process(monkeypatch):
+    seen = []
+
+    class FakeOCR:
+        def ocr(self, image, cls):
+            seen.append((image.shape, cls))
+
+    monkeypatch.setattr(warmup.settings, "ocr_workers", 0)
+    monkeypatch.setattr(extraction, "_get_ocr", lambda tier: seen.append(tier) or FakeOCR())
+    warmup.warm_ocr()
+    assert seen == ["fast", ((96, 320, 3), warmup.settings.ocr_angle_cls)]
+
+
+def test_warm_ocr_runs_once_per_pool_worker(monkeypatch):
+    class FakeFuture:
+        def result(self):
+            return None
+
+    class FakePool:
+        workers = 3
+        paths = []
+
+        def submit(self, path):
+            self.paths.append(path)
+            with open(path, "rb") as handle:
+                assert handle.read(4) == b"\x89PNG"
+            return FakeFuture()
+
+    monkeypatch.setattr("app.services.ocr_pool.get_ocr_pool", lambda: FakePool())
+    warmup.warm_ocr()
+    assert len(FakePool.paths) == 3
+    assert len(set(FakePool.paths)) == 1
+
+
+def test_warm_llm_loads_model_with_system_prompt(fake_ollama):
+    warmup.warm_llm()
+    body = fake_ollama.requests[0]
+    assert body["prompt"] == ""
+    assert body["system"] == extraction.SYSTEM_PROMPT
+    assert body["keep_alive"] == warmup.settings.ollama_keep_alive
+    assert body["options"] == {"num_predict": 1}
+    assert body["stream"] is False